@@ -1,17 +1,29 @@
 from fastapi import FastAPI, Depends, HTTPException, Request, Form
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, PlainTextResponse
 from sqlalchemy import select, func, desc
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, timedelta
+from datetime import datetime
 import uvicorn
 import asyncio
 
-from database import get_db
-from models import User, Transaction, Withdrawal, SpinResult, Contest, ContestParticipant, ContestNumber
+from database import get_db, pool_stats
+from models import User, Transaction, Withdrawal, SpinResult, ContestParticipant, ContestNumber
 from utils import format_number
-from config import ADMIN_IDS
+from utils_cache import invalidate_user, user_cache
+from utils_subscription import subscription_stats
+from keyboards import keyboard_cache_stats
+from messages import template_cache_stats
+from sharding import update_shards
+from metrics import render, process_metrics
+from broadcast import start_broadcast, get_broadcast_progress, broadcast_watchdog
+from utils_contest import (
+    create_contest, get_active_contest, finish_contest, contest_cache, ContestError,
+    get_leaderboard_page, get_qualified_page, get_contest_counts, get_contest_rank,
+    leaderboard_cursor, parse_leaderboard_cursor
+)
+from config import ADMIN_IDS, BOT_MODE, BACKGROUND_IN_PROCESS, CONTEST_DURATION_DAYS, CONTEST_NUMBER_START, CONTEST_NUMBER_END, LEADERBOARD_PAGE_SIZE
 
 app = FastAPI(title="Telegram Bot Admin Panel")
 
@@ -29,6 +41,32 @@ async def ping():
     """Simple ping endpoint for health checks"""
     return {"status": "ok", "ping": "pong"}
 
+@app.get("/cache_stats")
+async def cache_stats():
+    """Kesh hit/miss hisoblagichlari"""
+    return {
+        "user_cache": user_cache.stats(),
+        "subscription_cache": subscription_stats(),
+        "keyboards": keyboard_cache_stats(),
+        "templates": template_cache_stats(),
+        "active_contest": contest_cache.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus metrikalari (shu jarayon uchun)"""
+    return PlainTextResponse(render(process_metrics()), media_type="text/plain; version=0.0.4")
+
+@app.get("/db_stats")
+async def db_stats():
+    """DB connection pool holati va checkout kutish vaqti"""
+    return pool_stats()
+
+@app.get("/shard_stats")
+async def shard_stats():
+    """Update shardlari navbat chuqurligi (bot shu jarayonda ishlaganda)"""
+    return update_shards.stats()
+
 @app.get("/", response_class=HTMLResponse)
 async def admin_dashboard(request: Request, db: AsyncSession = Depends(get_db)):
     """Admin panel asosiy sahifa"""
@@ -171,6 +209,7 @@ async def approve_withdrawal_api(withdrawal_id: int, db: AsyncSession = Depends(
         
         db.add(transaction)
         await db.commit()
+        invalidate_user(user.telegram_id)
         
         return {"status": "success", "message": "Withdrawal approved"}
         
@@ -209,6 +248,7 @@ async def reject_withdrawal_api(withdrawal_id: int, db: AsyncSession = Depends(g
         user.stars += withdrawal.amount
         
         await db.commit()
+        invalidate_user(user.telegram_id)
         
         return {"status": "success", "message": "Withdrawal rejected"}
         
@@ -239,18 +279,31 @@ async def users_page(request: Request, db: AsyncSession = Depends(get_db)):
         print(f"Users page error: {e}")
         raise HTTPException(status_code=500, detail="Server error")
 
+def page_cursors(rows, has_more, after, before, cursor):
+    """Keyset sahifaning oldingi va keyingi sahifa kursorlari (None - havola yo'q)"""
+    if not rows:
+        return None, None
+    has_prev = has_more if before is not None else after is not None
+    has_next = True if before is not None else has_more
+    return (
+        cursor(rows[0]) if has_prev else None,
+        cursor(rows[-1]) if has_next else None
+    )
+
 @app.get("/contest", response_class=HTMLResponse)
-async def contest_page(request: Request, db: AsyncSession = Depends(get_db)):
+async def contest_page(request: Request, after: str = None, before: str = None,
+                       numbers_after: int = None, numbers_before: int = None,
+                       db: AsyncSession = Depends(get_db)):
     """Konkurs sahifasi"""
+    try:
+        after = parse_leaderboard_cursor(after) if after else None
+        before = parse_leaderboard_cursor(before) if before else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
     try:
         # Faol konkursni topish
-        contest_result = await db.execute(
-            select(Contest).where(
-                Contest.is_active == True,
-                Contest.end_date > datetime.utcnow()
-            )
-        )
-        active_contest = contest_result.scalar_one_or_none()
+        active_contest = await get_active_contest(db)
         
         if not active_contest:
             return templates.TemplateResponse("admin.html", {
@@ -262,30 +315,23 @@ async def contest_page(request: Request, db: AsyncSession = Depends(get_db)):
                 "format_number": format_number
             })
         
-        # Barcha ishtirokchilar
-        participants_result = await db.execute(
-            select(ContestParticipant, User)
-            .join(User, ContestParticipant.user_id == User.telegram_id)
-            .where(ContestParticipant.contest_id == active_contest.id)
-            .order_by(desc(ContestParticipant.referrals_completed))
+        # Reyting sahifasi va raqam olganlar (keyset, indeks bo'yicha, faqat shu sahifa)
+        participants, more_participants = await get_leaderboard_page(db, active_contest.id, after, before)
+        qualified_participants, more_qualified = await get_qualified_page(
+            db, active_contest.id, numbers_after, numbers_before
         )
-        participants = participants_result.all()
-        
-        # Raqam olgan ishtirokchilar
-        qualified_result = await db.execute(
-            select(ContestParticipant, User)
-            .join(User, ContestParticipant.user_id == User.telegram_id)
-            .where(
-                ContestParticipant.contest_id == active_contest.id,
-                ContestParticipant.contest_number.isnot(None)
-            )
-            .order_by(ContestParticipant.contest_number)
+        leaderboard_prev, leaderboard_next = page_cursors(
+            participants, more_participants, after, before, lambda row: leaderboard_cursor(row[1])
+        )
+        qualified_prev, qualified_next = page_cursors(
+            qualified_participants, more_qualified, numbers_after, numbers_before,
+            lambda row: row[0].contest_number
         )
-        qualified_participants = qualified_result.all()
         
-        # Konkurs statistikasi
-        total_participants = len(participants)
-        qualified_count = len(qualified_participants)
+        # Konkurs statistikasi (reyting jadvalidan)
+        counts = await get_contest_counts(db, active_contest.id)
+        total_participants = counts["participants"]
+        qualified_count = counts["qualified"]
         
         # Vaqt hisoblash
         time_left = active_contest.end_date - datetime.utcnow()
@@ -300,6 +346,10 @@ async def contest_page(request: Request, db: AsyncSession = Depends(get_db)):
             "qualified_participants": qualified_participants,
             "total_participants": total_participants,
             "qualified_count": qualified_count,
+            "leaderboard_prev": leaderboard_prev,
+            "leaderboard_next": leaderboard_next,
+            "qualified_prev": qualified_prev,
+            "qualified_next": qualified_next,
             "days_left": days_left,
             "hours_left": hours_left,
             "format_number": format_number
@@ -309,6 +359,82 @@ async def contest_page(request: Request, db: AsyncSession = Depends(get_db)):
         print(f"Contest page error: {e}")
         raise HTTPException(status_code=500, detail="Server error")
 
+@app.get("/contest/leaderboard")
+async def contest_leaderboard_api(after: str = None, before: str = None, per_page: int = LEADERBOARD_PAGE_SIZE,
+                                  user_id: int = None, db: AsyncSession = Depends(get_db)):
+    """Reyting API: keyset sahifa (after/before kursori), hisoblagichlar va (user_id berilsa) ishtirokchi o'rni"""
+    active_contest = await get_active_contest(db)
+    if not active_contest:
+        raise HTTPException(status_code=404, detail="Active contest not found")
+    
+    try:
+        after = parse_leaderboard_cursor(after) if after else None
+        before = parse_leaderboard_cursor(before) if before else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    per_page = min(max(per_page, 1), LEADERBOARD_PAGE_SIZE * 4)
+    rows, has_more = await get_leaderboard_page(db, active_contest.id, after, before, per_page)
+    prev_cursor, next_cursor = page_cursors(rows, has_more, after, before, lambda row: leaderboard_cursor(row[1]))
+    response = {
+        "contest_id": active_contest.id,
+        "per_page": per_page,
+        "prev_cursor": prev_cursor,
+        "next_cursor": next_cursor,
+        **await get_contest_counts(db, active_contest.id),
+        "leaderboard": [
+            {
+                "rank": rank,
+                "user_id": user.telegram_id,
+                "first_name": user.first_name,
+                "referrals": participant.referrals_completed,
+                "contest_number": participant.contest_number
+            }
+            for rank, participant, user in rows
+        ]
+    }
+    
+    if user_id is not None:
+        referrals = await db.scalar(
+            select(ContestParticipant.referrals_completed).where(
+                ContestParticipant.user_id == user_id,
+                ContestParticipant.contest_id == active_contest.id
+            )
+        )
+        response["user_rank"] = await get_contest_rank(db, active_contest.id, referrals) if referrals is not None else None
+    
+    return JSONResponse(response)
+
+@app.post("/contest/create")
+async def create_contest_api(
+    title: str = Form(...),
+    description: str = Form(None),
+    days: int = Form(CONTEST_DURATION_DAYS),
+    number_start: int = Form(CONTEST_NUMBER_START),
+    number_end: int = Form(CONTEST_NUMBER_END),
+    seed: int = Form(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Yangi konkurs va raqamlar pulini yaratish API"""
+    try:
+        contest = await create_contest(
+            db, title, description, days=days,
+            number_start=number_start, number_end=number_end, seed=seed
+        )
+        return JSONResponse({
+            "status": "success",
+            "message": f"Konkurs yaratildi: {format_number(contest['numbers'])} ta raqam",
+            "contest_id": contest["contest_id"],
+            "numbers": contest["numbers"],
+            "seed": contest["seed"]
+        })
+        
+    except ContestError as e:
+        return JSONResponse({"status": "error", "message": str(e)})
+    except Exception as e:
+        print(f"Create contest error: {e}")
+        return JSONResponse({"status": "error", "message": "Server xatolik"})
+
 @app.post("/contest/announce_winners")
 async def announce_winners_api(request: Request, db: AsyncSession = Depends(get_db)):
     """G'oliblarni e'lon qilish API"""
@@ -319,25 +445,14 @@ async def announce_winners_api(request: Request, db: AsyncSession = Depends(get_
         winner_3 = int(form.get("winner_3")) if form.get("winner_3") else None
         
         # Faol konkursni topish
-        contest_result = await db.execute(
-            select(Contest).where(
-                Contest.is_active == True,
-                Contest.end_date > datetime.utcnow()
-            )
-        )
-        active_contest = contest_result.scalar_one_or_none()
+        active_contest = await get_active_contest(db)
         
         if not active_contest:
             return {"status": "error", "message": "Faol konkurs topilmadi"}
         
         # G'oliblarni saqlash
-        active_contest.winner_1 = winner_1
-        active_contest.winner_2 = winner_2  
-        active_contest.winner_3 = winner_3
-        active_contest.winners_announced = True
-        active_contest.is_active = False
-        
-        await db.commit()
+        if not await finish_contest(db, active_contest.id, winner_1, winner_2, winner_3):
+            return {"status": "error", "message": "Konkurs allaqachon yakunlangan"}
         
         return {"status": "success", "message": "G'oliblar e'lon qilindi!"}
         
@@ -372,34 +487,8 @@ async def send_message_to_all_api(
     active_only: bool = Form(False),
     db: AsyncSession = Depends(get_db)
 ):
-    """Barcha foydalanuvchilarga xabar yuborish API"""
+    """Barcha foydalanuvchilarga xabar yuborish API (fon vazifasi)"""
     try:
-        start_time = datetime.now()
-        
-        # Foydalanuvchilarni olish
-        if active_only:
-            # Faqat faol foydalanuvchilar (son 7 kunda yaratilgan yoki tranzaksiya qilgan)
-            seven_days_ago = datetime.utcnow() - timedelta(days=7)
-            users_result = await db.execute(
-                select(User).where(
-                    (User.created_at >= seven_days_ago) |
-                    (User.telegram_id.in_(
-                        select(Transaction.user_id).where(Transaction.created_at >= seven_days_ago)
-                    ))
-                )
-            )
-        else:
-            # Barcha foydalanuvchilar
-            users_result = await db.execute(select(User))
-        
-        users = users_result.scalars().all()
-        
-        if not users:
-            return JSONResponse({
-                "status": "error",
-                "message": "Yuborish uchun foydalanuvchilar topilmadi"
-            })
-        
         # Xabar matnini tayyorlash
         message_type_emoji = {
             "announcement": "📢",
@@ -421,39 +510,18 @@ async def send_message_to_all_api(
         # Bot instance yaratish (bot.py dan import qilish)
         from bot import create_bot
         
-        bot_instance = create_bot()
-        sent_count = 0
-        error_count = 0
-        
-        # Har bir foydalanuvchiga xabar yuborish
-        for user in users:
-            try:
-                await bot_instance.send_message(
-                    chat_id=user.telegram_id,
-                    text=full_message,
-                    parse_mode="HTML"
-                )
-                sent_count += 1
-                
-                # Rate limiting - har 50 xabardan keyin 1 soniya kutish
-                if sent_count % 50 == 0:
-                    await asyncio.sleep(1)
-                    
-            except Exception as e:
-                print(f"Xabar yuborishda xatolik (user {user.telegram_id}): {e}")
-                error_count += 1
-                continue
-        
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
+        job = await start_broadcast(create_bot(), full_message, "active" if active_only else "all")
+        if not job:
+            return JSONResponse({
+                "status": "error",
+                "message": "Yuborish uchun foydalanuvchilar topilmadi"
+            })
         
         return JSONResponse({
-            "status": "success",
-            "message": "Xabar muvaffaqiyatli yuborildi",
-            "sent_count": sent_count,
-            "error_count": error_count,
-            "total_users": len(users),
-            "duration": round(duration, 2)
+            "status": "started",
+            "message": "Xabar yuborish boshlandi",
+            "job_id": job.id,
+            "total_users": job.total
         })
         
     except Exception as e:
@@ -463,6 +531,31 @@ async def send_message_to_all_api(
             "message": f"Server xatolik: {str(e)}"
         })
 
+@app.get("/broadcast/{job_id}")
+async def broadcast_progress(job_id: int):
+    """Broadcast jarayoni holati"""
+    progress = await get_broadcast_progress(job_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    return JSONResponse(progress)
+
+@app.on_event("startup")
+async def resume_broadcast_jobs():
+    """To'xtab qolgan broadcastlarni davom ettirish"""
+    if not BACKGROUND_IN_PROCESS:
+        # Broadcastlarni alohida worker jarayoni yuboradi (supervisor.py)
+        return
+    try:
+        from bot import create_bot
+        asyncio.create_task(broadcast_watchdog(create_bot()))
+    except Exception as e:
+        print(f"Broadcast resume error: {e}")
+
+# Webhook rejimida Telegram updatelari ham shu ilovaga keladi
+if BOT_MODE == "webhook":
+    from webhook import setup_webhook
+    setup_webhook(app)
+
 if __name__ == "__main__":
     import os
     uvicorn.run(
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Konkurs raqamlar puli yaratish benchmarki (utils_contest.create_contest):
+turli hajmdagi pullar uchun vaqt, hamda bir xil seed bir xil aralash
+tartib berishini tekshirish.
+
+Ishlatish: DATABASE_URL=postgresql://... python benchmarks/bench_contest_seed.py
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, delete
+
+from database import AsyncSessionLocal, engine, init_db
+from models import Contest, ContestNumber
+from utils_contest import create_contest, ContestError
+
+POOL_SIZES = [1_000, 100_000, 1_000_000]
+SEED = 42
+
+async def cleanup(contest_id):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(ContestNumber).where(ContestNumber.contest_id == contest_id))
+        await db.execute(delete(Contest).where(Contest.id == contest_id))
+        await db.commit()
+
+async def create(size, seed=SEED):
+    """Konkurs yaratish: (natija, soniya)"""
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        contest = await create_contest(db, "bench", days=1, number_start=1, number_end=size, seed=seed)
+        return contest, time.perf_counter() - started
+
+async def number_order(contest_id, limit=1000):
+    """id tartibidagi birinchi raqamlar"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ContestNumber.number_value)
+            .where(ContestNumber.contest_id == contest_id)
+            .order_by(ContestNumber.id)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+async def main():
+    if not os.getenv("DATABASE_URL"):
+        print("❌ DATABASE_URL o'rnatilmagan")
+        return 1
+
+    await init_db()
+    try:
+        print(f"{'raqamlar':>10} | {'vaqt (s)':>9} | {'raqam/s':>12}")
+        print("-" * 37)
+        for size in POOL_SIZES:
+            contest, seconds = await create(size)
+            await cleanup(contest["contest_id"])
+            print(f"{contest['numbers']:>10} | {seconds:>9.2f} | {contest['numbers'] / seconds:>12,.0f}")
+
+        # Bir xil seed - bir xil tartib, boshqa seed - boshqa tartib
+        orders = []
+        for seed in (SEED, SEED, SEED + 1):
+            contest, _ = await create(1_000, seed)
+            orders.append(await number_order(contest["contest_id"]))
+            await cleanup(contest["contest_id"])
+        print(f"\n🎲 seed={SEED} takrorlanadi: {orders[0] == orders[1]}, "
+              f"seed={SEED + 1} farq qiladi: {orders[0] != orders[2]}, "
+              f"aralashgan: {orders[0] != sorted(orders[0])}")
+    except ContestError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        await engine.dispose()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
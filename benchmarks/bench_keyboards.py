@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Klaviatura render benchmarki: har safar yangi markup yaratish va
+registrdagi tayyor (yoki keshlangan) markupni olish narxi.
+
+"render" - markupni olish va SendMessage so'rovini tayyorlash
+(aiogram har bir yuborishda shuni qiladi).
+
+Ishlatish: python benchmarks/bench_keyboards.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.methods import SendMessage
+
+import keyboards
+
+NUMBER = 20_000
+
+# (nom, eski yo'l - har safar yaratish, yangi yo'l - registr)
+CASES = [
+    ("main_menu", keyboards.build_main_menu_keyboard, keyboards.get_main_menu_keyboard),
+    ("star_purchase", keyboards.build_star_purchase_keyboard, keyboards.get_star_purchase_keyboard),
+    ("spin (3 bepul)", lambda: keyboards.get_spin_keyboard.__wrapped__(3), lambda: keyboards.get_spin_keyboard(3)),
+    ("contest", lambda: keyboards.build_contest_keyboards()["in_progress"], lambda: keyboards.get_contest_keyboard("in_progress")),
+]
+
+def per_call_us(func) -> float:
+    """Bitta chaqiruv o'rtacha vaqti (mikrosekund)"""
+    return min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER * 1_000_000
+
+def render(get_keyboard):
+    """Markupni olib, SendMessage so'rovini tayyorlash"""
+    return lambda: SendMessage(chat_id=1, text="x", reply_markup=get_keyboard()).model_dump(exclude_none=True)
+
+def main():
+    print(f"⌨️ Klaviatura render narxi ({NUMBER:,} marta, µs/chaqiruv)")
+    print(f"{'klaviatura':<16}{'yaratish':>10}{'registr':>10}{'render eski':>13}{'render yangi':>14}")
+    for name, build, get in CASES:
+        print(
+            f"{name:<16}"
+            f"{per_call_us(build):>10.2f}"
+            f"{per_call_us(get):>10.2f}"
+            f"{per_call_us(render(build)):>13.2f}"
+            f"{per_call_us(render(get)):>14.2f}"
+        )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
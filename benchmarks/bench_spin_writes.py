@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Spin yozish benchmarki: to'g'ridan-to'g'ri yo'l (tarix qatorlari
+settle_spin so'rovi ichida) va write-behind navbati (paketli INSERT)
+o'tkazuvchanligini solishtirish.
+
+Ishlatish: DATABASE_URL=postgresql://... python benchmarks/bench_spin_writes.py
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, select, func
+
+from database import AsyncSessionLocal, engine, init_db
+from models import User, SpinResult, Transaction, UserStats
+from handlers.game import play_spin
+from write_behind import spin_writer
+
+USER_COUNT = 50
+SPINS_PER_USER = 100
+CONCURRENCY = 20
+USER_IDS = [9_200_000_000 + i for i in range(USER_COUNT)]
+
+async def cleanup():
+    async with AsyncSessionLocal() as db:
+        for model in (UserStats, SpinResult, Transaction):
+            await db.execute(delete(model).where(model.user_id.in_(USER_IDS)))
+        await db.execute(delete(User).where(User.telegram_id.in_(USER_IDS)))
+        await db.commit()
+
+async def seed_users():
+    async with AsyncSessionLocal() as db:
+        for user_id in USER_IDS:
+            db.add(User(
+                telegram_id=user_id,
+                first_name="bench",
+                stars=SPINS_PER_USER * 10,
+                total_deposited=SPINS_PER_USER * 10
+            ))
+        await db.commit()
+
+async def run_spins():
+    """Har bir foydalanuvchi ketma-ket, foydalanuvchilar parallel spin qiladi"""
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def player(user_id):
+        async with semaphore:
+            async with AsyncSessionLocal() as db:
+                for _ in range(SPINS_PER_USER):
+                    await play_spin(db, user_id, 1)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[player(user_id) for user_id in USER_IDS])
+    await spin_writer.stop()
+    return time.perf_counter() - started
+
+async def measure(write_behind: bool):
+    await cleanup()
+    await seed_users()
+    spin_writer.enabled = write_behind
+    spin_writer.start()
+
+    elapsed = await run_spins()
+
+    async with AsyncSessionLocal() as db:
+        spin_rows = await db.scalar(
+            select(func.count(SpinResult.id)).where(SpinResult.user_id.in_(USER_IDS))
+        )
+
+    total = USER_COUNT * SPINS_PER_USER
+    assert spin_rows == total, f"expected {total} spin rows, got {spin_rows}"
+    return total / elapsed, spin_writer.flush_count
+
+async def main():
+    if not os.getenv("DATABASE_URL"):
+        print("❌ DATABASE_URL o'rnatilmagan")
+        return 1
+
+    await init_db()
+    try:
+        direct_rate, _ = await measure(write_behind=False)
+        batched_rate, flushes = await measure(write_behind=True)
+    finally:
+        spin_writer.enabled = False
+        await cleanup()
+        await engine.dispose()
+
+    total = USER_COUNT * SPINS_PER_USER
+    print(f"{total} spin, {CONCURRENCY} parallel o'yinchi")
+    print(f"  to'g'ridan-to'g'ri: {direct_rate:>8.0f} spin/s")
+    print(f"  write-behind:       {batched_rate:>8.0f} spin/s ({flushes} paketli INSERT)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
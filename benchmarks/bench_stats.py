@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+/stats benchmark: eski yo'l (barcha SpinResult qatorlarini yuklash)
+va yangi yo'l (user_stats hisoblagichlari) kechikishini solishtirish.
+
+Ishlatish: DATABASE_URL=postgresql://... python benchmarks/bench_stats.py
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, delete, insert
+
+from database import AsyncSessionLocal, engine, init_db
+from models import User, SpinResult, UserStats
+from utils_stats import get_user_spin_stats, recount_user_stats
+
+BENCH_USER_ID = 9_000_000_001
+HISTORY_SIZES = [100, 1_000, 10_000, 100_000]
+REPEATS = 20
+
+async def old_stats_path(db, user_id):
+    """Eski /stats: barcha spinlarni Python obyektlariga yuklash"""
+    spins_result = await db.execute(
+        select(SpinResult).where(SpinResult.user_id == user_id)
+    )
+    spins = spins_result.scalars().all()
+    total_spins = len(spins)
+    won_spins = len([s for s in spins if s.spin_result == "win"])
+    return total_spins, won_spins
+
+async def measure(func, user_id):
+    """Median kechikish (ms)"""
+    timings = []
+    for _ in range(REPEATS):
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            await func(db, user_id)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+async def seed_spins(user_id, count):
+    """Spin tarixini ko'paytirish (multi-row INSERT)"""
+    async with AsyncSessionLocal() as db:
+        batch = []
+        for _ in range(count):
+            is_win = random.random() < 0.2
+            batch.append({
+                "user_id": user_id,
+                "bet_amount": 1,
+                "win_amount": random.randint(1, 3) if is_win else 0,
+                "spin_result": "win" if is_win else "lose",
+                "multiplier": 1.5 if is_win else 0.0
+            })
+            if len(batch) >= 5000:
+                await db.execute(insert(SpinResult), batch)
+                batch = []
+        if batch:
+            await db.execute(insert(SpinResult), batch)
+        await db.commit()
+
+async def cleanup(user_id):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(UserStats).where(UserStats.user_id == user_id))
+        await db.execute(delete(SpinResult).where(SpinResult.user_id == user_id))
+        await db.execute(delete(User).where(User.telegram_id == user_id))
+        await db.commit()
+
+async def main():
+    if not os.getenv("DATABASE_URL"):
+        print("❌ DATABASE_URL o'rnatilmagan")
+        return 1
+
+    await init_db()
+    await cleanup(BENCH_USER_ID)
+
+    async with AsyncSessionLocal() as db:
+        db.add(User(telegram_id=BENCH_USER_ID, first_name="bench"))
+        await db.commit()
+
+    print(f"{'spinlar':>10} | {'eski (ms)':>10} | {'yangi (ms)':>10}")
+    print("-" * 38)
+
+    seeded = 0
+    try:
+        for size in HISTORY_SIZES:
+            await seed_spins(BENCH_USER_ID, size - seeded)
+            seeded = size
+
+            # Hisoblagichni tarixdan qayta hisoblash
+            async with AsyncSessionLocal() as db:
+                await recount_user_stats(db, BENCH_USER_ID)
+
+            old_ms = await measure(old_stats_path, BENCH_USER_ID)
+            new_ms = await measure(get_user_spin_stats, BENCH_USER_ID)
+            print(f"{size:>10} | {old_ms:>10.2f} | {new_ms:>10.2f}")
+    finally:
+        await cleanup(BENCH_USER_ID)
+        await engine.dispose()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
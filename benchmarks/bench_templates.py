@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Spin natijasi matnini render qilish benchmarki: eski f-string yo'li
+(handlers/game.py dagi avvalgi kod) va messages.py shablonlari.
+
+Har bir render uchun ajratilgan baytlar (tracemalloc) va vaqt o'lchanadi.
+Ikkala yo'l bir xil matn qaytarishi ham tekshiriladi.
+
+Ishlatish: python benchmarks/bench_templates.py
+"""
+
+import os
+import sys
+import random
+import timeit
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from messages import render_spin_result
+from utils import SLOT_SYMBOLS
+
+NUMBER = 20_000
+
+def old_format_number(number: int) -> str:
+    return f"{number:,}".replace(",", " ")
+
+def old_render_spin_result(bet_amount, win_amount, result_type, new_balance, symbols, was_free_spin=False, remaining_free_spins=0):
+    """Shablonlardan oldingi show_spin_result matni"""
+    symbols_display = f"🎰 【 {symbols[0]} 】【 {symbols[1]} 】【 {symbols[2]} 】 🎰"
+
+    spin_cost_text = "🎁 Bepul spin ishlatildi" if was_free_spin else f"💸 Narx: {bet_amount} ⭐"
+    free_spins_text = f"\n🎁 Qolgan bepul spinlar: {remaining_free_spins}" if remaining_free_spins > 0 else ""
+
+    if result_type == "win":
+        result_text = f"""
+🎰 <b>O'YIN</b> 🎰
+
+💰 <b>Balans:</b> {old_format_number(new_balance)} ⭐
+
+{symbols_display}
+
+🎉 <b>YUTDINGIZ!</b> +{win_amount} ⭐
+{spin_cost_text}{free_spins_text}
+        """
+    else:
+        result_text = f"""
+🎰 <b>O'YIN</b> 🎰
+
+💰 <b>Balans:</b> {old_format_number(new_balance)} ⭐
+
+{symbols_display}
+
+😔 <b>Yutqazdingiz</b>
+{spin_cost_text}{free_spins_text}
+        """
+    return result_text
+
+def make_cases(count: int):
+    """Tasodifiy spin natijalari (real taqsimotga yaqin)"""
+    rng = random.Random(42)
+    cases = []
+    for _ in range(count):
+        bet = 1
+        win = rng.random() < 0.3
+        symbols = [rng.choice(SLOT_SYMBOLS)] * 3 if win else rng.sample(SLOT_SYMBOLS, 3)
+        cases.append((
+            bet,
+            int(bet * rng.choice([1.2, 1.5, 2.0, 2.5])) if win else 0,
+            "win" if win else "lose",
+            rng.randint(0, 50_000),
+            symbols,
+            rng.random() < 0.1,
+            rng.choice([0, 0, 0, 1, 3])
+        ))
+    return cases
+
+def total_allocated_per_render(render, cases) -> float:
+    """Oraliq satrlar bilan birga ajratilgan jami baytlar"""
+    tracemalloc.start()
+    total = 0
+    for case in cases:
+        snapshot_before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        render(*case)
+        total += tracemalloc.get_traced_memory()[1] - snapshot_before
+    tracemalloc.stop()
+    return total / len(cases)
+
+def main():
+    cases = make_cases(NUMBER)
+
+    mismatches = sum(old_render_spin_result(*case) != render_spin_result(*case) for case in cases)
+    if mismatches:
+        print(f"❌ {mismatches} ta natija matni farq qiladi")
+        return 1
+
+    # Shablon bo'laklari keshini isitish (ishlab turgan botdagi holat)
+    for case in cases:
+        render_spin_result(*case)
+
+    print(f"🎰 Spin natijasi render ({NUMBER:,} ta natija)")
+    print(f"{'yo`l':<10}{'bayt/render (peak)':>20}{'µs/render':>12}")
+    for name, render in (("eski", old_render_spin_result), ("shablon", render_spin_result)):
+        allocated = total_allocated_per_render(render, cases)
+        seconds = min(timeit.repeat(lambda: [render(*case) for case in cases], number=1, repeat=5))
+        print(f"{name:<10}{allocated:>20.0f}{seconds / NUMBER * 1_000_000:>12.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,15 @@
+import signal
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
+from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, BOT_MODE, BOT_METRICS_PORT
 from database import init_db
+from write_behind import spin_writer
+from sharding import update_shards, process_shards, consume_shard_queue, ShardedDispatcher
+from metrics import setup_dispatcher_metrics, serve_metrics, TelegramMetricsMiddleware
 from handlers import start, payments, game, admin
 from handlers.withdrawals import router as withdrawal_router
 from handlers.support import router as support_router
@@ -20,8 +24,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Bot va Dispatcher yaratish
+# UPDATE_SHARDS > 0 bo'lsa updatelar foydalanuvchi bo'yicha shardlarda qayta ishlanadi
 bot = None
-dp = Dispatcher()
+dp = ShardedDispatcher()
 
 def create_bot():
     """Bot yaratish funktsiyasi"""
@@ -31,6 +36,8 @@ def create_bot():
             token=BOT_TOKEN,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
+        # Bot API so'rovlari kechikishi (/metrics)
+        bot.session.middleware(TelegramMetricsMiddleware())
     return bot
 
 # Routerlarni ro'yxatdan o'tkazish
@@ -43,8 +50,16 @@ dp.include_router(referral_router)
 dp.include_router(contest_router)
 dp.include_router(admin.router)
 
-async def main():
-    """Asosiy funktsiya"""
+# Handler kechikishi va xatoliklari (/metrics)
+setup_dispatcher_metrics(dp)
+
+async def main(shard_queues=None):
+    """
+    Asosiy funktsiya
+    shard_queues - supervisor bergan shard jarayonlari navbatlari: bu jarayon faqat
+    updatelarni oladi va ularni foydalanuvchi bo'yicha shard jarayonlariga yuboradi
+    """
+    metrics_runner = None
     try:
         # Bot token tekshirish
         if not BOT_TOKEN or BOT_TOKEN == "your_bot_token_here":
@@ -52,6 +67,11 @@ async def main():
             logger.error("Please set BOT_TOKEN in Railway environment variables")
             return
         
+        # Webhook rejimida updatelar admin panel orqali qabul qilinadi (webhook.py)
+        if BOT_MODE == "webhook":
+            logger.info("BOT_MODE=webhook - polling o'chirilgan, updatelar admin panelga keladi")
+            return
+        
         # Botni yaratish
         bot_instance = create_bot()
         
@@ -59,16 +79,64 @@ async def main():
         await init_db()
         logger.info("Database initialized successfully")
         
+        # Spin tarixini paket holida yozish (yoqilgan bo'lsa)
+        spin_writer.start()
+        if shard_queues:
+            process_shards.start(shard_queues)
+            dp.shards = process_shards
+        else:
+            update_shards.start()
+        
+        # Handler, Bot API va shard metrikalari (admin panel boshqa jarayonda ishlaydi)
+        if BOT_METRICS_PORT:
+            metrics_runner = await serve_metrics(BOT_METRICS_PORT)
+            logger.info(f"Metrikalar: http://0.0.0.0:{BOT_METRICS_PORT}/metrics")
+        
         # Botni ishga tushirish
         logger.info("Starting bot...")
-        await dp.start_polling(bot_instance, skip_updates=True)
+        # Oldin webhook o'rnatilgan bo'lsa, polling ishlashi uchun uni o'chirish
+        await bot_instance.delete_webhook()
+        # Shardlar yoqilgan bo'lsa updatelar ketma-ket shardlarga qo'yiladi (tartib saqlanadi)
+        await dp.start_polling(bot_instance, skip_updates=True, handle_as_tasks=not dp.shards.running)
         
     except Exception as e:
         logger.error(f"Error starting bot: {e}")
     finally:
+        # Navbatda qolgan spin tarixini yozib qo'yish
+        await update_shards.stop()
+        await spin_writer.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
         if bot:
             await bot.session.close()
 
+async def shard_main(shard: int, queue):
+    """Shard jarayoni (supervisor): polling jarayoni yuborgan updatelarni qayta ishlash"""
+    bot_instance = create_bot()
+    await init_db()
+    spin_writer.start()
+    update_shards.start()
+    
+    # Handlerlar shu jarayonda ishlaydi - metrikalar ham shu yerda (BOT_METRICS_PORT + 1 + shard)
+    metrics_runner = None
+    if BOT_METRICS_PORT:
+        metrics_runner = await serve_metrics(BOT_METRICS_PORT + 1 + shard)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    
+    logger.info(f"Shard {shard} updatelarni kutmoqda...")
+    try:
+        await consume_shard_queue(dp, bot_instance, queue, stop)
+    finally:
+        await update_shards.stop()
+        await spin_writer.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot_instance.session.close()
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
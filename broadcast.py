@@ -0,0 +1,426 @@
+"""
+Ommaviy xabar yuborish (broadcast) dvigateli
+
+Qabul qiluvchilar server-side kursor orqali oqim ko'rinishida o'qiladi,
+xabarlar cheklangan miqdordagi parallel workerlar bilan yuboriladi,
+umumiy tezlik esa jarayondagi barcha broadcastlar uchun bitta token-bucket
+orqali cheklanadi. Telegram RetryAfter qaytarsa, barcha broadcastlarning
+workerlari ko'rsatilgan vaqtgacha to'xtaydi.
+
+Har bir broadcast broadcasts jadvalida saqlanadi. Har bir qabul qiluvchi
+natijasi (delivered/failed/blocked) va kursor checkpointi paket holida
+yoziladi, shuning uchun jarayon qayta ishga tushsa yuborish oxirgi
+checkpointdan davom etadi.
+
+Auditoriya: "all", "active" yoki "contest:<id>" (konkurs ishtirokchilari,
+g'oliblar e'loni uchun). notify_chat_id berilsa, broadcast tugagach
+yetkazilgan/xatolik hisoblari shu chatga yuboriladi.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from sqlalchemy import select, update, func, exists, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import User, Transaction, ContestParticipant, Broadcast, BroadcastDelivery
+from utils_reachability import is_unreachable_error, mark_unreachable
+from config import (
+    BROADCAST_RATE, BROADCAST_WORKERS, BROADCAST_PROGRESS_BATCH,
+    BROADCAST_PROGRESS_INTERVAL, BROADCAST_LEASE_SECONDS, BROADCAST_POLL_INTERVAL,
+    BACKGROUND_IN_PROCESS
+)
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Umumiy tezlik cheklovchisi (soniyasiga rate ta token)"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    async def acquire(self):
+        """Bitta token olguncha kutish"""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Token oldindan band qilinadi (manfiy qoldiq - navbatdagilar soni),
+            # shuning uchun lock kerak emas va tartib saqlanadi
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return
+            await asyncio.sleep(-self.tokens / self.rate)
+            # Kutish paytida RetryAfter kelgan bo'lsa band qilingan token bekor
+            if time.monotonic() >= self.paused_until:
+                return
+
+    def pause(self, seconds: float):
+        """RetryAfter: barcha yuborishlarni vaqtincha to'xtatish"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+# Shu jarayondagi barcha broadcastlar uchun bitta cheklovchi: Telegram limiti
+# butun bot uchun, shuning uchun parallel ishlar ham jami BROADCAST_RATE dan oshmaydi
+broadcast_limiter = TokenBucket(BROADCAST_RATE)
+
+def build_recipients_query(audience: str):
+    """Qabul qiluvchilar so'rovi (faqat telegram_id, o'sish tartibida)"""
+    # Botni bloklagan foydalanuvchilarga yuborilmaydi
+    recipients = select(User.telegram_id).where(User.is_reachable == True).order_by(User.telegram_id)
+    if audience == "active":
+        # Faqat faol foydalanuvchilar (son 7 kunda yaratilgan yoki tranzaksiya qilgan)
+        seven_days_ago = datetime.utcnow() - timedelta(days=7)
+        recipients = recipients.where(
+            (User.created_at >= seven_days_ago) |
+            (User.telegram_id.in_(
+                select(Transaction.user_id).where(Transaction.created_at >= seven_days_ago)
+            ))
+        )
+    elif audience.startswith("contest:"):
+        # Konkurs ishtirokchilari
+        contest_id = int(audience.split(":", 1)[1])
+        recipients = recipients.where(
+            User.telegram_id.in_(
+                select(ContestParticipant.user_id).where(ContestParticipant.contest_id == contest_id)
+            )
+        )
+    return recipients
+
+class BroadcastJob:
+    """Shu jarayonda ishlayotgan broadcast holati"""
+
+    def __init__(self, broadcast: Broadcast):
+        self.id = broadcast.id
+        self.text = broadcast.text
+        self.audience = broadcast.audience
+        self.total = broadcast.total
+        self.status = broadcast.status
+        self.sent = broadcast.sent or 0
+        self.failed = broadcast.failed or 0
+        self.blocked = broadcast.blocked or 0
+        self.retried = 0
+        self.checkpoint = broadcast.checkpoint_user_id
+        self.error = broadcast.error
+        self.notify_chat_id = broadcast.notify_chat_id
+        self.started_at = broadcast.started_at
+        self.finished_at = broadcast.finished_at
+        self.task = None
+
+        # Yozilishini kutayotgan natijalar va checkpoint hisobi
+        self.pending_results = []
+        self.dispatched = deque()
+        self.completed = set()
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, user_id: int, status: str):
+        """Bitta qabul qiluvchi natijasini qayd qilish"""
+        if status == "delivered":
+            self.sent += 1
+        elif status == "blocked":
+            self.blocked += 1
+        else:
+            self.failed += 1
+        self.pending_results.append({
+            "broadcast_id": self.id,
+            "user_id": user_id,
+            "status": status,
+            "created_at": datetime.utcnow()
+        })
+        self.completed.add(user_id)
+
+    def advance_checkpoint(self):
+        """Ketma-ket tugagan qabul qiluvchilar bo'yicha checkpointni surish"""
+        while self.dispatched and self.dispatched[0] in self.completed:
+            self.checkpoint = self.dispatched.popleft()
+            self.completed.discard(self.checkpoint)
+        return self.checkpoint
+
+    async def flush(self, **values):
+        """Natijalar, hisoblagichlar va checkpointni bitta tranzaksiyada yozish"""
+        async with self._flush_lock:
+            rows, self.pending_results = self.pending_results, []
+            checkpoint = self.advance_checkpoint()
+
+            try:
+                async with AsyncSessionLocal() as db:
+                    if rows:
+                        await db.execute(insert(BroadcastDelivery).on_conflict_do_nothing(), rows)
+                        await mark_unreachable(db, [row["user_id"] for row in rows if row["status"] == "blocked"])
+                    await db.execute(
+                        update(Broadcast)
+                        .where(Broadcast.id == self.id)
+                        .values({
+                            "sent": self.sent,
+                            "failed": self.failed,
+                            "blocked": self.blocked,
+                            "checkpoint_user_id": checkpoint,
+                            "heartbeat_at": datetime.utcnow(),
+                            **values
+                        })
+                    )
+                    await db.commit()
+            except Exception as e:
+                # Natijalar keyingi flushda qayta yoziladi
+                logger.error(f"Broadcast {self.id} progress flush error: {e}")
+                self.pending_results = rows + self.pending_results
+            except asyncio.CancelledError:
+                self.pending_results = rows + self.pending_results
+                raise
+
+    def progress(self) -> dict:
+        return broadcast_progress(self, retried=self.retried)
+
+def broadcast_progress(job, retried: int = 0) -> dict:
+    """Broadcast holati (BroadcastJob yoki Broadcast qatori uchun)"""
+    finished_at = job.finished_at or datetime.utcnow()
+    duration = (finished_at - job.started_at).total_seconds() if job.started_at else 0
+    processed = job.sent + job.failed + job.blocked
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total_users": job.total,
+        "sent_count": job.sent,
+        "error_count": job.failed,
+        "blocked_count": job.blocked,
+        "retry_count": retried,
+        "processed": processed,
+        "percent": round(processed / job.total * 100, 1) if job.total else 100.0,
+        "duration": round(duration, 2),
+        "error": job.error
+    }
+
+# Shu jarayonda ishlayotgan broadcastlar
+broadcast_jobs = {}
+
+async def notify_finished(bot: Bot, job: BroadcastJob):
+    """Tugagan broadcast natijasini notify_chat_id ga yuborish"""
+    progress = job.progress()
+    text = (
+        f"📊 <b>Xabar yuborish yakunlandi</b> (#{job.id})\n\n"
+        f"✅ Yetkazildi: {progress['sent_count']}\n"
+        f"🚫 Bloklagan: {progress['blocked_count']}\n"
+        f"❌ Xatolik: {progress['error_count']}\n"
+        f"⏱ Vaqt: {progress['duration']} s"
+    )
+    if job.status == "failed":
+        text += f"\n\n⚠️ To'xtadi: {job.error}"
+    try:
+        await bot.send_message(chat_id=job.notify_chat_id, text=text, parse_mode="HTML")
+    except Exception as e:
+        logger.error(f"Broadcast {job.id} natijasini yuborib bo'lmadi: {e}")
+
+async def deliver(bot: Bot, chat_id: int, text: str, limiter: TokenBucket, job: BroadcastJob, max_attempts: int = 3) -> str:
+    """
+    Bitta foydalanuvchiga xabar yuborish (RetryAfter bo'lsa qayta urinish)
+    Returns: "delivered", "blocked" yoki "failed"
+    """
+    for _ in range(max_attempts):
+        await limiter.acquire()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+            return "delivered"
+        except TelegramRetryAfter as e:
+            limiter.pause(e.retry_after)
+            job.retried += 1
+        except Exception as e:
+            if is_unreachable_error(e):
+                return "blocked"
+            logger.info(f"Broadcast {job.id}: user {chat_id} ga yuborilmadi: {e}")
+            return "failed"
+    return "failed"
+
+async def run_broadcast(job: BroadcastJob, bot: Bot, workers: int, limiter: TokenBucket = broadcast_limiter):
+    """Qabul qiluvchilarni oqim bilan o'qib, workerlar orqali yuborish"""
+    queue = asyncio.Queue(maxsize=workers * 10)
+
+    async def worker():
+        while True:
+            chat_id = await queue.get()
+            if chat_id is None:
+                return
+            status = await deliver(bot, chat_id, job.text, limiter, job)
+            job.record(chat_id, status)
+            if len(job.pending_results) >= BROADCAST_PROGRESS_BATCH and not job._flush_lock.locked():
+                await job.flush()
+
+    async def heartbeat():
+        # Vaqt bo'yicha progress yozish (lease ham yangilanadi)
+        while not stopped.is_set():
+            try:
+                await asyncio.wait_for(stopped.wait(), BROADCAST_PROGRESS_INTERVAL)
+            except asyncio.TimeoutError:
+                await job.flush()
+
+    # Oxirgi checkpointdan keyingi va hali qayta ishlanmagan qabul qiluvchilar
+    recipients_query = build_recipients_query(job.audience).where(
+        ~exists().where(
+            BroadcastDelivery.broadcast_id == job.id,
+            BroadcastDelivery.user_id == User.telegram_id
+        )
+    )
+    if job.checkpoint is not None:
+        recipients_query = recipients_query.where(User.telegram_id > job.checkpoint)
+
+    job.status = "running"
+    job.started_at = job.started_at or datetime.utcnow()
+    await job.flush(status="running", started_at=job.started_at)
+
+    stopped = asyncio.Event()
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    heartbeat_task = asyncio.create_task(heartbeat())
+
+    try:
+        async with AsyncSessionLocal() as db:
+            # Server-side kursor: butun ro'yxat xotiraga yuklanmaydi
+            recipients = await db.stream_scalars(recipients_query.execution_options(yield_per=1000))
+            async for chat_id in recipients:
+                job.dispatched.append(chat_id)
+                await queue.put(chat_id)
+
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+        job.status = "finished"
+    except Exception as e:
+        logger.error(f"Broadcast {job.id} error: {e}")
+        job.status = "failed"
+        job.error = str(e)
+    finally:
+        # Shutdown (CancelledError) bo'lsa status "running" qoladi va ish keyinroq davom ettiriladi
+        stopped.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(heartbeat_task, *tasks, return_exceptions=True)
+        if job.status != "running":
+            job.finished_at = datetime.utcnow()
+            await job.flush(status=job.status, error=job.error, finished_at=job.finished_at)
+            if job.notify_chat_id:
+                await notify_finished(bot, job)
+        else:
+            # Lease bo'shatiladi - boshqa worker ishni darhol davom ettiradi
+            await job.flush(heartbeat_at=None)
+        broadcast_jobs.pop(job.id, None)
+
+def launch(broadcast: Broadcast, bot: Bot, workers: int = BROADCAST_WORKERS,
+           limiter: TokenBucket = broadcast_limiter) -> BroadcastJob:
+    """Saqlangan broadcastni shu jarayonda fon vazifasi sifatida ishga tushirish"""
+    job = BroadcastJob(broadcast)
+    broadcast_jobs[job.id] = job
+    job.task = asyncio.create_task(run_broadcast(job, bot, workers, limiter))
+    return job
+
+async def create_broadcast(db: AsyncSession, text: str, audience: str = "all", notify_chat_id: int = None):
+    """
+    Broadcast qatorini chaqiruvchining tranzaksiyasiga qo'shish (commit chaqiruvchida)
+    Qabul qiluvchilar bo'lmasa None qaytaradi
+    """
+    total = await db.scalar(
+        select(func.count()).select_from(build_recipients_query(audience).order_by(None).subquery())
+    ) or 0
+    if not total:
+        return None
+
+    broadcast = Broadcast(
+        text=text,
+        audience=audience,
+        total=total,
+        status="pending",
+        notify_chat_id=notify_chat_id,
+        heartbeat_at=datetime.utcnow() if BACKGROUND_IN_PROCESS else None
+    )
+    db.add(broadcast)
+    await db.flush()
+    return broadcast
+
+def dispatch_broadcast(broadcast: Broadcast, bot: Bot):
+    """
+    Saqlangan broadcastni boshlash
+    BACKGROUND_IN_PROCESS=false bo'lsa uni worker jarayoni oladi (Broadcast qaytadi)
+    """
+    if not BACKGROUND_IN_PROCESS:
+        return broadcast
+    return launch(broadcast, bot)
+
+async def start_broadcast(bot: Bot, text: str, audience: str = "all", notify_chat_id: int = None) -> BroadcastJob:
+    """
+    Yangi broadcast yaratish va boshlash
+    BACKGROUND_IN_PROCESS=false bo'lsa faqat saqlanadi, uni worker jarayoni oladi (Broadcast qaytadi).
+    Qabul qiluvchilar bo'lmasa None qaytaradi
+    """
+    async with AsyncSessionLocal() as db:
+        broadcast = await create_broadcast(db, text, audience, notify_chat_id)
+        if broadcast is None:
+            return None
+        await db.commit()
+
+    return dispatch_broadcast(broadcast, bot)
+
+async def get_broadcast_progress(job_id: int):
+    """Broadcast holati: ishlayotgan bo'lsa xotiradan, aks holda bazadan"""
+    job = broadcast_jobs.get(job_id)
+    if job:
+        return job.progress()
+
+    async with AsyncSessionLocal() as db:
+        broadcast = await db.get(Broadcast, job_id)
+        return broadcast_progress(broadcast) if broadcast else None
+
+async def resume_broadcasts(bot: Bot):
+    """Qayta ishga tushgandan keyin to'xtab qolgan broadcastlarni davom ettirish"""
+    stale_before = datetime.utcnow() - timedelta(seconds=BROADCAST_LEASE_SECONDS)
+
+    async with AsyncSessionLocal() as db:
+        # Lease muddati o'tgan ishlarni egallash (boshqa jarayon bilan takrorlanmasligi uchun)
+        result = await db.execute(
+            update(Broadcast)
+            .where(
+                Broadcast.status.in_(["pending", "running"]),
+                or_(Broadcast.heartbeat_at.is_(None), Broadcast.heartbeat_at < stale_before),
+                Broadcast.id.notin_(list(broadcast_jobs))
+            )
+            .values(heartbeat_at=datetime.utcnow())
+            .returning(Broadcast.id)
+        )
+        claimed = result.scalars().all()
+        await db.commit()
+
+        for broadcast_id in claimed:
+            broadcast = await db.get(Broadcast, broadcast_id)
+
+            # Hisoblagichlarni yozilgan natijalardan aniq tiklash
+            counts = dict((await db.execute(
+                select(BroadcastDelivery.status, func.count())
+                .where(BroadcastDelivery.broadcast_id == broadcast_id)
+                .group_by(BroadcastDelivery.status)
+            )).all())
+            broadcast.sent = counts.get("delivered", 0)
+            broadcast.failed = counts.get("failed", 0)
+            broadcast.blocked = counts.get("blocked", 0)
+
+            logger.info(f"Broadcast {broadcast_id} davom ettirilmoqda (checkpoint: {broadcast.checkpoint_user_id})")
+            launch(broadcast, bot)
+
+    return claimed
+
+async def broadcast_watchdog(bot: Bot):
+    """To'xtab qolgan broadcastlarni davriy tekshirish"""
+    while True:
+        try:
+            await resume_broadcasts(bot)
+        except Exception as e:
+            logger.error(f"Broadcast watchdog error: {e}")
+        await asyncio.sleep(BROADCAST_POLL_INTERVAL)
@@ -1,7 +1,15 @@
+import time
 import asyncio
+from bisect import bisect_left
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from config import DATABASE_URL
+from metrics import instrument_engine, db_pool_checkout_duration
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_STATEMENT_TIMEOUT_MS, DB_STATEMENT_CACHE_SIZE, DB_PREPARED_STATEMENT_CACHE_SIZE
+)
 
 class Base(DeclarativeBase):
     pass
@@ -16,14 +24,91 @@ else:
 if "?sslmode=" in async_database_url:
     async_database_url = async_database_url.split("?sslmode=")[0]
 
+class PoolMetrics:
+    """Pooldan ulanish olish (checkout) hisoblagichlari"""
+
+    # Kutish vaqti gistogrammasi chegaralari (soniya)
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(self.BUCKETS) + 1)
+        self.overflow_events = 0
+        self.timeouts = 0
+
+    def observe_checkout(self, wait: float):
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.wait_buckets[bisect_left(self.BUCKETS, wait)] += 1
+
+pool_metrics = PoolMetrics()
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Checkout kutish vaqti, overflow va timeoutlarni hisoblaydigan pool"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - started
+            pool_metrics.observe_checkout(wait)
+            db_pool_checkout_duration.observe(value=wait)
+
+    def _inc_overflow(self):
+        acquired = super()._inc_overflow()
+        if acquired and self._overflow > 0:
+            # pool_size dan tashqari yangi ulanish ochildi
+            pool_metrics.overflow_events += 1
+        return acquired
+
+server_settings = {"application_name": "telegram_bot"}
+if DB_STATEMENT_TIMEOUT_MS:
+    server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+
 engine = create_async_engine(
     async_database_url,
     echo=False,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
     pool_pre_ping=True,
-    pool_recycle=3600,
-    connect_args={"server_settings": {"application_name": "telegram_bot"}}
+    pool_recycle=DB_POOL_RECYCLE,
+    connect_args={
+        "server_settings": server_settings,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE
+    }
 )
 
+# So'rov vaqti metrikalari (/metrics)
+instrument_engine(engine)
+
+def pool_stats() -> dict:
+    """Pool holati va checkout metrikalari"""
+    pool = engine.pool
+    checkouts = pool_metrics.checkouts
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": checkouts,
+        "overflow_events": pool_metrics.overflow_events,
+        "timeouts": pool_metrics.timeouts,
+        "wait_avg_ms": round(pool_metrics.wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+        "wait_max_ms": round(pool_metrics.wait_max * 1000, 3),
+        "wait_buckets": dict(zip([str(b) for b in PoolMetrics.BUCKETS] + ["+Inf"], pool_metrics.wait_buckets))
+    }
+
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -40,3 +125,7 @@ async def get_db():
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    
+    # Mavjud bazaga yangi indeks va ustunlarni qo'shish
+    from migrations import run_migrations
+    await run_migrations(engine)
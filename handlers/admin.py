@@ -10,6 +10,7 @@ from models import User, Transaction, Withdrawal, SpinResult
 from keyboards import get_admin_keyboard, get_withdrawal_approval_keyboard
 from config import ADMIN_IDS
 from utils import format_number
+from utils_cache import invalidate_user
 
 router = Router()
 
@@ -226,6 +227,7 @@ async def approve_withdrawal(callback: CallbackQuery):
             
             db.add(transaction)
             await db.commit()
+            invalidate_user(user.telegram_id)
             
             # Foydalanuvchiga xabar yuborish
             try:
@@ -300,6 +302,7 @@ async def reject_withdrawal(callback: CallbackQuery):
             user.stars += withdrawal.amount
             
             await db.commit()
+            invalidate_user(user.telegram_id)
             
             # Foydalanuvchiga xabar yuborish
             try:
@@ -1,16 +1,22 @@
 """
 Konkurs tizimi handlari
 """
-import random
 from datetime import datetime
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select, func, and_, update
+from aiogram.types import Message, CallbackQuery
+from sqlalchemy import select, and_, update, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
-from models import User, ContestParticipant, ContestNumber, Contest
+from models import User, ContestParticipant
 from utils import format_number
+from keyboards import get_contest_keyboard
+from utils_cache import get_user_profile
+from broadcast import create_broadcast, dispatch_broadcast
+from utils_contest import (
+    create_contest, get_active_contest, finish_contest, ContestError,
+    leaderboard_move, get_contest_counts, get_contest_rank
+)
 from config import ADMIN_IDS
 
 router = Router()
@@ -20,23 +26,14 @@ async def contest_menu(message: Message):
     """Konkurs asosiy menyusi"""
     async for db in get_db():
         # Foydalanuvchini topish
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Xatolik yuz berdi. /start tugmasini bosing.")
             return
         
         # Faol konkurs mavjudligini tekshirish
-        contest_result = await db.execute(
-            select(Contest).where(
-                Contest.is_active == True,
-                Contest.end_date > datetime.utcnow()
-            )
-        )
-        active_contest = contest_result.scalar_one_or_none()
+        active_contest = await get_active_contest(db)
         
         if not active_contest:
             await message.answer(
@@ -84,13 +81,7 @@ async def contest_menu(message: Message):
 🤞 Omad tilaymiz!
                 """
                 
-                keyboard = InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [InlineKeyboardButton(text="📊 Mening statistikam", callback_data="contest_stats")],
-                        [InlineKeyboardButton(text="🔗 Referal link", callback_data="get_referral_link")],
-                        [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_menu")]
-                    ]
-                )
+                keyboard = get_contest_keyboard("has_number")
             else:
                 # Raqam olmagan ishtirokchi
                 contest_text = f"""
@@ -111,13 +102,7 @@ async def contest_menu(message: Message):
 🎖️ 4-5 o'rin: 15 tadan yulduz
                 """
                 
-                keyboard = InlineKeyboardMarkup(
-                    inline_keyboard=[
-                        [InlineKeyboardButton(text="🔗 Referal link olish", callback_data="get_referral_link")],
-                        [InlineKeyboardButton(text="📊 Mening statistikam", callback_data="contest_stats")],
-                        [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_menu")]
-                    ]
-                )
+                keyboard = get_contest_keyboard("in_progress")
         else:
             # Konkursda ishtirok etmagan
             contest_text = f"""
@@ -141,12 +126,7 @@ async def contest_menu(message: Message):
 🚀 Konkursda ishtirok etasizmi?
             """
             
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text="✅ Konkursda ishtirok etish", callback_data="join_contest")],
-                    [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_menu")]
-                ]
-            )
+            keyboard = get_contest_keyboard("not_joined")
         
         await message.answer(contest_text, reply_markup=keyboard, parse_mode="HTML")
 
@@ -155,13 +135,7 @@ async def join_contest(callback: CallbackQuery):
     """Konkursga ro'yxatdan o'tish"""
     async for db in get_db():
         # Faol konkursni topish
-        contest_result = await db.execute(
-            select(Contest).where(
-                Contest.is_active == True,
-                Contest.end_date > datetime.utcnow()
-            )
-        )
-        active_contest = contest_result.scalar_one_or_none()
+        active_contest = await get_active_contest(db)
         
         if not active_contest:
             await callback.answer("❌ Faol konkurs topilmadi!", show_alert=True)
@@ -190,6 +164,7 @@ async def join_contest(callback: CallbackQuery):
         )
         
         db.add(new_participant)
+        await leaderboard_move(db, active_contest.id, None, 0)
         await db.commit()
         
         # Referal link berish
@@ -218,13 +193,7 @@ async def contest_statistics(callback: CallbackQuery):
     """Foydalanuvchining konkurs statistikasi"""
     async for db in get_db():
         # Faol konkurs va ishtirokchi ma'lumotlari
-        contest_result = await db.execute(
-            select(Contest).where(
-                Contest.is_active == True,
-                Contest.end_date > datetime.utcnow()
-            )
-        )
-        active_contest = contest_result.scalar_one_or_none()
+        active_contest = await get_active_contest(db)
         
         if not active_contest:
             await callback.answer("❌ Faol konkurs yo'q!", show_alert=True)
@@ -244,22 +213,9 @@ async def contest_statistics(callback: CallbackQuery):
             await callback.answer("❌ Siz konkursda ishtirok etmayapsiz!", show_alert=True)
             return
         
-        # Umumiy ishtirokchilar soni
-        total_participants = await db.scalar(
-            select(func.count(ContestParticipant.id)).where(
-                ContestParticipant.contest_id == active_contest.id
-            )
-        )
-        
-        # Raqam olganlar soni
-        qualified_participants = await db.scalar(
-            select(func.count(ContestParticipant.id)).where(
-                and_(
-                    ContestParticipant.contest_id == active_contest.id,
-                    ContestParticipant.contest_number.isnot(None)
-                )
-            )
-        )
+        # Umumiy ishtirokchilar, raqam olganlar va o'rin (reyting jadvalidan)
+        counts = await get_contest_counts(db, active_contest.id)
+        rank = await get_contest_rank(db, active_contest.id, participant.referrals_completed)
         
         days_left = (active_contest.end_date - datetime.utcnow()).days
         hours_left = (active_contest.end_date - datetime.utcnow()).seconds // 3600
@@ -274,21 +230,17 @@ async def contest_statistics(callback: CallbackQuery):
 👤 <b>Sizning natijangiz:</b>
 👥 Referallar: <b>{participant.referrals_completed}/5</b>
 🎯 Raqamingiz: <b>{number_text}</b>
+🏅 O'rningiz: <b>{rank}</b>
 
 📈 <b>Umumiy ma'lumot:</b>
-🏆 Jami ishtirokchilar: <b>{total_participants}</b>
-🎲 Raqam olganlar: <b>{qualified_participants}</b>
+🏆 Jami ishtirokchilar: <b>{counts["participants"]}</b>
+🎲 Raqam olganlar: <b>{counts["qualified"]}</b>
 ⏰ Qolgan vaqt: <b>{days_left} kun {hours_left} soat</b>
 
 {result_text}
         """
         
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text="🔗 Referal link", callback_data="get_referral_link")],
-                [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_contest")]
-            ]
-        )
+        keyboard = get_contest_keyboard("stats")
         
         await callback.message.edit_text(stats_text, reply_markup=keyboard, parse_mode="HTML")
 
@@ -299,100 +251,229 @@ async def back_to_contest(callback: CallbackQuery):
     await contest_menu(callback.message)
     await callback.answer()
 
+# Raqam olish uchun kerakli referallar soni
+REQUIRED_REFERRALS = 5
+
+# Bo'sh raqamni tanlash va band qilish (eligible CTE da qator bo'lsa). Raqam bo'sh
+# raqamlar oralig'idagi tasodifiy nuqtadan keyingi birinchi bo'sh qator sifatida
+# (ix_contest_numbers_free_id indeksi bo'yicha O(log n)) olinadi, boshqa
+# tranzaksiya band qilayotgan qatorlar SKIP LOCKED bilan o'tkazib yuboriladi.
+PICK_NUMBER_CTE = """
+    picked AS (
+        SELECT id FROM contest_numbers
+        WHERE contest_id = :contest_id AND user_id IS NULL
+          AND EXISTS (SELECT 1 FROM eligible)
+          AND id >= CASE WHEN :use_pivot THEN (
+              SELECT min(id) + floor(random() * (max(id) - min(id) + 1))::int
+              FROM contest_numbers
+              WHERE contest_id = :contest_id AND user_id IS NULL
+          ) ELSE 0 END
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ),
+    taken AS (
+        UPDATE contest_numbers
+        SET user_id = :user_id, assigned_at = :now
+        WHERE id IN (SELECT id FROM picked)
+        RETURNING number_value
+    )"""
+
+# Shartni bajargan ishtirokchiga raqam berish - bitta so'rovda. Ishtirokchi qatori
+# FOR UPDATE bilan bloklanadi, shuning uchun bitta foydalanuvchi uchun parallel
+# chaqiruvlardan faqat bittasi raqam oladi.
+ASSIGN_NUMBER_SQL = text(f"""
+    WITH participant AS (
+        SELECT id, referrals_completed FROM contest_participants
+        WHERE user_id = :user_id AND contest_id = :contest_id
+          AND contest_number IS NULL AND referrals_completed >= :required
+        LIMIT 1
+        FOR UPDATE
+    ),
+    eligible AS (
+        SELECT 1 FROM participant
+    ),
+    {PICK_NUMBER_CTE},
+    leaderboard AS (
+        INSERT INTO contest_leaderboard (contest_id, referrals, participants, qualified)
+        SELECT :contest_id, referrals_completed, 0, 1
+        FROM participant
+        WHERE EXISTS (SELECT 1 FROM taken)
+        ON CONFLICT (contest_id, referrals)
+        DO UPDATE SET qualified = contest_leaderboard.qualified + 1
+    )
+    UPDATE contest_participants
+    SET contest_number = taken.number_value, number_assigned_at = :now, is_qualified = true
+    FROM taken, participant
+    WHERE contest_participants.id = participant.id
+    RETURNING contest_participants.contest_number
+""")
+
+# Referal hisobini oshirish, reytingni yangilash va shart bajarilsa raqam berish -
+# bitta so'rovda. Ishtirokchi qatori FOR UPDATE bilan bloklanadi: parallel
+# referallar navbat bilan bajariladi va har biri oxirgi qiymatni oshiradi.
+# Reyting qatorlari doim kattaroq referallar sonidan boshlab bloklanadi
+# (moved_in, so'ng moved_out). Reyting qatorlari UPSERT bilan yangilanadi: oddiy
+# UPDATE so'rov boshlangandan keyin boshqa tranzaksiya yaratgan qatorni ko'rmaydi.
+INCREMENT_REFERRAL_SQL = text(f"""
+    WITH participant AS (
+        SELECT id, referrals_completed FROM contest_participants
+        WHERE user_id = :user_id AND contest_id = :contest_id
+          AND contest_number IS NULL
+        LIMIT 1
+        FOR UPDATE
+    ),
+    eligible AS (
+        SELECT 1 FROM participant WHERE referrals_completed + 1 >= :required
+    ),
+    {PICK_NUMBER_CTE},
+    bumped AS (
+        UPDATE contest_participants
+        SET referrals_completed = participant.referrals_completed + 1,
+            contest_number = (SELECT number_value FROM taken),
+            number_assigned_at = CASE WHEN EXISTS (SELECT 1 FROM taken) THEN CAST(:now AS TIMESTAMP) END,
+            is_qualified = EXISTS (SELECT 1 FROM taken)
+        FROM participant
+        WHERE contest_participants.id = participant.id
+        RETURNING contest_participants.referrals_completed, contest_participants.contest_number
+    ),
+    moved_in AS (
+        INSERT INTO contest_leaderboard (contest_id, referrals, participants, qualified)
+        SELECT :contest_id, referrals_completed, 1, CASE WHEN contest_number IS NULL THEN 0 ELSE 1 END
+        FROM bumped
+        ON CONFLICT (contest_id, referrals)
+        DO UPDATE SET participants = contest_leaderboard.participants + 1,
+                      qualified = contest_leaderboard.qualified + EXCLUDED.qualified
+    ),
+    moved_out AS (
+        INSERT INTO contest_leaderboard (contest_id, referrals, participants, qualified)
+        SELECT :contest_id, referrals_completed - 1, -1, 0
+        FROM bumped
+        ON CONFLICT (contest_id, referrals)
+        DO UPDATE SET participants = contest_leaderboard.participants - 1
+    )
+    SELECT referrals_completed, contest_number FROM bumped
+""")
+
+async def assign_contest_number(db: AsyncSession, contest_id: int, user_id: int):
+    """
+    Shartni bajargan ishtirokchiga tasodifiy bo'sh raqamni atomik berish
+    Returns: raqam yoki None (shart bajarilmagan, raqam bor yoki bo'sh raqam qolmagan)
+    """
+    params = {
+        "user_id": user_id,
+        "contest_id": contest_id,
+        "required": REQUIRED_REFERRALS,
+        "now": datetime.utcnow()
+    }
+    # Tasodifiy nuqtadan keyingi bo'sh raqamlarni boshqa tranzaksiyalar band qilayotgan
+    # bo'lsa, ikkinchi urinishda butun oraliqdan qidiriladi
+    for use_pivot in (True, False):
+        number = await db.scalar(ASSIGN_NUMBER_SQL, {**params, "use_pivot": use_pivot})
+        if number is not None:
+            await db.commit()
+            return number
+    await db.rollback()
+    return None
+
 async def check_and_assign_number(user_id: int, db: AsyncSession):
     """5 ta referal to'planganda raqam berish"""
     # Faol konkursni topish
-    contest_result = await db.execute(
-        select(Contest).where(
-            Contest.is_active == True,
-            Contest.end_date > datetime.utcnow()
-        )
-    )
-    active_contest = contest_result.scalar_one_or_none()
+    active_contest = await get_active_contest(db)
     
     if not active_contest:
         return False
     
-    # Ishtirokchini topish
-    participant_result = await db.execute(
-        select(ContestParticipant).where(
-            and_(
-                ContestParticipant.user_id == user_id,
-                ContestParticipant.contest_id == active_contest.id
-            )
-        )
-    )
-    participant = participant_result.scalar_one_or_none()
-    
-    if not participant or participant.contest_number:
-        return False
+    contest_number = await assign_contest_number(db, active_contest.id, user_id)
+    return contest_number if contest_number is not None else False
+
+async def increment_referral(db: AsyncSession, contest_id: int, user_id: int):
+    """
+    Referal hisobini atomik oshirish va 5 ta bo'lsa raqam berish
+    Returns: shu referal bilan berilgan konkurs raqami yoki None
+    """
+    params = {
+        "user_id": user_id,
+        "contest_id": contest_id,
+        "required": REQUIRED_REFERRALS,
+        "now": datetime.utcnow()
+    }
+    row = (await db.execute(INCREMENT_REFERRAL_SQL, {**params, "use_pivot": True})).first()
     
-    # 5 ta referal to'pladimi tekshirish
-    if participant.referrals_completed >= 5:
-        # Bo'sh raqam topish
-        available_number_result = await db.execute(
-            select(ContestNumber).where(
-                and_(
-                    ContestNumber.contest_id == active_contest.id,
-                    ContestNumber.user_id.is_(None)
-                )
-            ).limit(1000)
-        )
-        available_numbers = available_number_result.scalars().all()
-        
-        if available_numbers:
-            # Tasodifiy raqam tanlash
-            chosen_number = random.choice(available_numbers)
-            
-            # Raqamni tayinlash
-            chosen_number.user_id = user_id
-            chosen_number.assigned_at = datetime.utcnow()
-            
-            # Ishtirokchiga raqamni berish
-            participant.contest_number = chosen_number.number_value
-            participant.number_assigned_at = datetime.utcnow()
-            participant.is_qualified = True
-            
-            await db.commit()
-            return chosen_number.number_value
+    # Ishtirokchi emas yoki raqami allaqachon bor
+    if row is None:
+        await db.commit()
+        return None
     
-    return False
+    contest_number = row.contest_number
+    if contest_number is None and row.referrals_completed >= REQUIRED_REFERRALS:
+        # Tasodifiy nuqtadan keyingi bo'sh raqamlar band bo'lgan bo'lsa - butun oraliqdan.
+        # Shu tranzaksiyada: ishtirokchi qatori hali bloklangan, hisob 5 da qoladi
+        contest_number = await db.scalar(ASSIGN_NUMBER_SQL, {**params, "use_pivot": False})
+    await db.commit()
+    return contest_number
 
 async def increment_contest_referral(referrer_id: int, db: AsyncSession):
     """Konkurs uchun referal hisobini oshirish"""
     # Faol konkursni topish
-    contest_result = await db.execute(
-        select(Contest).where(
-            Contest.is_active == True,
-            Contest.end_date > datetime.utcnow()
-        )
-    )
-    active_contest = contest_result.scalar_one_or_none()
+    active_contest = await get_active_contest(db)
     
     if not active_contest:
+        return None
+    
+    return await increment_referral(db, active_contest.id, referrer_id)
+
+@router.message(F.text.startswith("/create_contest"))
+async def create_contest_command(message: Message):
+    """Yangi konkurs yaratish komandasi (faqat adminlar uchun)"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Sizda bu komandani ishlatish huquqi yo'q!")
         return
     
-    # Ishtirokchini topish
-    participant_result = await db.execute(
-        select(ContestParticipant).where(
-            and_(
-                ContestParticipant.user_id == referrer_id,
-                ContestParticipant.contest_id == active_contest.id
-            )
-        )
+    usage = (
+        "❌ Noto'g'ri format!\n\n"
+        "To'g'ri format:\n"
+        "/create_contest [kunlar] [boshi-oxiri] [seed=N] [nomi]\n\n"
+        "Misol: /create_contest 30 1-1000 Referal konkurs"
     )
-    participant = participant_result.scalar_one_or_none()
     
-    if participant and not participant.contest_number:
-        participant.referrals_completed += 1
-        await db.commit()
+    try:
+        # Komanda formati: /create_contest 30 1-1000 seed=42 Referal konkurs
+        parts = message.text.split(maxsplit=3)
+        if len(parts) < 4:
+            await message.answer(usage)
+            return
         
-        # 5 ta to'plansa raqam berish
-        if participant.referrals_completed >= 5:
-            contest_number = await check_and_assign_number(referrer_id, db)
-            return contest_number
-    
-    return None
+        days = int(parts[1])
+        number_start, number_end = (int(value) for value in parts[2].split("-", 1))
+        title = parts[3]
+        seed = None
+        if title.startswith("seed="):
+            seed_part, _, title = title.partition(" ")
+            seed = int(seed_part[len("seed="):])
+        
+        async for db in get_db():
+            contest = await create_contest(
+                db, title, days=days,
+                number_start=number_start, number_end=number_end, seed=seed
+            )
+        
+        await message.answer(
+            f"✅ <b>KONKURS YARATILDI!</b>\n\n"
+            f"🏆 {contest['title']} (#{contest['contest_id']})\n"
+            f"🎲 Raqamlar: {contest['number_start']}-{contest['number_end']} "
+            f"({format_number(contest['numbers'])} ta, seed={contest['seed']})\n"
+            f"📅 Tugash vaqti: {contest['end_date'].strftime('%d.%m.%Y %H:%M')}",
+            parse_mode="HTML"
+        )
+        
+    except ContestError as e:
+        await message.answer(f"❌ {e}")
+    except ValueError:
+        await message.answer(usage)
+    except Exception as e:
+        await message.answer(f"❌ Xatolik: {e}")
+        print(f"Create contest error: {e}")
 
 @router.message(F.text.startswith("/announce_winners"))
 async def announce_winners_command(message: Message):
@@ -419,13 +500,7 @@ async def announce_winners_command(message: Message):
         
         async for db in get_db():
             # Faol konkursni topish
-            contest_result = await db.execute(
-                select(Contest).where(
-                    Contest.is_active == True,
-                    Contest.end_date > datetime.utcnow()
-                )
-            )
-            active_contest = contest_result.scalar_one_or_none()
+            active_contest = await get_active_contest(db)
             
             if not active_contest:
                 await message.answer("❌ Faol konkurs topilmadi!")
@@ -459,15 +534,6 @@ async def announce_winners_command(message: Message):
                 elif participant.contest_number == winner_3_number:
                     winner_3 = (participant, user)
             
-            # Konkursni tugatish
-            active_contest.winner_1 = winner_1[1].telegram_id if winner_1 else None
-            active_contest.winner_2 = winner_2[1].telegram_id if winner_2 else None
-            active_contest.winner_3 = winner_3[1].telegram_id if winner_3 else None
-            active_contest.winners_announced = True
-            active_contest.is_active = False
-            
-            await db.commit()
-            
             # G'oliblarni e'lon qilish xabari
             winner_1_name = winner_1[1].first_name if winner_1 else 'N/A'
             winner_2_name = winner_2[1].first_name if winner_2 else 'N/A'
@@ -488,24 +554,32 @@ async def announce_winners_command(message: Message):
 🎊 Tabriklaymiz! Mukofotlar admin tomonidan beriladi.
             """
             
-            # Barcha ishtirokchilarga e'lon yuborish
-            all_participants_result = await db.execute(
-                select(ContestParticipant)
-                .where(ContestParticipant.contest_id == active_contest.id)
+            # E'lon broadcasti konkursni yakunlash bilan bitta tranzaksiyada saqlanadi:
+            # konkurs yakunlangan deb belgilansa, e'lon ham albatta navbatda bo'ladi
+            broadcast = await create_broadcast(
+                db, winner_announcement, f"contest:{active_contest.id}",
+                notify_chat_id=message.chat.id
             )
-            all_participants = all_participants_result.scalars().all()
             
-            sent_count = 0
-            for participant in all_participants:
-                try:
-                    await message.bot.send_message(
-                        chat_id=participant.user_id,
-                        text=winner_announcement,
-                        parse_mode="HTML"
-                    )
-                    sent_count += 1
-                except:
-                    pass
+            # Konkursni tugatish
+            finished = await finish_contest(
+                db, active_contest.id,
+                winner_1[1].telegram_id if winner_1 else None,
+                winner_2[1].telegram_id if winner_2 else None,
+                winner_3[1].telegram_id if winner_3 else None
+            )
+            if not finished:
+                await message.answer("❌ Konkurs allaqachon yakunlangan!")
+                return
+            
+            # Barcha ishtirokchilarga fon rejimida yuboriladi (tezlik cheklovi bilan),
+            # yakuniy hisob shu chatga keladi
+            job = dispatch_broadcast(broadcast, message.bot) if broadcast else None
+            delivery_text = (
+                f"📨 E'lon fon rejimida yuborilmoqda: {job.total} ta ishtirokchiga (#{job.id})\n"
+                f"📊 Natija yuborish tugagach shu yerga keladi"
+                if job else "📨 E'lon yuboriladigan ishtirokchilar yo'q"
+            )
             
             # Adminga natija
             admin_result = f"""
@@ -516,7 +590,7 @@ async def announce_winners_command(message: Message):
 🥈 {winner_2[1].first_name} (#{winner_2_number})  
 🥉 {winner_3[1].first_name} (#{winner_3_number})
 
-📊 Xabar yuborildi: {sent_count} ta ishtirokchiga
+{delivery_text}
 
 💡 Endi mukofotlarni qo'lda bering!
             """
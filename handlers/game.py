@@ -1,13 +1,16 @@
 import random
+from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
-from sqlalchemy import select
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
-from models import User, SpinResult, Transaction
 from keyboards import get_spin_keyboard
-from utils import calculate_spin_result, format_number, get_spin_emoji
+from utils import calculate_spin_result, get_spin_emoji
+from messages import render_game_menu, render_spin_result
+from utils_cache import get_user_profile, cache_user_profile, invalidate_user
+from write_behind import spin_writer
 
 router = Router()
 
@@ -15,24 +18,13 @@ router = Router()
 async def game_menu(message: Message):
     """O'yin menyusi"""
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Xatolik yuz berdi. /start tugmasini bosing.")
             return
         
-        free_spins_text = f" | 🎁 Bepul: {user.free_spins}" if user.free_spins > 0 else ""
-        
-        game_text = f"""
-🎰 <b>O'YIN</b> 🎰
-
-💰 <b>Balans:</b> {format_number(user.stars)} ⭐{free_spins_text}
-
-🍀 <b>Omadingizni sinab ko'ring!</b>
-        """
+        game_text = render_game_menu(user.stars, user.free_spins)
         
         game_msg = await message.answer(
             game_text,
@@ -45,6 +37,155 @@ async def game_menu(message: Message):
             game_menu.game_messages = {}
         game_menu.game_messages[user.telegram_id] = game_msg.message_id
 
+# Spin hisob-kitobi: balans, spin tarixi, yutuq tranzaksiyasi va statistika
+# bitta so'rovda. UPDATE faqat foydalanuvchi holati natija hisoblangan
+# paytdagidek bo'lsa bajariladi, aks holda hech qaysi qator o'zgarmaydi.
+SETTLED_CTE = """
+    settled AS (
+        UPDATE users
+        SET free_spins = free_spins - CASE WHEN :use_free_spin THEN 1 ELSE 0 END,
+            stars = stars - CASE WHEN :use_free_spin THEN 0 ELSE :bet_amount END + :win_amount,
+            total_won = total_won + :win_amount
+        WHERE telegram_id = :user_id
+          AND total_deposited = :seen_total_deposited
+          AND total_won = :seen_total_won
+          AND CASE WHEN :use_free_spin THEN free_spins > 0
+                   ELSE free_spins <= 0 AND stars >= :bet_amount END
+        RETURNING *
+    )"""
+
+HISTORY_CTE = """
+    spin AS (
+        INSERT INTO spin_results (user_id, bet_amount, win_amount, spin_result, multiplier, created_at)
+        SELECT telegram_id, :bet_amount, :win_amount, :result_type, :multiplier, :now FROM settled
+    ),
+    win_transaction AS (
+        INSERT INTO transactions (user_id, transaction_type, amount, description, created_at)
+        SELECT telegram_id, 'win', :win_amount, :description, :now FROM settled
+        WHERE :win_amount > 0
+    )"""
+
+# Hisoblagich qatori bo'lmasa shu spin bilan yaratiladi (UPSERT) - spin hech
+# qachon qatorning oldindan mavjud bo'lishiga bog'liq emas
+STATS_CTE = """
+    stats AS (
+        INSERT INTO user_stats (user_id, total_spins, won_spins, biggest_win, updated_at)
+        SELECT telegram_id, 1, CASE WHEN :win_amount > 0 THEN 1 ELSE 0 END, :win_amount, :now
+        FROM settled
+        ON CONFLICT (user_id) DO UPDATE
+        SET total_spins = user_stats.total_spins + 1,
+            won_spins = user_stats.won_spins + EXCLUDED.won_spins,
+            biggest_win = GREATEST(user_stats.biggest_win, EXCLUDED.biggest_win),
+            updated_at = EXCLUDED.updated_at
+    )"""
+
+SETTLE_SPIN_SQL = text(f"WITH {SETTLED_CTE}, {HISTORY_CTE}, {STATS_CTE} SELECT * FROM settled")
+
+# Write-behind rejimi: tarix qatorlari spin_writer orqali keyinroq yoziladi
+SETTLE_SPIN_BALANCE_SQL = text(f"WITH {SETTLED_CTE}, {STATS_CTE} SELECT * FROM settled")
+
+# Parallel spinlar foydalanuvchi holatini o'zgartirib qo'ysa, qayta urinishlar soni
+SETTLE_SPIN_ATTEMPTS = 5
+
+async def settle_spin(db: AsyncSession, snapshot, bet_amount: int, use_free_spin: bool, outcome):
+    """
+    Spin natijasini bitta UPDATE ... RETURNING bilan saqlash
+    Returns: yangilangan users qatori yoki holat o'zgargan bo'lsa None
+    """
+    win_amount, result_type, multiplier, symbols = outcome
+    now = datetime.utcnow()
+    description = f"O'yinda yutildi: {win_amount} ⭐ (x{multiplier:.2f})"
+
+    result = await db.execute(
+        SETTLE_SPIN_BALANCE_SQL if spin_writer.enabled else SETTLE_SPIN_SQL,
+        {
+            "user_id": snapshot.telegram_id,
+            "use_free_spin": use_free_spin,
+            "bet_amount": bet_amount,
+            "win_amount": win_amount,
+            "result_type": result_type,
+            "multiplier": multiplier,
+            "description": description,
+            "seen_total_deposited": snapshot.total_deposited,
+            "seen_total_won": snapshot.total_won,
+            "now": now
+        }
+    )
+    row = result.first()
+    await db.commit()
+
+    if row and spin_writer.enabled:
+        await spin_writer.add(
+            {
+                "user_id": snapshot.telegram_id,
+                "bet_amount": bet_amount,
+                "win_amount": win_amount,
+                "spin_result": result_type,
+                "multiplier": multiplier,
+                "created_at": now
+            },
+            {
+                "user_id": snapshot.telegram_id,
+                "transaction_type": "win",
+                "amount": win_amount,
+                "description": description,
+                "created_at": now
+            } if win_amount > 0 else None
+        )
+
+    return row
+
+async def play_spin(db: AsyncSession, user_id: int, bet_amount: int) -> dict:
+    """
+    Spin o'ynash: holatni o'qish, natijani hisoblash va atomik saqlash
+    Returns: {"status": "ok" | "not_found" | "no_balance" | "busy", ...}
+    """
+    fresh = False
+    for _ in range(SETTLE_SPIN_ATTEMPTS):
+        # Foydalanuvchi holati (keshdan, natijani hisoblash uchun)
+        snapshot = await get_user_profile(db, user_id)
+
+        if not snapshot:
+            return {"status": "not_found"}
+
+        # Bepul spin yoki oddiy spin tekshiruvi
+        use_free_spin = snapshot.free_spins > 0
+        if not use_free_spin and snapshot.stars < bet_amount:
+            if fresh:
+                return {"status": "no_balance", "stars": snapshot.stars}
+            # Kesh eskirgan bo'lishi mumkin - bazadan qayta tekshirish
+            invalidate_user(user_id)
+            fresh = True
+            continue
+
+        # Spin natijasini hisoblash (foydalanuvchi statistikasi bilan)
+        outcome = calculate_spin_result(
+            bet_amount,
+            snapshot.total_deposited,
+            snapshot.total_won
+        )
+
+        settled = await settle_spin(db, snapshot, bet_amount, use_free_spin, outcome)
+        if settled:
+            cache_user_profile(settled)
+            win_amount, result_type, multiplier, symbols = outcome
+            return {
+                "status": "ok",
+                "win_amount": win_amount,
+                "result_type": result_type,
+                "multiplier": multiplier,
+                "symbols": symbols,
+                "used_free_spin": use_free_spin,
+                "stars": settled.stars,
+                "free_spins": settled.free_spins
+            }
+
+        # Holat boshqa spin tomonidan o'zgartirilgan - bazadan qayta o'qish
+        invalidate_user(user_id)
+        fresh = True
+
+    return {"status": "busy"}
+
 @router.callback_query(F.data.startswith("spin_"))
 async def process_spin(callback: CallbackQuery):
     """Spin jarayoni"""
@@ -52,79 +193,36 @@ async def process_spin(callback: CallbackQuery):
         bet_amount = int(callback.data.split("_")[1])
         
         async for db in get_db():
-            # Foydalanuvchini topish
-            result = await db.execute(
-                select(User).where(User.telegram_id == callback.from_user.id)
-            )
-            user = result.scalar_one_or_none()
+            spin = await play_spin(db, callback.from_user.id, bet_amount)
             
-            if not user:
+            if spin["status"] == "not_found":
                 await callback.answer("❌ Foydalanuvchi topilmadi", show_alert=True)
                 return
             
-            # Bepul spin yoki oddiy spin tekshiruvi
-            using_free_spin = False
-            if user.free_spins > 0:
-                using_free_spin = True
-            elif user.stars < bet_amount:
+            if spin["status"] == "no_balance":
                 await callback.answer(
                     f"❌ Balansda yetarli yulduz yo'q!\n"
                     f"Kerak: {bet_amount} ⭐\n"
-                    f"Mavjud: {user.stars} ⭐",
+                    f"Mavjud: {spin['stars']} ⭐",
                     show_alert=True
                 )
                 return
             
-            # Spin natijasini hisoblash (foydalanuvchi statistikasi bilan)
-            win_amount, result_type, multiplier, symbols = calculate_spin_result(
-                bet_amount, 
-                user.total_deposited, 
-                user.total_won
-            )
-            
-            # Balansni yangilash
-            if using_free_spin:
-                user.free_spins -= 1  # Bepul spinni kamaytirish
-            else:
-                user.stars -= bet_amount  # Oddiy to'lov
-            
-            if result_type == "win":
-                user.stars += win_amount
-                user.total_won += win_amount
-            
-            # Spin natijasini saqlash
-            spin_result = SpinResult(
-                user_id=user.telegram_id,
-                bet_amount=bet_amount,
-                win_amount=win_amount,
-                spin_result=result_type,
-                multiplier=multiplier
-            )
-            
-            # Tranzaksiyani saqlash
-            if result_type == "win":
-                transaction = Transaction(
-                    user_id=user.telegram_id,
-                    transaction_type="win",
-                    amount=win_amount,
-                    description=f"O'yinda yutildi: {win_amount} ⭐ (x{multiplier:.2f})"
-                )
-                db.add(transaction)
-            
-            db.add(spin_result)
-            await db.commit()
+            if spin["status"] == "busy":
+                await callback.answer("⏳ Oldingi spin hali tugamadi, qayta urinib ko'ring")
+                return
             
             # Natijani ko'rsatish
             await show_spin_result(
                 callback, 
                 bet_amount, 
-                win_amount, 
-                result_type, 
-                multiplier, 
-                user.stars,
-                symbols,
-                using_free_spin,
-                user.free_spins
+                spin["win_amount"], 
+                spin["result_type"], 
+                spin["multiplier"], 
+                spin["stars"],
+                spin["symbols"],
+                spin["used_free_spin"],
+                spin["free_spins"]
             )
             
     except Exception as e:
@@ -134,36 +232,10 @@ async def process_spin(callback: CallbackQuery):
 async def show_spin_result(callback, bet_amount, win_amount, result_type, multiplier, new_balance, symbols, was_free_spin=False, remaining_free_spins=0):
     """Spin natijasini chiroyli ko'rsatish"""
     
-    # Animatsiyali spin natijasi
-    symbols_display = f"🎰 【 {symbols[0]} 】【 {symbols[1]} 】【 {symbols[2]} 】 🎰"
-    
-    spin_cost_text = "🎁 Bepul spin ishlatildi" if was_free_spin else f"💸 Narx: {bet_amount} ⭐"
-    free_spins_text = f"\n🎁 Qolgan bepul spinlar: {remaining_free_spins}" if remaining_free_spins > 0 else ""
-    
-    if result_type == "win":
-        # Yutish natijasi - faqat zarur ma'lumotlar
-        result_text = f"""
-🎰 <b>O'YIN</b> 🎰
-
-💰 <b>Balans:</b> {format_number(new_balance)} ⭐
-
-{symbols_display}
-
-🎉 <b>YUTDINGIZ!</b> +{win_amount} ⭐
-{spin_cost_text}{free_spins_text}
-        """
-    else:
-        # Yutqazish natijasi - faqat zarur ma'lumotlar
-        result_text = f"""
-🎰 <b>O'YIN</b> 🎰
-
-💰 <b>Balans:</b> {format_number(new_balance)} ⭐
-
-{symbols_display}
-
-😔 <b>Yutqazdingiz</b>
-{spin_cost_text}{free_spins_text}
-        """
+    result_text = render_spin_result(
+        bet_amount, win_amount, result_type, new_balance, symbols,
+        was_free_spin, remaining_free_spins
+    )
     
     await callback.message.edit_text(
         result_text,
@@ -176,24 +248,13 @@ async def show_spin_result(callback, bet_amount, win_amount, result_type, multip
 async def spin_again(callback: CallbackQuery):
     """Yana spin qilish"""
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, callback.from_user.id)
         
         if not user:
             await callback.answer("❌ Foydalanuvchi topilmadi", show_alert=True)
             return
         
-        free_spins_text = f" | 🎁 Bepul: {user.free_spins}" if user.free_spins > 0 else ""
-        
-        game_text = f"""
-🎰 <b>O'YIN</b> 🎰
-
-💰 <b>Balans:</b> {format_number(user.stars)} ⭐{free_spins_text}
-
-🍀 <b>Omadingizni sinab ko'ring!</b>
-        """
+        game_text = render_game_menu(user.stars, user.free_spins)
         
         await callback.message.edit_text(
             game_text,
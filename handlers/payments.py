@@ -1,14 +1,13 @@
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, LabeledPrice, PreCheckoutQuery
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
-from models import User, Transaction
 from handlers.referral import process_referral_bonus
 from keyboards import get_star_purchase_keyboard
 from config import STAR_PACKAGES, PAYMENT_PROVIDER_TOKEN
 from utils import format_number, generate_transaction_id
+from utils_cache import invalidate_user
+from utils_payments import credit_payment, is_payment_recorded
 from utils_subscription import check_subscription, get_subscription_message, get_subscription_keyboard
 
 router = Router()
@@ -113,35 +112,29 @@ async def successful_payment_handler(message: Message):
         transaction_id = payload_parts[2]
         
         async for db in get_db():
-            # Foydalanuvchini topish
-            result = await db.execute(
-                select(User).where(User.telegram_id == message.from_user.id)
+            # Jurnalga yozish va balansni oshirish (takroriy update hech narsa o'zgartirmaydi)
+            credited = await credit_payment(
+                db,
+                user_id=message.from_user.id,
+                charge_id=payment.telegram_payment_charge_id,
+                stars_amount=stars_amount,
+                total_amount=payment.total_amount,
+                currency=payment.currency,
+                invoice_payload=payment.invoice_payload
             )
-            user = result.scalar_one_or_none()
             
-            if not user:
-                await message.answer("❌ Foydalanuvchi topilmadi")
+            if not credited:
+                if await is_payment_recorded(db, payment.telegram_payment_charge_id):
+                    await message.answer("✅ Bu to'lov allaqachon hisobga olingan")
+                else:
+                    await message.answer("❌ Foydalanuvchi topilmadi")
                 return
             
-            # Balansni yangilash
-            user.stars += stars_amount
-            user.total_deposited += stars_amount
+            invalidate_user(message.from_user.id)
             
-            # Referal bonusini tekshirish va berish
-            if user.referrer_id:
-                await process_referral_bonus(user.referrer_id, user.telegram_id)
-            
-            # Tranzaksiyani saqlash
-            transaction = Transaction(
-                user_id=user.telegram_id,
-                transaction_type="purchase",
-                amount=stars_amount,
-                description=f"Yulduz sotib olish: {stars_amount} ⭐",
-                telegram_payment_id=payment.telegram_payment_charge_id
-            )
-            
-            db.add(transaction)
-            await db.commit()
+            # Referal bonusini tekshirish va berish (to'lov saqlangandan keyin)
+            if credited.referrer_id:
+                await process_referral_bonus(credited.referrer_id, message.from_user.id)
             
             success_text = f"""
 ✅ <b>TO'LOV MUVAFFAQIYATLI!</b>
@@ -153,7 +146,7 @@ async def successful_payment_handler(message: Message):
 💳 To'lov miqdori: {payment.total_amount} XTR
 📅 Sana: {message.date.strftime('%d.%m.%Y %H:%M')}
 
-⭐ <b>Yangi balans:</b> {format_number(user.stars)} yulduz
+⭐ <b>Yangi balans:</b> {format_number(credited.stars)} yulduz
 
 Endi o'yin o'ynashingiz mumkin! 🎰
             """
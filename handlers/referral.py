@@ -9,6 +9,7 @@ from models import User
 from config import ADMIN_IDS
 from keyboards import get_main_menu_keyboard, get_referral_keyboard
 from utils import format_number
+from utils_cache import get_user_profile, invalidate_user
 from config import BOT_USERNAME
 
 router = Router()
@@ -17,10 +18,7 @@ router = Router()
 async def referral_menu(message: Message):
     """Referal menyu"""
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Xatolik yuz berdi. /start tugmasini bosing.")
@@ -64,10 +62,7 @@ async def referral_menu(message: Message):
 async def copy_referral_link(callback: CallbackQuery):
     """Referal linkni nusxalash"""
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, callback.from_user.id)
         
         if not user:
             await callback.answer("❌ Xatolik yuz berdi.", show_alert=True)
@@ -130,6 +125,7 @@ async def process_referral_bonus(referrer_id: int, new_user_id: int):
             )
             
             await db.commit()
+            invalidate_user(referrer_id)
             
             # Ma'lumotlarni yangilash
             await db.refresh(referrer)
@@ -1,6 +1,6 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import CommandStart, CommandObject
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
+from aiogram.filters import CommandStart, CommandObject, ChatMemberUpdatedFilter, KICKED, MEMBER
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -8,8 +8,15 @@ from database import get_db
 from models import User
 from keyboards import get_main_menu_keyboard
 from utils import get_user_rank, format_number
+from messages import render_balance
 from utils_captcha import get_captcha_message
-from utils_subscription import check_subscription, get_subscription_message, get_subscription_keyboard
+from utils_stats import get_user_spin_stats
+from utils_cache import get_user_profile, invalidate_user
+from utils_reachability import mark_reachable, mark_unreachable
+from utils_subscription import (
+    check_subscription, get_subscription_message, get_subscription_keyboard,
+    cache_subscription, is_required_channel, SUBSCRIBED_STATUSES
+)
 from config import ADMIN_IDS
 
 router = Router()
@@ -84,6 +91,7 @@ async def get_or_create_user(db: AsyncSession, telegram_user, referrer_id=None)
         user._is_new_user = True  # Yangi user ekanligini belgilash
         db.add(user)
         await db.commit()
+        invalidate_user(user.telegram_id)
     else:
         user._is_new_user = False
         await db.refresh(user)
@@ -163,28 +171,16 @@ async def show_main_menu(message: Message, user: User):
 async def balance_handler(message: Message):
     """Balansni ko'rsatish"""
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Xatolik yuz berdi. /start tugmasini bosing.")
             return
         
-        balance_text = f"""
-💰 <b>SIZNING BALANSIZNGIZ</b>
-
-⭐ Joriy balans: <b>{format_number(user.stars)} yulduz</b>
-💎 Daraja: <b>{get_user_rank(user.total_deposited)}</b>
-
-📊 <b>Statistika:</b>
-💰 Jami kiritgan: {format_number(user.total_deposited)} ⭐
-🎉 Jami yutgan: {format_number(user.total_won)} ⭐  
-💸 Jami chiqargan: {format_number(user.total_withdrawn)} ⭐
-
-💡 <b>Eslatma:</b> Minimal chiqarish miqdori 150 ⭐
-        """
+        balance_text = render_balance(
+            user.stars, get_user_rank(user.total_deposited),
+            user.total_deposited, user.total_won, user.total_withdrawn
+        )
         
         await message.answer(balance_text, parse_mode="HTML")
 
@@ -192,25 +188,14 @@ async def balance_handler(message: Message):
 async def stats_handler(message: Message):
     """Foydalanuvchi statistikasini ko'rsatish"""
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Xatolik yuz berdi. /start tugmasini bosing.")
             return
         
-        # O'yinlar statistikasi
-        from models import SpinResult
-        spins_result = await db.execute(
-            select(SpinResult).where(SpinResult.user_id == user.telegram_id)
-        )
-        spins = spins_result.scalars().all()
-        
-        total_spins = len(spins)
-        won_spins = len([s for s in spins if s.spin_result == "win"])
-        win_rate = (won_spins / total_spins * 100) if total_spins > 0 else 0
+        # O'yinlar statistikasi (hisoblagichlar jadvalidan)
+        spin_stats = await get_user_spin_stats(db, user.telegram_id)
         
         stats_text = f"""
 📊 <b>SIZNING STATISTIKANGIZ</b>
@@ -227,9 +212,10 @@ async def stats_handler(message: Message):
 💸 Jami chiqargan: {format_number(user.total_withdrawn)} yulduz
 
 🎰 <b>O'yin statistikasi:</b>
-🎯 Jami spinlar: {total_spins}
-🎉 Yutgan spinlar: {won_spins}
-📈 G'alaba foizi: {win_rate:.1f}%
+🎯 Jami spinlar: {spin_stats['total_spins']}
+🎉 Yutgan spinlar: {spin_stats['won_spins']}
+📈 G'alaba foizi: {spin_stats['win_rate']:.1f}%
+🏆 Eng katta yutuq: {format_number(spin_stats['biggest_win'])} ⭐
         """
         
         await message.answer(stats_text, parse_mode="HTML")
@@ -283,6 +269,7 @@ async def captcha_handler(callback: CallbackQuery):
                 # Captcha to'g'ri - obuna tekshirish
                 user.captcha_passed = True
                 await db.commit()
+                invalidate_user(user.telegram_id)
                 
                 # Obuna tekshirish
                 is_subscribed = await check_subscription(callback.bot, callback.from_user.id)
@@ -324,7 +311,8 @@ async def captcha_handler(callback: CallbackQuery):
 async def check_subscription_handler(callback: CallbackQuery):
     """Obunani tekshirish"""
     try:
-        is_subscribed = await check_subscription(callback.bot, callback.from_user.id)
+        # Foydalanuvchi hozirgina obuna bo'lgan bo'lishi mumkin - keshsiz tekshirish
+        is_subscribed = await check_subscription(callback.bot, callback.from_user.id, force=True)
         
         if is_subscribed:
             async for db in get_db():
@@ -375,3 +363,29 @@ async def back_to_menu(callback: CallbackQuery):
         reply_markup=get_main_menu_keyboard()
     )
     await callback.answer()
+
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def bot_blocked_handler(event: ChatMemberUpdated):
+    """Foydalanuvchi botni bloklaganda"""
+    try:
+        async for db in get_db():
+            await mark_unreachable(db, [event.from_user.id])
+            await db.commit()
+    except Exception as e:
+        print(f"Bot blocked update error: {e}")
+
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def bot_unblocked_handler(event: ChatMemberUpdated):
+    """Foydalanuvchi botni blokdan chiqarganda"""
+    try:
+        async for db in get_db():
+            await mark_reachable(db, event.from_user.id)
+            await db.commit()
+    except Exception as e:
+        print(f"Bot unblocked update error: {e}")
+
+@router.chat_member(F.chat.type == "channel")
+async def channel_member_handler(event: ChatMemberUpdated):
+    """Majburiy kanal a'zoligi o'zgarganda obuna keshini yangilash (bot kanal admini bo'lsa keladi)"""
+    if is_required_channel(event.chat):
+        cache_subscription(event.new_chat_member.user.id, event.new_chat_member.status in SUBSCRIBED_STATUSES)
@@ -2,14 +2,13 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
 from database import get_db
-from models import User
 from keyboards import get_main_menu_keyboard, get_support_keyboard
 from utils import format_number
+from utils_cache import get_user_profile
 from config import ADMIN_IDS
 
 router = Router()
@@ -21,10 +20,7 @@ class SupportStates(StatesGroup):
 async def support_menu(message: Message):
     """Yordam bo'limi"""
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Xatolik yuz berdi. /start tugmasini bosing.")
@@ -92,10 +88,7 @@ async def handle_user_message(message: Message, state: FSMContext):
         return
     
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Xatolik yuz berdi.")
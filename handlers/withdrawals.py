@@ -8,6 +8,7 @@ from database import get_db
 from models import User, Withdrawal
 from keyboards import get_withdrawal_keyboard
 from utils import format_number, validate_withdrawal_amount
+from utils_cache import get_user_profile, invalidate_user
 from config import MIN_WITHDRAWAL
 
 router = Router()
@@ -16,10 +17,7 @@ router = Router()
 async def withdrawal_menu(message: Message):
     """Pul yechish menyusi"""
     async for db in get_db():
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_profile(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Xatolik yuz berdi. /start tugmasini bosing.")
@@ -135,6 +133,7 @@ async def process_withdrawal(callback: CallbackQuery):
             
             db.add(withdrawal)
             await db.commit()
+            invalidate_user(user.telegram_id)
             await db.refresh(withdrawal)
             
             success_text = f"""
@@ -1,7 +1,16 @@
+"""
+Klaviaturalar registri
+
+aiogram markuplari o'zgarmas (frozen) pydantic obyektlar, shuning uchun
+statik klaviaturalar modul yuklanganda bir marta yaratiladi va har safar
+shu obyekt qaytariladi. Parametrli klaviaturalar (bepul spinlar soni,
+referal link) cheklangan LRU keshda saqlanadi.
+"""
+from functools import lru_cache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
-from config import STAR_PACKAGES
+from config import STAR_PACKAGES, KEYBOARD_CACHE_SIZE
 
-def get_main_menu_keyboard():
+def build_main_menu_keyboard():
     """Asosiy menyu klaviaturasi"""
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
@@ -16,7 +25,7 @@ def get_main_menu_keyboard():
     )
     return keyboard
 
-def get_star_purchase_keyboard():
+def build_star_purchase_keyboard():
     """Yulduz sotib olish klaviaturasi"""
     buttons = []
     for stars, price in STAR_PACKAGES.items():
@@ -30,8 +39,9 @@ def get_star_purchase_keyboard():
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_spin_keyboard(free_spins=0):
-    """Spin o'ynash klaviaturasi"""
+    """Spin o'ynash klaviaturasi (bepul spinlar soni bo'yicha keshlanadi)"""
     buttons = []
     
     if free_spins > 0:
@@ -43,7 +53,7 @@ def get_spin_keyboard(free_spins=0):
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
-def get_withdrawal_keyboard():
+def build_withdrawal_keyboard():
     """Pul yechish klaviaturasi"""
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -56,7 +66,7 @@ def get_withdrawal_keyboard():
     )
     return keyboard
 
-def get_support_keyboard():
+def build_support_keyboard():
     """Yordam bo'limi klaviaturasi"""
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -66,8 +76,9 @@ def get_support_keyboard():
     )
     return keyboard
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_referral_keyboard(referral_link):
-    """Referal bo'limi klaviaturasi"""
+    """Referal bo'limi klaviaturasi (link bo'yicha keshlanadi)"""
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(text="📋 Linkni nusxalash", callback_data="copy_referral_link")],
@@ -77,7 +88,7 @@ def get_referral_keyboard(referral_link):
     )
     return keyboard
 
-def get_admin_keyboard():
+def build_admin_keyboard():
     """Admin klaviaturasi"""
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
@@ -101,3 +112,65 @@ def get_withdrawal_approval_keyboard(withdrawal_id: int):
         ]
     )
     return keyboard
+
+def build_contest_keyboards():
+    """Konkurs bo'limi klaviaturalari (holat bo'yicha)"""
+    back_to_menu = [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_menu")]
+    return {
+        # Raqam olgan ishtirokchi
+        "has_number": InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📊 Mening statistikam", callback_data="contest_stats")],
+            [InlineKeyboardButton(text="🔗 Referal link", callback_data="get_referral_link")],
+            back_to_menu
+        ]),
+        # Raqam olmagan ishtirokchi
+        "in_progress": InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔗 Referal link olish", callback_data="get_referral_link")],
+            [InlineKeyboardButton(text="📊 Mening statistikam", callback_data="contest_stats")],
+            back_to_menu
+        ]),
+        # Konkursda ishtirok etmagan
+        "not_joined": InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="✅ Konkursda ishtirok etish", callback_data="join_contest")],
+            back_to_menu
+        ]),
+        # Konkurs statistikasi
+        "stats": InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔗 Referal link", callback_data="get_referral_link")],
+            [InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_contest")]
+        ])
+    }
+
+# Statik klaviaturalar - bir marta yaratiladi
+MAIN_MENU_KEYBOARD = build_main_menu_keyboard()
+STAR_PURCHASE_KEYBOARD = build_star_purchase_keyboard()
+WITHDRAWAL_KEYBOARD = build_withdrawal_keyboard()
+SUPPORT_KEYBOARD = build_support_keyboard()
+ADMIN_KEYBOARD = build_admin_keyboard()
+CONTEST_KEYBOARDS = build_contest_keyboards()
+
+def get_main_menu_keyboard():
+    return MAIN_MENU_KEYBOARD
+
+def get_star_purchase_keyboard():
+    return STAR_PURCHASE_KEYBOARD
+
+def get_withdrawal_keyboard():
+    return WITHDRAWAL_KEYBOARD
+
+def get_support_keyboard():
+    return SUPPORT_KEYBOARD
+
+def get_admin_keyboard():
+    return ADMIN_KEYBOARD
+
+def get_contest_keyboard(state: str):
+    """state: has_number, in_progress, not_joined, stats"""
+    return CONTEST_KEYBOARDS[state]
+
+def keyboard_cache_stats() -> dict:
+    """Parametrli klaviaturalar keshi"""
+    return {
+        func.__name__: func.cache_info()._asdict()
+        for func in (get_spin_keyboard, get_referral_keyboard)
+    }
@@ -0,0 +1,92 @@
+"""
+Tez-tez yuboriladigan xabarlar shablonlari
+
+Xabarlarning o'zgarmas qismlari modul yuklanganda bir marta quriladi.
+Takrorlanadigan bo'laklar (simvollar qatori, spin narxi, yutuq qatori,
+bepul spinlar) cheklangan LRU keshda saqlanadi. Render paytida faqat
+balans formatlanadi va tayyor bo'laklar bitta join bilan yig'iladi.
+"""
+from functools import lru_cache
+from utils import format_number
+from config import TEMPLATE_CACHE_SIZE
+
+# O'yin ekrani: sarlavha + balans qatori
+GAME_HEADER = "\n🎰 <b>O'YIN</b> 🎰\n\n💰 <b>Balans:</b> "
+GAME_MENU_FOOTER = "\n\n🍀 <b>Omadingizni sinab ko'ring!</b>\n        "
+
+# Spin natijasi: balansdan keyin simvollar, natija va narx
+SPIN_BALANCE_END = " ⭐\n\n"
+SPIN_LOSE_LINE = "\n\n😔 <b>Yutqazdingiz</b>\n"
+SPIN_FREE_COST = "🎁 Bepul spin ishlatildi"
+SPIN_FOOTER = "\n        "
+
+BALANCE_PARTS = (
+    "\n💰 <b>SIZNING BALANSIZNGIZ</b>\n\n⭐ Joriy balans: <b>",
+    " yulduz</b>\n💎 Daraja: <b>",
+    "</b>\n\n📊 <b>Statistika:</b>\n💰 Jami kiritgan: ",
+    " ⭐\n🎉 Jami yutgan: ",
+    " ⭐  \n💸 Jami chiqargan: ",
+    " ⭐\n\n💡 <b>Eslatma:</b> Minimal chiqarish miqdori 150 ⭐\n        "
+)
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def menu_free_spins(free_spins: int) -> str:
+    """O'yin menyusidagi bepul spinlar qismi"""
+    return f" ⭐ | 🎁 Bepul: {free_spins}" if free_spins > 0 else " ⭐"
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def symbols_line(first: str, second: str, third: str) -> str:
+    """Slot simvollari qatori"""
+    return f"🎰 【 {first} 】【 {second} 】【 {third} 】 🎰"
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def win_line(win_amount: int) -> str:
+    """Yutuq qatori"""
+    return f"\n\n🎉 <b>YUTDINGIZ!</b> +{win_amount} ⭐\n"
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def spin_cost(bet_amount: int) -> str:
+    """Pullik spin narxi"""
+    return f"💸 Narx: {bet_amount} ⭐"
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def remaining_free_spins_line(remaining_free_spins: int) -> str:
+    """Qolgan bepul spinlar qatori"""
+    return f"\n🎁 Qolgan bepul spinlar: {remaining_free_spins}" if remaining_free_spins > 0 else ""
+
+def render_game_menu(stars: int, free_spins: int) -> str:
+    """O'yin menyusi matni"""
+    return "".join((GAME_HEADER, format_number(stars), menu_free_spins(free_spins), GAME_MENU_FOOTER))
+
+def render_spin_result(bet_amount, win_amount, result_type, new_balance, symbols,
+                       was_free_spin=False, remaining_free_spins=0) -> str:
+    """Spin natijasi matni (yutish va yutqazish bitta shablonda)"""
+    return "".join((
+        GAME_HEADER,
+        format_number(new_balance),
+        SPIN_BALANCE_END,
+        symbols_line(*symbols),
+        win_line(win_amount) if result_type == "win" else SPIN_LOSE_LINE,
+        SPIN_FREE_COST if was_free_spin else spin_cost(bet_amount),
+        remaining_free_spins_line(remaining_free_spins),
+        SPIN_FOOTER
+    ))
+
+def render_balance(stars, rank, total_deposited, total_won, total_withdrawn) -> str:
+    """Balans xabari matni"""
+    head, rank_start, stats_start, won_start, withdrawn_start, footer = BALANCE_PARTS
+    return "".join((
+        head, format_number(stars),
+        rank_start, rank,
+        stats_start, format_number(total_deposited),
+        won_start, format_number(total_won),
+        withdrawn_start, format_number(total_withdrawn),
+        footer
+    ))
+
+def template_cache_stats() -> dict:
+    """Shablon bo'laklari keshi"""
+    return {
+        func.__name__: func.cache_info()._asdict()
+        for func in (menu_free_spins, symbols_line, win_line, spin_cost, remaining_free_spins_line)
+    }
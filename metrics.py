@@ -0,0 +1,227 @@
+"""
+Prometheus metrikalari (text exposition format)
+
+Handler, DB so'rov va Telegram API kechikishlari har bir jarayon ichida
+alohida yig'iladi. Tashqi kutubxonasiz - faqat Counter, Gauge va Histogram.
+
+Scrape manzillari (har bir jarayon o'z metrikalarini beradi):
+- admin panel: PORT dagi /metrics (webhook rejimida bot handlerlari ham shu yerda)
+- polling bot: BOT_METRICS_PORT dagi /metrics (handler, Bot API, shard navbatlari)
+- shard jarayonlari (supervisor, UPDATE_SHARD_PROCESSES): BOT_METRICS_PORT + 1 + shard
+"""
+import time
+from bisect import bisect_left
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for label_values, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labels, label_values)} {value}"
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, *label_values, value: float):
+        self.values[label_values] = value
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label qiymatlari -> [bucket hisoblagichlari, yig'indi, soni]
+        self.values = {}
+
+    def observe(self, *label_values, value: float):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ("le",)
+        for label_values, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{format_labels(names, label_values + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, label_values)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, label_values)} {count}"
+
+updates_total = Counter("bot_updates_total", "Qabul qilingan updatelar", ("update_type",))
+handler_duration = Histogram("bot_handler_duration_seconds", "Handler bajarilish vaqti", ("router", "handler"))
+handler_errors = Counter("bot_handler_errors_total", "Handlerdagi xatoliklar", ("router", "handler", "error"))
+db_query_duration = Histogram("db_query_duration_seconds", "DB so'rov vaqti", ("statement",))
+db_query_errors = Counter("db_query_errors_total", "DB so'rov xatoliklari", ("statement",))
+telegram_api_duration = Histogram("telegram_api_duration_seconds", "Telegram Bot API so'rov vaqti", ("method",))
+telegram_api_errors = Counter("telegram_api_errors_total", "Telegram Bot API xatoliklari", ("method", "error"))
+db_pool_checkout_duration = Histogram("db_pool_checkout_seconds", "Pooldan ulanish olishni kutish vaqti")
+
+REGISTRY = [
+    updates_total, handler_duration, handler_errors,
+    db_query_duration, db_query_errors, db_pool_checkout_duration,
+    telegram_api_duration, telegram_api_errors
+]
+
+def render(extra=()) -> str:
+    """Barcha metrikalarni Prometheus text formatida qaytarish"""
+    lines = []
+    for metric in list(REGISTRY) + list(extra):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def process_metrics() -> list:
+    """Shu jarayon holati: DB pool, keshlar, shard navbatlari va write-behind"""
+    # database/keshlar modullari metrics ni import qiladi - aylanma importdan qochish
+    from database import pool_stats
+    from utils_cache import user_cache
+    from utils_subscription import subscription_cache
+    from sharding import update_shards, process_shards
+    from write_behind import spin_writer
+
+    pool = pool_stats()
+    db_pool = Gauge("db_pool_connections", "DB pool ulanishlari", ("state",))
+    for state in ("checked_out", "checked_in", "overflow"):
+        db_pool.set(state, value=pool[state])
+    db_pool_events = Counter("db_pool_events_total", "DB pool hodisalari", ("event",))
+    for name in ("checkouts", "overflow_events", "timeouts"):
+        db_pool_events.inc(name, amount=pool[name])
+
+    cache_requests = Counter("cache_requests_total", "Kesh so'rovlari", ("cache", "result"))
+    cache_size = Gauge("cache_size", "Keshdagi yozuvlar", ("cache",))
+    for name, cache in (("user", user_cache), ("subscription", subscription_cache)):
+        stats = cache.stats()
+        cache_requests.inc(name, "hit", amount=stats["hits"])
+        cache_requests.inc(name, "miss", amount=stats["misses"])
+        cache_size.set(name, value=stats["size"])
+
+    shard_depth = Gauge("update_shard_queue_depth", "Shard navbatidagi updatelar", ("shard",))
+    for shard in update_shards.stats()["shards"]:
+        shard_depth.set(shard["shard"], value=shard["depth"])
+    process_shard_depth = Gauge(
+        "update_shard_process_queue_depth", "Shard jarayoni navbatidagi updatelar", ("shard",)
+    )
+    for shard in process_shards.stats()["shards"]:
+        process_shard_depth.set(shard["shard"], value=shard["depth"])
+
+    write_behind = Gauge("spin_write_behind_pending_rows", "Yozilishini kutayotgan spin qatorlari")
+    write_behind.set(value=spin_writer.stats()["pending_rows"])
+
+    return [db_pool, db_pool_events, cache_requests, cache_size, shard_depth, process_shard_depth, write_behind]
+
+async def serve_metrics(port: int) -> web.AppRunner:
+    """Admin panel bo'lmagan jarayon (polling bot) uchun /metrics listeneri"""
+    async def handle_metrics(request):
+        return web.Response(
+            text=render(process_metrics()),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """dp.update outer middleware: update turlari bo'yicha hisoblagich"""
+
+    async def __call__(self, handler, event, data):
+        updates_total.inc(event.event_type)
+        return await handler(event, data)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: handler nomi bo'yicha kechikish va xatoliklar"""
+
+    async def __call__(self, handler, event, data):
+        callback = data["handler"].callback
+        labels = (callback.__module__, callback.__name__)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            handler_errors.inc(*labels, type(e).__name__)
+            raise
+        finally:
+            handler_duration.observe(*labels, value=time.perf_counter() - started)
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: Bot API metodlari kechikishi"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            telegram_api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            telegram_api_duration.observe(name, value=time.perf_counter() - started)
+
+def setup_dispatcher_metrics(dp):
+    """Update va handler middlewarelarini ulash"""
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    handler_middleware = HandlerMetricsMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            # Ichki routerlarga ham tarqaladi
+            observer.middleware(handler_middleware)
+
+def statement_label(statement: str) -> str:
+    """So'rov turi (SELECT, INSERT, WITH, ...) - label soni kichik bo'lishi uchun"""
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+def instrument_engine(engine):
+    """SQLAlchemy eventlari orqali so'rov vaqtini o'lchash"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        db_query_duration.observe(statement_label(statement), value=time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        db_query_errors.inc(statement_label(context.statement or ""))
@@ -0,0 +1,125 @@
+"""
+Versiyalangan migratsiyalar
+
+create_all faqat yangi jadvallarni yaratadi, mavjud bazaga yangi indeks
+yoki ustunlar qo'shmaydi. Shu sababli har bir sxema o'zgarishi shu yerda
+versiya raqami bilan yoziladi va init_db() vaqtida bir marta bajariladi.
+
+Har bir buyruq AUTOCOMMIT rejimida ishlaydi, shuning uchun
+CREATE INDEX CONCURRENTLY jadvallarni bloklamasdan (online) bajariladi.
+"""
+import logging
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Bir vaqtda ishga tushgan bir nechta jarayon migratsiyani takrorlamasligi uchun
+MIGRATION_LOCK_KEY = 724_310_001
+
+# (versiya, tavsif, SQL buyruqlar)
+MIGRATIONS = [
+    (1, "Asosiy qidiruv ustunlari uchun indekslar", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_spin_results_user_id_created_at "
+        "ON spin_results (user_id, created_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_user_id_created_at "
+        "ON transactions (user_id, created_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_created_at "
+        "ON transactions (created_at)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_withdrawals_user_id_status "
+        "ON withdrawals (user_id, status)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_withdrawals_pending "
+        "ON withdrawals (requested_at) WHERE status = 'pending'",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contest_participants_user_id_contest_id "
+        "ON contest_participants (user_id, contest_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contest_numbers_contest_id_user_id "
+        "ON contest_numbers (contest_id, user_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contest_numbers_free "
+        "ON contest_numbers (contest_id) WHERE user_id IS NULL",
+    ]),
+    (2, "Foydalanuvchiga yetib borish holati (botni bloklaganlar)", [
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_reachable BOOLEAN NOT NULL DEFAULT true",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS unreachable_at TIMESTAMP",
+    ]),
+    (3, "Bo'sh konkurs raqamlari id bo'yicha (tasodifiy nuqtadan qidirish uchun)", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contest_numbers_free_id "
+        "ON contest_numbers (contest_id, id) WHERE user_id IS NULL",
+        "DROP INDEX CONCURRENTLY IF EXISTS ix_contest_numbers_free",
+    ]),
+    (4, "Konkurs reytingi: indekslar va contest_leaderboard ni to'ldirish", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contest_participants_ranking "
+        "ON contest_participants (contest_id, referrals_completed DESC, id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_contest_participants_number "
+        "ON contest_participants (contest_id, contest_number) WHERE contest_number IS NOT NULL",
+        "INSERT INTO contest_leaderboard (contest_id, referrals, participants, qualified) "
+        "SELECT contest_id, COALESCE(referrals_completed, 0), count(*), count(contest_number) "
+        "FROM contest_participants WHERE contest_id IS NOT NULL "
+        "GROUP BY contest_id, COALESCE(referrals_completed, 0) "
+        "ON CONFLICT (contest_id, referrals) DO NOTHING",
+    ]),
+    (5, "Broadcast tugagach natija yuboriladigan chat", [
+        "ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS notify_chat_id BIGINT",
+    ]),
+    (6, "To'lovlar jurnalini mavjud xaridlar bilan to'ldirish", [
+        "INSERT INTO payments (telegram_payment_charge_id, user_id, stars_amount, created_at) "
+        "SELECT DISTINCT ON (telegram_payment_id) telegram_payment_id, user_id, amount, created_at "
+        "FROM transactions WHERE transaction_type = 'purchase' AND telegram_payment_id IS NOT NULL "
+        "ORDER BY telegram_payment_id, created_at "
+        "ON CONFLICT (telegram_payment_charge_id) DO NOTHING",
+    ]),
+    (7, "Spin hisoblagichlarini barcha foydalanuvchilar uchun to'ldirish", [
+        "INSERT INTO user_stats (user_id, total_spins, won_spins, biggest_win, updated_at) "
+        "SELECT user_id, count(*), count(*) FILTER (WHERE spin_result = 'win'), "
+        "COALESCE(max(win_amount), 0), now() AT TIME ZONE 'utc' "
+        "FROM spin_results GROUP BY user_id "
+        "ON CONFLICT (user_id) DO NOTHING",
+    ]),
+]
+
+async def drop_invalid_indexes(conn):
+    """Oldingi muvaffaqiyatsiz CONCURRENTLY urinishidan qolgan yaroqsiz indekslarni o'chirish"""
+    result = await conn.execute(text("""
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE NOT i.indisvalid
+          AND n.nspname = current_schema()
+          AND c.relname LIKE 'ix\\_%'
+    """))
+    for index_name in result.scalars().all():
+        logger.warning(f"Yaroqsiz indeks o'chirilmoqda: {index_name}")
+        await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"'))
+
+async def run_migrations(engine: AsyncEngine):
+    """Hali bajarilmagan migratsiyalarni tartib bilan bajarish"""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            await conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+                )
+            """))
+            result = await conn.execute(text("SELECT version FROM schema_migrations"))
+            applied = set(result.scalars().all())
+
+            pending = [m for m in MIGRATIONS if m[0] not in applied]
+            if not pending:
+                return
+
+            await drop_invalid_indexes(conn)
+
+            for version, description, statements in pending:
+                logger.info(f"Migratsiya {version}: {description}")
+                for statement in statements:
+                    await conn.execute(text(statement))
+                await conn.execute(
+                    text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                    {"version": version, "description": description}
+                )
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import BigInteger, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import BigInteger, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from database import Base
 
@@ -18,6 +18,10 @@ class User(Base):
     is_banned: Mapped[bool] = mapped_column(Boolean, default=False)
     captcha_passed: Mapped[bool] = mapped_column(Boolean, default=False)
     
+    # Botni bloklagan yoki o'chirilgan foydalanuvchilar (ommaviy xabarlarda o'tkazib yuboriladi)
+    is_reachable: Mapped[bool] = mapped_column(Boolean, default=True, server_default=text("true"))
+    unreachable_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    
     # Referal tizimi
     referrer_id: Mapped[int] = mapped_column(BigInteger, nullable=True)  # Kim taklif qilgan
     total_referrals: Mapped[int] = mapped_column(Integer, default=0)  # Nechta kishi taklif qilgan
@@ -33,6 +37,10 @@ class User(Base):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_user_id_created_at", "user_id", "created_at"),
+        Index("ix_transactions_created_at", "created_at"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
@@ -45,8 +53,25 @@ class Transaction(Base):
     # Relationships
     user = relationship("User", back_populates="transactions")
 
+class Payment(Base):
+    __tablename__ = "payments"
+    
+    # To'lovlar jurnali: Telegram bitta to'lovni qayta yuborsa, charge_id bo'yicha
+    # birlamchi kalit takroriy yozuvga (va ikkinchi marta hisoblashga) yo'l qo'ymaydi
+    telegram_payment_charge_id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
+    stars_amount: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_amount: Mapped[int] = mapped_column(Integer, nullable=True)
+    currency: Mapped[str] = mapped_column(String(10), nullable=True)
+    invoice_payload: Mapped[str] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
 class Withdrawal(Base):
     __tablename__ = "withdrawals"
+    __table_args__ = (
+        Index("ix_withdrawals_user_id_status", "user_id", "status"),
+        Index("ix_withdrawals_pending", "requested_at", postgresql_where=text("status = 'pending'")),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
@@ -62,6 +87,9 @@ class Withdrawal(Base):
 
 class SpinResult(Base):
     __tablename__ = "spin_results"
+    __table_args__ = (
+        Index("ix_spin_results_user_id_created_at", "user_id", "created_at"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
@@ -74,6 +102,16 @@ class SpinResult(Base):
     # Relationships
     user = relationship("User", back_populates="spins")
 
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    
+    # Har bir spin bilan yangilanadigan hisoblagichlar (/stats uchun)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.telegram_id"), primary_key=True)
+    total_spins: Mapped[int] = mapped_column(Integer, default=0)
+    won_spins: Mapped[int] = mapped_column(Integer, default=0)
+    biggest_win: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Contest(Base):
     __tablename__ = "contests"
     
@@ -90,6 +128,14 @@ class Contest(Base):
     
 class ContestParticipant(Base):
     __tablename__ = "contest_participants"
+    __table_args__ = (
+        Index("ix_contest_participants_user_id_contest_id", "user_id", "contest_id"),
+        Index("ix_contest_participants_ranking", "contest_id", text("referrals_completed DESC"), "id"),
+        Index(
+            "ix_contest_participants_number", "contest_id", "contest_number",
+            postgresql_where=text("contest_number IS NOT NULL")
+        ),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.telegram_id"), nullable=False)
@@ -103,8 +149,22 @@ class ContestParticipant(Base):
     # Relationships
     user = relationship("User")
     
+class ContestLeaderboard(Base):
+    __tablename__ = "contest_leaderboard"
+    
+    # Referallar soni bo'yicha ishtirokchilar taqsimoti: o'rin va hisoblagichlar
+    # ishtirokchilarni sanamasdan shu bir necha qatordan olinadi
+    contest_id: Mapped[int] = mapped_column(Integer, ForeignKey("contests.id"), primary_key=True)
+    referrals: Mapped[int] = mapped_column(Integer, primary_key=True)
+    participants: Mapped[int] = mapped_column(Integer, default=0)
+    qualified: Mapped[int] = mapped_column(Integer, default=0)
+
 class ContestNumber(Base):
     __tablename__ = "contest_numbers"
+    __table_args__ = (
+        Index("ix_contest_numbers_contest_id_user_id", "contest_id", "user_id"),
+        Index("ix_contest_numbers_free_id", "contest_id", "id", postgresql_where=text("user_id IS NULL")),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     contest_id: Mapped[int] = mapped_column(Integer, ForeignKey("contests.id"), default=1)
@@ -114,3 +174,32 @@ class ContestNumber(Base):
     
     # Relationships
     user = relationship("User")
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    audience: Mapped[str] = mapped_column(String(20), default="all")  # all, active, contest:<id>
+    status: Mapped[str] = mapped_column(String(20), default="pending")  # pending, running, finished, failed
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    # Shu telegram_id gacha (shu jumladan) barcha qabul qiluvchilar qayta ishlangan
+    checkpoint_user_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+    # Tugagach natijalar shu chatga yuboriladi (masalan, e'lon qilgan admin)
+    notify_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+class BroadcastDelivery(Base):
+    __tablename__ = "broadcast_deliveries"
+    
+    broadcast_id: Mapped[int] = mapped_column(Integer, ForeignKey("broadcasts.id"), primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    status: Mapped[str] = mapped_column(String(20), nullable=False)  # delivered, failed, blocked
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,211 @@
+"""
+Updatelarni foydalanuvchi bo'yicha shardlarga taqsimlash (UPDATE_SHARDS > 0)
+
+ShardedDispatcher.feed_update (polling ham, webhook ham shu orqali o'tadi)
+updateni from_user.id bo'yicha N ta navbatdan biriga qo'yadi va har bir
+shardni bitta worker ketma-ket qayta ishlaydi. Butun middleware zanjiri
+(FSM holati, ErrorsMiddleware, handlerlar) shard workerida bajariladi,
+shuning uchun holat oldingi update tugagandan keyin o'qiladi va xatoliklar
+dp.errors ga yetib boradi. Bitta foydalanuvchining spin va yechib olish
+so'rovlari kelish tartibida bajariladi, turli foydalanuvchilar esa
+parallel ishlaydi.
+
+UpdateShards - bitta jarayondagi asyncio tasklari: yuk CPU yadrolari bo'ylab
+taqsimlanmaydi. Supervisor ostida polling rejimida UPDATE_SHARD_PROCESSES > 0
+bo'lsa bot jarayoni faqat getUpdates qiladi va ProcessShards orqali har bir
+updateni shard_key(update) % N raqamli shard jarayonining navbatiga qo'yadi.
+Har bir shard jarayoni (o'z event loopi, DB pooli va FSM xotirasi bilan)
+o'z navbatini kelish tartibida o'qiydi, ichida yana UpdateShards ishlatishi
+mumkin. Foydalanuvchi doim bitta jarayonga tushadi, shuning uchun tartib va
+FSM holati saqlanadi.
+
+Tartib faqat shu instansiya ichida kafolatlanadi - bir nechta webhook
+instansiyasi bitta foydalanuvchi updatelarini parallel qayta ishlashi mumkin.
+"""
+import asyncio
+import logging
+from queue import Empty
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+
+from config import UPDATE_SHARDS, UPDATE_SHARD_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+def shard_key(update: Update) -> int:
+    """Update egasi (foydalanuvchi, bo'lmasa chat yoki update_id)"""
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user:
+        return user.id
+    chat = getattr(event, "chat", None)
+    return chat.id if chat else update.update_id
+
+async def feed_and_reply(feed, bot: Bot, update: Update, kwargs: dict):
+    """Updateni dispatcherga berish; handler Telegram metodini qaytarsa (webhook javobi uslubi) - yuborish"""
+    response = await feed(bot, update, **kwargs)
+    if isinstance(response, TelegramMethod):
+        await Dispatcher.silent_call_request(bot, response)
+
+class UpdateShards:
+    """Foydalanuvchi bo'yicha tartibni saqlovchi shardlangan dispatch"""
+
+    def __init__(self, shards: int, queue_size: int):
+        self.shards = shards
+        self.queue_size = queue_size
+        self.queues = []
+        self.processed = [0] * shards
+        self.errors = [0] * shards
+        self.max_depth = [0] * shards
+        self._tasks = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.shards > 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def put(self, feed, bot: Bot, update: Update, kwargs: dict):
+        """Updateni egasining shardiga qo'yish"""
+        shard = shard_key(update) % self.shards
+        queue = self.queues[shard]
+        # Navbat to'lsa kutiladi (polling/webhook navbatiga backpressure)
+        await queue.put((feed, bot, update, kwargs))
+        self.max_depth[shard] = max(self.max_depth[shard], queue.qsize())
+
+    async def _worker(self, shard: int):
+        queue = self.queues[shard]
+        while True:
+            feed, bot, update, kwargs = await queue.get()
+            try:
+                await feed_and_reply(feed, bot, update, kwargs)
+                self.processed[shard] += 1
+            except Exception as e:
+                # dp.errors qayta ishlamagan xatoliklar
+                self.errors[shard] += 1
+                logger.error(f"Shard {shard}: update {update.update_id} error: {e}")
+            finally:
+                queue.task_done()
+
+    def start(self):
+        """Shard workerlarini ishga tushirish"""
+        if not self.enabled or self.running:
+            return
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.shards)]
+        self._tasks = [asyncio.create_task(self._worker(shard)) for shard in range(self.shards)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Navbatdagi updatelarni tugatib, workerlarni to'xtatish"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shardlarda {sum(q.qsize() for q in self.queues)} ta update qayta ishlanmay qoldi")
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "queue_size": self.queue_size,
+            "shards": [
+                {
+                    "shard": shard,
+                    "depth": self.queues[shard].qsize() if self.queues else 0,
+                    "max_depth": self.max_depth[shard],
+                    "processed": self.processed[shard],
+                    "errors": self.errors[shard]
+                }
+                for shard in range(self.shards)
+            ]
+        }
+
+update_shards = UpdateShards(UPDATE_SHARDS, UPDATE_SHARD_QUEUE_SIZE)
+
+class ProcessShards:
+    """Polling jarayonidan shard jarayonlari navbatlariga foydalanuvchi bo'yicha yo'naltirish"""
+
+    def __init__(self):
+        self.queues = []
+        self.routed = []
+        self.max_depth = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.queues)
+
+    @property
+    def running(self) -> bool:
+        return self.enabled
+
+    def start(self, queues):
+        """Supervisor yaratgan multiprocessing navbatlari (har bir shard jarayoniga bittadan)"""
+        self.queues = list(queues)
+        self.routed = [0] * len(self.queues)
+        self.max_depth = [0] * len(self.queues)
+
+    async def put(self, feed, bot: Bot, update: Update, kwargs: dict):
+        """Updateni egasining shard jarayoniga yuborish (feed shard jarayonining dispatcheri)"""
+        shard = shard_key(update) % len(self.queues)
+        queue = self.queues[shard]
+        data = update.model_dump_json(exclude_unset=True, by_alias=True)
+        # put bloklovchi (navbat to'lsa polling kutadi), shuning uchun executorda.
+        # Polling keyingi updateni shu put tugagach beradi - tartib saqlanadi
+        await asyncio.get_running_loop().run_in_executor(None, queue.put, data)
+        self.routed[shard] += 1
+        self.max_depth[shard] = max(self.max_depth[shard], queue.qsize())
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "shards": [
+                {
+                    "shard": shard,
+                    "depth": queue.qsize(),
+                    "max_depth": self.max_depth[shard],
+                    "routed": self.routed[shard]
+                }
+                for shard, queue in enumerate(self.queues)
+            ]
+        }
+
+process_shards = ProcessShards()
+
+async def consume_shard_queue(dp: Dispatcher, bot: Bot, queue, stop: asyncio.Event, poll_interval: float = 1.0):
+    """
+    Shard jarayoni: polling jarayoni yo'naltirgan updatelarni kelish tartibida dp ga berish
+    stop o'rnatilgandan keyin navbatda qolganlari ham qayta ishlanadi
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            data = await loop.run_in_executor(None, queue.get, True, poll_interval)
+        except Empty:
+            if stop.is_set():
+                return
+            continue
+        update = Update.model_validate_json(data, context={"bot": bot})
+        try:
+            await feed_and_reply(dp.feed_update, bot, update, {})
+        except Exception as e:
+            # dp.errors qayta ishlamagan xatoliklar
+            logger.error(f"Shard jarayoni: update {update.update_id} error: {e}")
+
+class ShardedDispatcher(Dispatcher):
+    """Shardlar ishlayotganda feed_update ni egasining shardi orqali o'tkazuvchi Dispatcher"""
+
+    def __init__(self, shards: UpdateShards = update_shards, **kwargs):
+        super().__init__(**kwargs)
+        self.shards = shards
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs):
+        if not self.shards.running:
+            return await super().feed_update(bot, update, **kwargs)
+        await self.shards.put(super().feed_update, bot, update, kwargs)
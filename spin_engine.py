@@ -0,0 +1,74 @@
+"""
+Vektorlashtirilgan spin dvigateli (NumPy)
+
+utils.calculate_spin_result bilan bir xil qoidalar: 5/10/20% yutish
+darajalari, 40% max_user_return chegarasi va 1.1x minimal yutuq.
+N ta natijani bitta chaqiruvda hisoblaydi - ko'p spinli rejim va
+RTP simulyatsiyasi uchun.
+"""
+import numpy as np
+
+from utils import SLOT_SYMBOLS
+
+# utils.calculate_spin_result dagi qiymatlar
+WIN_MULTIPLIERS = np.array([1.2, 1.5, 2.0, 2.5])
+WIN_MULTIPLIER_WEIGHTS = np.array([60, 25, 12, 3]) / 100
+CAPPED_MULTIPLIER = 1.1
+MAX_RETURN_SHARE = 0.4
+
+def calculate_spin_results_batch(bet_amounts, total_deposits=0, total_won=0, size=None, rng=None):
+    """
+    N ta spin natijasini bir vaqtda hisoblash
+    bet_amounts / total_deposits / total_won - skalyar yoki uzunligi N bo'lgan massiv.
+    Returns: {"win_amounts", "multipliers", "is_win", "symbols"} (symbols - (N, 3) SLOT_SYMBOLS indekslari)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    bet, deposits, won = np.broadcast_arrays(
+        np.asarray(bet_amounts, dtype=np.int64),
+        np.asarray(total_deposits, dtype=np.int64),
+        np.asarray(total_won, dtype=np.int64)
+    )
+    if size is not None:
+        bet, deposits, won = (np.broadcast_to(a, (size,)) for a in (bet, deposits, won))
+    n = bet.size
+    bet, deposits, won = bet.ravel(), deposits.ravel(), won.ravel()
+
+    # Dinamik yutish ehtimoli (skalyar yo'ldagi if/elif tartibida)
+    max_user_return = deposits * MAX_RETURN_SHARE
+    win_chance = np.where(
+        won >= max_user_return, 0.05,
+        np.where(deposits - won < 0, 0.10, 0.20)
+    )
+    is_win = rng.random(n) < win_chance
+
+    # Multiplier va yutuq miqdori
+    multipliers = np.where(
+        is_win,
+        WIN_MULTIPLIERS[rng.choice(len(WIN_MULTIPLIERS), size=n, p=WIN_MULTIPLIER_WEIGHTS)],
+        0.0
+    )
+    win_amounts = (bet * multipliers).astype(np.int64)
+
+    # Admin foydasini buzadigan yutuqlar 1.1x gacha kamaytiriladi
+    capped = is_win & (won + win_amounts > max_user_return)
+    multipliers[capped] = CAPPED_MULTIPLIER
+    win_amounts[capped] = (bet[capped] * CAPPED_MULTIPLIER).astype(np.int64)
+
+    # Belgilar: yutuqda 3 ta bir xil, yutqazishda 3 ta har xil
+    symbol_count = len(SLOT_SYMBOLS)
+    symbols = np.argsort(rng.random((n, symbol_count)), axis=1)[:, :3]
+    winning_symbol = rng.integers(0, symbol_count, size=n)
+    symbols[is_win] = winning_symbol[is_win, None]
+
+    return {
+        "win_amounts": win_amounts,
+        "multipliers": multipliers,
+        "is_win": is_win,
+        "symbols": symbols
+    }
+
+def symbols_from_indices(indices) -> list:
+    """Belgi indekslarini emoji ro'yxatiga aylantirish"""
+    return [SLOT_SYMBOLS[i] for i in indices]
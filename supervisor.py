@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Jarayonlar supervisori
+
+Bot, admin panel va fon workerlarini alohida jarayonlarda ishga tushiradi
+(har biri o'z DB pooli va event loopi bilan):
+- bot: polling (BOT_MODE=webhook bo'lsa ishga tushirilmaydi - updatelar admin panelga keladi)
+- shard: UPDATE_SHARD_PROCESSES ta jarayon; bot updatelarni foydalanuvchi bo'yicha
+  ularning navbatlariga yuboradi, handlerlar shu jarayonlarda ishlaydi
+- admin: uvicorn, ADMIN_WORKERS ta worker bilan
+- worker: broadcast yuboruvchi, BACKGROUND_WORKERS ta jarayon
+
+Yiqilgan jarayon qayta ishga tushiriladi, SIGTERM/SIGINT da barcha
+jarayonlar graceful to'xtatiladi. Holat SUPERVISOR_HEALTH_PORT dagi
+/health orqali beriladi.
+
+Ishlatish: python supervisor.py
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Admin panel broadcastlarni o'zi yubormaydi - ularni worker jarayonlari oladi
+os.environ["BACKGROUND_IN_PROCESS"] = "false"
+
+from config import (
+    BOT_MODE, ADMIN_WORKERS, BACKGROUND_WORKERS, SUPERVISOR_HEALTH_PORT, SHUTDOWN_TIMEOUT,
+    UPDATE_SHARD_PROCESSES, UPDATE_SHARD_QUEUE_SIZE
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("supervisor")
+
+# Tez-tez yiqilayotgan jarayonni qayta ishga tushirishdan oldin maksimal kutish
+MAX_RESTART_DELAY = 60
+
+def run_bot(shard_queues):
+    """Bot jarayoni (polling)"""
+    from bot import main
+    asyncio.run(main(shard_queues))
+
+def run_shard(shard, queue):
+    """Shard jarayoni: bot jarayoni yuborgan updatelarni qayta ishlaydi"""
+    from bot import shard_main
+    asyncio.run(shard_main(shard, queue))
+
+def run_admin():
+    """Admin panel jarayoni"""
+    import uvicorn
+    uvicorn.run(
+        "admin_panel:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        workers=ADMIN_WORKERS,
+        reload=False
+    )
+
+async def worker_main():
+    """Broadcast worker: yangi va to'xtab qolgan broadcastlarni olib yuboradi"""
+    from bot import create_bot
+    from database import init_db
+    from broadcast import broadcast_watchdog, broadcast_jobs
+
+    bot = create_bot()
+    await init_db()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    watchdog = asyncio.create_task(broadcast_watchdog(bot))
+    await stop.wait()
+
+    # Ishlayotgan broadcastlar progressini yozib, lease ni bo'shatadi
+    tasks = [watchdog] + [job.task for job in broadcast_jobs.values()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await bot.session.close()
+
+def run_worker():
+    """Fon worker jarayoni"""
+    asyncio.run(worker_main())
+
+class ManagedProcess:
+    """Supervisor boshqaradigan bitta jarayon"""
+
+    def __init__(self, role: str, index: int, target, args=()):
+        self.role = role
+        self.name = f"{role}-{index}"
+        self.target = target
+        self.args = args
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.restart_at = None
+        self.last_exit_code = None
+
+    def start(self, context):
+        self.process = context.Process(target=self.target, args=self.args, name=self.name)
+        self.process.start()
+        self.started_at = time.time()
+        self.restart_at = None
+        logger.info(f"{self.name} ishga tushdi (pid {self.process.pid})")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "pid": self.process.pid if self.process else None,
+            "alive": self.alive,
+            "uptime": round(time.time() - self.started_at, 1) if self.alive else 0,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code
+        }
+
+class Supervisor:
+    """Jarayonlarni ishga tushirish, kuzatish va to'xtatish"""
+
+    def __init__(self):
+        self.context = multiprocessing.get_context("spawn")
+        self.stopping = False
+        self.processes = []
+        if BOT_MODE != "webhook":
+            # Navbatlar supervisorda - shard yoki bot jarayoni qayta ishga tushsa ham saqlanadi
+            shard_queues = [self.context.Queue(UPDATE_SHARD_QUEUE_SIZE) for _ in range(UPDATE_SHARD_PROCESSES)]
+            self.processes.append(ManagedProcess("bot", 0, run_bot, (shard_queues,)))
+            for index, queue in enumerate(shard_queues):
+                self.processes.append(ManagedProcess("shard", index, run_shard, (index, queue)))
+        self.processes.append(ManagedProcess("admin", 0, run_admin))
+        for index in range(BACKGROUND_WORKERS):
+            self.processes.append(ManagedProcess("worker", index, run_worker))
+
+    def health(self) -> dict:
+        roles = {}
+        for managed in self.processes:
+            roles.setdefault(managed.role, []).append(managed.status())
+        healthy = all(any(p["alive"] for p in processes) for processes in roles.values())
+        return {"status": "healthy" if healthy else "degraded", "roles": roles}
+
+    def check(self):
+        """Yiqilgan jarayonlarni backoff bilan qayta ishga tushirish"""
+        now = time.time()
+        for managed in self.processes:
+            if managed.alive:
+                continue
+            if managed.restart_at is None:
+                managed.last_exit_code = managed.process.exitcode
+                # Uzoq ishlagan jarayon uchun backoff qaytadan boshlanadi
+                if now - managed.started_at > MAX_RESTART_DELAY:
+                    managed.restarts = 0
+                delay = min(2 ** managed.restarts, MAX_RESTART_DELAY)
+                managed.restart_at = now + delay
+                logger.warning(f"{managed.name} to'xtadi (exit {managed.last_exit_code}), {delay} s dan keyin qayta ishga tushiriladi")
+            elif now >= managed.restart_at:
+                managed.restarts += 1
+                managed.start(self.context)
+
+    def shutdown(self):
+        """SIGTERM yuborish, SHUTDOWN_TIMEOUT gacha kutish, qolganlarini o'ldirish"""
+        logger.info("Jarayonlar to'xtatilmoqda...")
+        for managed in self.processes:
+            if managed.alive:
+                managed.process.terminate()
+
+        deadline = time.time() + SHUTDOWN_TIMEOUT
+        for managed in self.processes:
+            if managed.process is not None:
+                managed.process.join(max(deadline - time.time(), 0))
+                if managed.process.is_alive():
+                    logger.warning(f"{managed.name} o'z vaqtida to'xtamadi - kill")
+                    managed.process.kill()
+                    managed.process.join()
+
+    def serve_health(self):
+        """Holat endpointi (alohida thread)"""
+        supervisor = self
+
+        class HealthHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                health = supervisor.health()
+                body = json.dumps(health).encode()
+                self.send_response(200 if health["status"] == "healthy" else 503)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", SUPERVISOR_HEALTH_PORT), HealthHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def run(self):
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        for managed in self.processes:
+            managed.start(self.context)
+        health_server = self.serve_health()
+        logger.info(f"Supervisor holati: http://0.0.0.0:{SUPERVISOR_HEALTH_PORT}/health")
+
+        try:
+            while not self.stopping:
+                self.check()
+                time.sleep(1)
+        finally:
+            health_server.shutdown()
+            self.shutdown()
+        logger.info("Supervisor to'xtadi")
+
+def main():
+    if not os.getenv("DATABASE_URL"):
+        print("❌ DATABASE_URL environment variable is not set!")
+        return 1
+
+    Supervisor().run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,804 @@
+#!/usr/bin/env python3
+"""
+Database tests against a real PostgreSQL instance
+Skipped when DATABASE_URL is not set
+"""
+
+import os
+import sys
+import asyncio
+from datetime import datetime, timedelta
+
+def database_available():
+    """DATABASE_URL o'rnatilganligini tekshirish"""
+    if not os.getenv("DATABASE_URL"):
+        print("⚠️ DATABASE_URL is not set - skipping database tests")
+        return False
+    return True
+
+def run_async(test_coroutine):
+    """Async testni ishga tushirish va ulanishlarni yopish"""
+    from database import engine
+
+    async def runner():
+        try:
+            return await test_coroutine()
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(runner())
+
+def find_seq_scans(plan, tables):
+    """EXPLAIN rejasidan ko'rsatilgan jadvallar bo'yicha Seq Scan tugunlarini topish"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child, tables))
+    return found
+
+def test_query_plans():
+    """Hot lookup queries must use an index, never a sequential scan"""
+    print("Testing query plans...")
+    if not database_available():
+        return
+
+    from sqlalchemy import select, func, text
+    from sqlalchemy.dialects import postgresql
+    from database import engine, init_db
+    from models import User, SpinResult, Transaction, Withdrawal, ContestParticipant, ContestNumber
+
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    queries = {
+        "user by telegram_id": select(User).where(User.telegram_id == 1),
+        "spins by user": select(func.count(SpinResult.id)).where(SpinResult.user_id == 1),
+        "transactions by user": select(Transaction).where(Transaction.user_id == 1),
+        "transactions by created_at": select(Transaction.user_id).where(Transaction.created_at >= week_ago),
+        "pending withdrawal by user": select(Withdrawal).where(
+            Withdrawal.user_id == 1,
+            Withdrawal.status == "pending"
+        ),
+        "pending withdrawals count": select(func.count(Withdrawal.id)).where(Withdrawal.status == "pending"),
+        "contest participant": select(ContestParticipant).where(
+            ContestParticipant.user_id == 1,
+            ContestParticipant.contest_id == 1
+        ),
+        "free contest numbers": select(ContestNumber).where(
+            ContestNumber.contest_id == 1,
+            ContestNumber.user_id.is_(None)
+        ),
+        "free contest number after pivot": select(ContestNumber.id).where(
+            ContestNumber.contest_id == 1,
+            ContestNumber.user_id.is_(None),
+            ContestNumber.id >= 1
+        ).order_by(ContestNumber.id).limit(1),
+        "leaderboard page": select(ContestParticipant).where(
+            ContestParticipant.contest_id == 1
+        ).order_by(ContestParticipant.referrals_completed.desc(), ContestParticipant.id).limit(50),
+        "leaderboard page after cursor (same referrals)": select(ContestParticipant.id).where(
+            ContestParticipant.contest_id == 1,
+            ContestParticipant.referrals_completed == 0,
+            ContestParticipant.id > 1
+        ).order_by(ContestParticipant.id).limit(51),
+        "leaderboard page after cursor (fewer referrals)": select(ContestParticipant.id).where(
+            ContestParticipant.contest_id == 1,
+            ContestParticipant.referrals_completed < 3
+        ).order_by(ContestParticipant.referrals_completed.desc(), ContestParticipant.id).limit(51),
+        "qualified participants page after cursor": select(ContestParticipant).where(
+            ContestParticipant.contest_id == 1,
+            ContestParticipant.contest_number > 50
+        ).order_by(ContestParticipant.contest_number).limit(51),
+        "qualified participants page": select(ContestParticipant).where(
+            ContestParticipant.contest_id == 1,
+            ContestParticipant.contest_number.isnot(None)
+        ).order_by(ContestParticipant.contest_number).limit(50),
+        "contest number owner": select(ContestNumber).where(
+            ContestNumber.contest_id == 1,
+            ContestNumber.user_id == 1
+        ),
+    }
+    hot_tables = {
+        "users", "spin_results", "transactions", "withdrawals",
+        "contest_participants", "contest_numbers"
+    }
+
+    async def check():
+        await init_db()
+        failures = []
+        async with engine.connect() as conn:
+            # Kichik jadvallarda ham rejalashtiruvchi indeksni tanlashi uchun
+            await conn.execute(text("SET enable_seqscan = off"))
+            for name, query in queries.items():
+                sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                result = await conn.execute(text("EXPLAIN (FORMAT JSON) " + sql))
+                plan = result.scalar()[0]["Plan"]
+                seq_scans = find_seq_scans(plan, hot_tables)
+                if seq_scans:
+                    print(f"❌ {name}: Seq Scan on {', '.join(seq_scans)}")
+                    failures.append(name)
+                else:
+                    print(f"✅ {name}: index scan")
+        return failures
+
+    failures = run_async(check)
+    assert not failures, f"Sequential scans in: {', '.join(failures)}"
+
+def test_concurrent_spins():
+    """Parallel spins for the same users must keep balances exact"""
+    print("Testing concurrent spin settlement...")
+    if not database_available():
+        return
+
+    from sqlalchemy import select, delete, func
+    from database import AsyncSessionLocal, init_db
+    from models import User, SpinResult, Transaction, UserStats
+    from handlers.game import play_spin
+    from utils_stats import get_user_spin_stats
+
+    user_ids = [9_100_000_000 + i for i in range(10)]
+    starting_stars = 200
+    starting_free_spins = 5
+    taps_per_user = 60
+
+    async def cleanup():
+        async with AsyncSessionLocal() as db:
+            for model in (UserStats, SpinResult, Transaction):
+                await db.execute(delete(model).where(model.user_id.in_(user_ids)))
+            await db.execute(delete(User).where(User.telegram_id.in_(user_ids)))
+            await db.commit()
+
+    async def tap(user_id):
+        async with AsyncSessionLocal() as db:
+            return user_id, await play_spin(db, user_id, 1)
+
+    async def check():
+        await init_db()
+        await cleanup()
+        async with AsyncSessionLocal() as db:
+            for user_id in user_ids:
+                db.add(User(
+                    telegram_id=user_id,
+                    first_name="stress",
+                    stars=starting_stars,
+                    free_spins=starting_free_spins,
+                    total_deposited=starting_stars
+                ))
+            await db.commit()
+
+        try:
+            results = await asyncio.gather(*[
+                tap(user_id) for user_id in user_ids for _ in range(taps_per_user)
+            ])
+
+            failures = []
+            async with AsyncSessionLocal() as db:
+                for user_id in user_ids:
+                    settled = [r for uid, r in results if uid == user_id and r["status"] == "ok"]
+                    paid = len([r for r in settled if not r["used_free_spin"]])
+                    free = len(settled) - paid
+                    won = sum(r["win_amount"] for r in settled)
+
+                    user = (await db.execute(
+                        select(User).where(User.telegram_id == user_id)
+                    )).scalar_one()
+                    spin_count = await db.scalar(
+                        select(func.count(SpinResult.id)).where(SpinResult.user_id == user_id)
+                    )
+                    spin_won = await db.scalar(
+                        select(func.coalesce(func.sum(SpinResult.win_amount), 0)).where(SpinResult.user_id == user_id)
+                    )
+                    # Hisoblagich qatori birinchi spin bilan yaratiladi
+                    stats = await get_user_spin_stats(db, user_id)
+
+                    expected_stars = starting_stars - paid + won
+                    if (user.stars != expected_stars
+                            or user.free_spins != starting_free_spins - free
+                            or user.total_won != won
+                            or spin_count != len(settled)
+                            or spin_won != won
+                            or stats["total_spins"] != len(settled)
+                            or user.stars < 0 or user.free_spins < 0):
+                        failures.append(user_id)
+                        print(f"❌ user {user_id}: stars {user.stars} != {expected_stars} "
+                              f"or spins {spin_count} != {len(settled)}")
+
+            busy = len([r for _, r in results if r["status"] == "busy"])
+            print(f"✅ {len(results)} taps, {len(results) - busy} settled, {busy} busy")
+            return failures
+        finally:
+            await cleanup()
+
+    failures = run_async(check)
+    assert not failures, f"Balance mismatch for {len(failures)} users"
+
+def test_concurrent_contest_numbers():
+    """Parallel qualifiers must never share a contest number"""
+    print("Testing concurrent contest number assignment...")
+    if not database_available():
+        return
+
+    from sqlalchemy import select, delete, func, insert, and_
+    from database import AsyncSessionLocal, init_db
+    from models import User, Contest, ContestParticipant, ContestNumber, ContestLeaderboard
+    from handlers.contest import assign_contest_number
+
+    user_ids = [9_200_000_000 + i for i in range(250)]
+    pool_size = 200
+
+    async def cleanup(contest_id=None):
+        async with AsyncSessionLocal() as db:
+            if contest_id is not None:
+                for model in (ContestLeaderboard, ContestNumber, ContestParticipant):
+                    await db.execute(delete(model).where(model.contest_id == contest_id))
+                await db.execute(delete(Contest).where(Contest.id == contest_id))
+            await db.execute(delete(User).where(User.telegram_id.in_(user_ids)))
+            await db.commit()
+
+    async def qualify(contest_id, user_id):
+        async with AsyncSessionLocal() as db:
+            return user_id, await assign_contest_number(db, contest_id, user_id)
+
+    async def check():
+        await init_db()
+        await cleanup()
+        async with AsyncSessionLocal() as db:
+            contest = Contest(title="stress", end_date=datetime.utcnow() + timedelta(days=1), is_active=False)
+            db.add(contest)
+            await db.flush()
+            contest_id = contest.id
+            await db.execute(insert(User), [
+                {"telegram_id": user_id, "first_name": "stress"} for user_id in user_ids
+            ])
+            await db.execute(insert(ContestParticipant), [
+                {"user_id": user_id, "contest_id": contest_id, "referrals_completed": 5}
+                for user_id in user_ids
+            ])
+            await db.execute(insert(ContestNumber), [
+                {"contest_id": contest_id, "number_value": number} for number in range(1, pool_size + 1)
+            ])
+            await db.commit()
+
+        try:
+            # Har bir foydalanuvchi ikki marta parallel so'raydi
+            results = await asyncio.gather(*[
+                qualify(contest_id, user_id) for user_id in user_ids for _ in range(2)
+            ])
+            numbers = [number for _, number in results if number is not None]
+
+            failures = []
+            if len(numbers) != len(set(numbers)):
+                failures.append(f"{len(numbers) - len(set(numbers))} duplicate numbers returned")
+            if len(numbers) != pool_size:
+                failures.append(f"{len(numbers)} numbers assigned, expected {pool_size}")
+
+            async with AsyncSessionLocal() as db:
+                taken = await db.scalar(
+                    select(func.count(ContestNumber.id)).where(
+                        ContestNumber.contest_id == contest_id,
+                        ContestNumber.user_id.isnot(None)
+                    )
+                )
+                owners = await db.scalar(
+                    select(func.count(func.distinct(ContestNumber.user_id))).where(
+                        ContestNumber.contest_id == contest_id
+                    )
+                )
+                mismatched = await db.scalar(
+                    select(func.count(ContestParticipant.id))
+                    .join(ContestNumber, and_(
+                        ContestNumber.contest_id == ContestParticipant.contest_id,
+                        ContestNumber.user_id == ContestParticipant.user_id
+                    ))
+                    .where(
+                        ContestParticipant.contest_id == contest_id,
+                        ContestParticipant.contest_number != ContestNumber.number_value
+                    )
+                )
+            if taken != pool_size or owners != pool_size:
+                failures.append(f"{taken} numbers taken by {owners} users, expected {pool_size}")
+            if mismatched:
+                failures.append(f"{mismatched} participants hold a number owned by someone else")
+
+            for failure in failures:
+                print(f"❌ {failure}")
+            if not failures:
+                print(f"✅ {len(results)} parallel requests, {len(numbers)} unique numbers assigned")
+            return failures
+        finally:
+            await cleanup(contest_id)
+
+    failures = run_async(check)
+    assert not failures, "; ".join(failures)
+
+def test_contest_leaderboard():
+    """Leaderboard counters and ranks must match a full recount"""
+    print("Testing contest leaderboard...")
+    if not database_available():
+        return
+
+    import random
+    from sqlalchemy import select, delete, update, insert
+    from database import AsyncSessionLocal, init_db
+    from models import User, Contest, ContestParticipant, ContestNumber, ContestLeaderboard
+    from handlers.contest import assign_contest_number
+    from utils_contest import (
+        leaderboard_move, get_contest_counts, get_contest_rank, get_leaderboard_page, get_qualified_page
+    )
+
+    user_ids = [9_300_000_000 + i for i in range(60)]
+    rng = random.Random(7)
+    targets = {user_id: rng.randint(0, 6) for user_id in user_ids}
+
+    async def cleanup(contest_id=None):
+        async with AsyncSessionLocal() as db:
+            if contest_id is not None:
+                for model in (ContestLeaderboard, ContestNumber, ContestParticipant):
+                    await db.execute(delete(model).where(model.contest_id == contest_id))
+                await db.execute(delete(Contest).where(Contest.id == contest_id))
+            await db.execute(delete(User).where(User.telegram_id.in_(user_ids)))
+            await db.commit()
+
+    async def play(contest_id, user_id):
+        """Ro'yxatdan o'tish va referallarni birma-bir to'plash"""
+        async with AsyncSessionLocal() as db:
+            db.add(ContestParticipant(user_id=user_id, contest_id=contest_id, referrals_completed=0))
+            await leaderboard_move(db, contest_id, None, 0)
+            await db.commit()
+            for referrals in range(1, targets[user_id] + 1):
+                await db.execute(
+                    update(ContestParticipant)
+                    .where(ContestParticipant.user_id == user_id, ContestParticipant.contest_id == contest_id)
+                    .values(referrals_completed=referrals)
+                )
+                await leaderboard_move(db, contest_id, referrals - 1, referrals)
+                await db.commit()
+            await assign_contest_number(db, contest_id, user_id)
+
+    async def check():
+        await init_db()
+        await cleanup()
+        async with AsyncSessionLocal() as db:
+            contest = Contest(title="leaderboard", end_date=datetime.utcnow() + timedelta(days=1), is_active=False)
+            db.add(contest)
+            await db.flush()
+            contest_id = contest.id
+            await db.execute(insert(User), [
+                {"telegram_id": user_id, "first_name": "stress"} for user_id in user_ids
+            ])
+            await db.execute(insert(ContestNumber), [
+                {"contest_id": contest_id, "number_value": number} for number in range(1, 101)
+            ])
+            await db.commit()
+
+        try:
+            await asyncio.gather(*[play(contest_id, user_id) for user_id in user_ids])
+
+            failures = []
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    select(ContestParticipant.user_id, ContestParticipant.referrals_completed, ContestParticipant.contest_number)
+                    .where(ContestParticipant.contest_id == contest_id)
+                )).all()
+                expected_counts = {
+                    "participants": len(rows),
+                    "qualified": len([row for row in rows if row.contest_number is not None])
+                }
+                counts = await get_contest_counts(db, contest_id)
+                if counts != expected_counts:
+                    failures.append(f"counts {counts} != {expected_counts}")
+
+                for row in rows:
+                    expected_rank = 1 + len([other for other in rows if other.referrals_completed > row.referrals_completed])
+                    rank = await get_contest_rank(db, contest_id, row.referrals_completed)
+                    if rank != expected_rank:
+                        failures.append(f"user {row.user_id}: rank {rank} != {expected_rank}")
+
+                # Oldinga after kursori bilan, orqaga before kursori bilan
+                pages = []
+                page, has_more = await get_leaderboard_page(db, contest_id, per_page=7)
+                pages.extend(page)
+                while has_more:
+                    page, has_more = await get_leaderboard_page(
+                        db, contest_id, after=(pages[-1][1].referrals_completed, pages[-1][1].id), per_page=7
+                    )
+                    pages.extend(page)
+                referrals = [participant.referrals_completed for _, participant, _ in pages]
+                if len(pages) != len(rows) or referrals != sorted(referrals, reverse=True):
+                    failures.append("leaderboard pages are incomplete or out of order")
+                if [rank for rank, _, _ in pages] != [
+                    1 + len([other for other in rows if other.referrals_completed > participant.referrals_completed])
+                    for _, participant, _ in pages
+                ]:
+                    failures.append("leaderboard page ranks do not match the recount")
+
+                backwards, has_more = await get_leaderboard_page(
+                    db, contest_id, before=(pages[-1][1].referrals_completed, pages[-1][1].id), per_page=7
+                )
+                while has_more:
+                    page, has_more = await get_leaderboard_page(
+                        db, contest_id, before=(backwards[0][1].referrals_completed, backwards[0][1].id), per_page=7
+                    )
+                    backwards = page + backwards
+                if [participant.id for _, participant, _ in backwards] != [participant.id for _, participant, _ in pages[:-1]]:
+                    failures.append("leaderboard pages walked backwards differ from forward pages")
+
+                numbers = []
+                page, has_more = await get_qualified_page(db, contest_id, per_page=7)
+                numbers.extend(participant.contest_number for participant, _ in page)
+                while has_more:
+                    page, has_more = await get_qualified_page(db, contest_id, after=numbers[-1], per_page=7)
+                    numbers.extend(participant.contest_number for participant, _ in page)
+                if numbers != sorted(row.contest_number for row in rows if row.contest_number is not None):
+                    failures.append("qualified pages are incomplete or out of order")
+
+            for failure in failures:
+                print(f"❌ {failure}")
+            if not failures:
+                print(f"✅ {counts['participants']} participants, {counts['qualified']} qualified, ranks match")
+            return failures
+        finally:
+            await cleanup(contest_id)
+
+    failures = run_async(check)
+    assert not failures, "; ".join(failures[:5])
+
+def test_concurrent_referrals():
+    """Parallel referrals for the same referrer must never lose increments"""
+    print("Testing concurrent contest referrals...")
+    if not database_available():
+        return
+
+    from sqlalchemy import select, delete, insert
+    from database import AsyncSessionLocal, init_db
+    from models import User, Contest, ContestParticipant, ContestNumber, ContestLeaderboard
+    from handlers.contest import increment_referral, REQUIRED_REFERRALS
+    from utils_contest import get_leaderboard_buckets
+
+    user_ids = [9_400_000_000 + i for i in range(20)]
+    referrals_per_user = 8
+    pool_size = 15
+
+    async def cleanup(contest_id=None):
+        async with AsyncSessionLocal() as db:
+            if contest_id is not None:
+                for model in (ContestLeaderboard, ContestNumber, ContestParticipant):
+                    await db.execute(delete(model).where(model.contest_id == contest_id))
+                await db.execute(delete(Contest).where(Contest.id == contest_id))
+            await db.execute(delete(User).where(User.telegram_id.in_(user_ids)))
+            await db.commit()
+
+    async def refer(contest_id, user_id):
+        async with AsyncSessionLocal() as db:
+            return user_id, await increment_referral(db, contest_id, user_id)
+
+    async def check():
+        await init_db()
+        await cleanup()
+        async with AsyncSessionLocal() as db:
+            contest = Contest(title="referrals", end_date=datetime.utcnow() + timedelta(days=1), is_active=False)
+            db.add(contest)
+            await db.flush()
+            contest_id = contest.id
+            await db.execute(insert(User), [
+                {"telegram_id": user_id, "first_name": "stress"} for user_id in user_ids
+            ])
+            await db.execute(insert(ContestParticipant), [
+                {"user_id": user_id, "contest_id": contest_id, "referrals_completed": 0}
+                for user_id in user_ids
+            ])
+            await db.execute(insert(ContestLeaderboard), [
+                {"contest_id": contest_id, "referrals": 0, "participants": len(user_ids), "qualified": 0}
+            ])
+            await db.execute(insert(ContestNumber), [
+                {"contest_id": contest_id, "number_value": number} for number in range(1, pool_size + 1)
+            ])
+            await db.commit()
+
+        try:
+            results = await asyncio.gather(*[
+                refer(contest_id, user_id) for _ in range(referrals_per_user) for user_id in user_ids
+            ])
+            numbers = [number for _, number in results if number is not None]
+
+            failures = []
+            if len(numbers) != pool_size or len(set(numbers)) != pool_size:
+                failures.append(f"{len(numbers)} numbers returned ({len(set(numbers))} unique), expected {pool_size}")
+
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    select(ContestParticipant.user_id, ContestParticipant.referrals_completed, ContestParticipant.contest_number)
+                    .where(ContestParticipant.contest_id == contest_id)
+                )).all()
+                for row in rows:
+                    # Raqam olgach hisob to'xtaydi, raqam qolmagan bo'lsa barcha referallar sanaladi
+                    expected = REQUIRED_REFERRALS if row.contest_number is not None else referrals_per_user
+                    if row.referrals_completed != expected:
+                        failures.append(f"user {row.user_id}: {row.referrals_completed} referrals, expected {expected}")
+
+                buckets = {bucket.referrals: bucket for bucket in await get_leaderboard_buckets(db, contest_id)}
+                for referrals in {row.referrals_completed for row in rows} | set(buckets):
+                    group = [row for row in rows if row.referrals_completed == referrals]
+                    bucket = buckets.get(referrals)
+                    participants = bucket.participants if bucket else 0
+                    qualified = bucket.qualified if bucket else 0
+                    if (participants, qualified) != (len(group), len([row for row in group if row.contest_number])):
+                        failures.append(f"leaderboard bucket {referrals}: {participants}/{qualified} != recount")
+
+            for failure in failures:
+                print(f"❌ {failure}")
+            if not failures:
+                print(f"✅ {len(results)} parallel referrals, no lost increments, {len(numbers)} unique numbers")
+            return failures
+        finally:
+            await cleanup(contest_id)
+
+    failures = run_async(check)
+    assert not failures, "; ".join(failures[:5])
+
+def test_broadcast_shared_rate_limit():
+    """Parallel broadcasts must share one send-rate limit"""
+    print("Testing shared broadcast rate limit...")
+    if not database_available():
+        return
+
+    import time
+    from sqlalchemy import select, delete, insert
+    from database import AsyncSessionLocal, init_db
+    from models import User, Contest, ContestParticipant, Broadcast, BroadcastDelivery
+    from broadcast import create_broadcast, launch, broadcast_limiter
+
+    user_ids = [9_700_000_000 + i for i in range(40)]
+    jobs_count = 2
+
+    class FakeBot:
+        """Yuborish vaqtlarini yozib boruvchi bot"""
+
+        def __init__(self):
+            self.sent = []
+
+        async def send_message(self, chat_id, text, parse_mode=None):
+            self.sent.append(time.monotonic())
+
+    async def cleanup(contest_id=None):
+        async with AsyncSessionLocal() as db:
+            if contest_id is not None:
+                audience = f"contest:{contest_id}"
+                await db.execute(delete(BroadcastDelivery).where(
+                    BroadcastDelivery.broadcast_id.in_(select(Broadcast.id).where(Broadcast.audience == audience))
+                ))
+                await db.execute(delete(Broadcast).where(Broadcast.audience == audience))
+                await db.execute(delete(ContestParticipant).where(ContestParticipant.contest_id == contest_id))
+                await db.execute(delete(Contest).where(Contest.id == contest_id))
+            await db.execute(delete(User).where(User.telegram_id.in_(user_ids)))
+            await db.commit()
+
+    async def check():
+        await init_db()
+        await cleanup()
+        async with AsyncSessionLocal() as db:
+            contest = Contest(title="broadcast", end_date=datetime.utcnow() + timedelta(days=1), is_active=False)
+            db.add(contest)
+            await db.flush()
+            contest_id = contest.id
+            await db.execute(insert(User), [
+                {"telegram_id": user_id, "first_name": "stress"} for user_id in user_ids
+            ])
+            await db.execute(insert(ContestParticipant), [
+                {"user_id": user_id, "contest_id": contest_id, "referrals_completed": 0} for user_id in user_ids
+            ])
+            broadcasts = [
+                await create_broadcast(db, "hello", f"contest:{contest_id}") for _ in range(jobs_count)
+            ]
+            await db.commit()
+
+        try:
+            bot = FakeBot()
+            jobs = [launch(broadcast, bot) for broadcast in broadcasts]
+            await asyncio.gather(*(job.task for job in jobs))
+
+            failures = []
+            if len(bot.sent) != jobs_count * len(user_ids):
+                failures.append(f"{len(bot.sent)} messages sent, expected {jobs_count * len(user_ids)}")
+
+            # Token-bucket chegarasi: t vaqtgacha ko'pi bilan capacity + rate * t ta xabar
+            sent = sorted(bot.sent)
+            for index, sent_at in enumerate(sent):
+                allowed = broadcast_limiter.capacity + broadcast_limiter.rate * (sent_at - sent[0]) + 1
+                if index + 1 > allowed:
+                    failures.append(f"{index + 1} messages after {sent_at - sent[0]:.2f} s, limit {allowed:.0f}")
+                    break
+
+            for failure in failures:
+                print(f"❌ {failure}")
+            if not failures:
+                rate = (len(sent) - broadcast_limiter.capacity) / (sent[-1] - sent[0])
+                print(f"✅ {jobs_count} parallel broadcasts, {len(sent)} messages, "
+                      f"{rate:.1f}/s after burst (limit {broadcast_limiter.rate:.0f}/s)")
+            return failures
+        finally:
+            await cleanup(contest_id)
+
+    failures = run_async(check)
+    assert not failures, "; ".join(failures[:5])
+
+def test_contest_announcement():
+    """Finishing a contest must save its winner broadcast in the same transaction"""
+    print("Testing contest winner announcement...")
+    if not database_available():
+        return
+
+    from sqlalchemy import select, delete, insert
+    from database import AsyncSessionLocal, init_db
+    from models import User, Contest, ContestParticipant, Broadcast
+    from broadcast import create_broadcast
+    from utils_contest import finish_contest
+
+    user_ids = [9_600_000_000 + i for i in range(3)]
+
+    async def cleanup(contest_id=None):
+        async with AsyncSessionLocal() as db:
+            if contest_id is not None:
+                await db.execute(delete(Broadcast).where(Broadcast.audience == f"contest:{contest_id}"))
+                await db.execute(delete(ContestParticipant).where(ContestParticipant.contest_id == contest_id))
+                await db.execute(delete(Contest).where(Contest.id == contest_id))
+            await db.execute(delete(User).where(User.telegram_id.in_(user_ids)))
+            await db.commit()
+
+    async def announce(contest_id):
+        async with AsyncSessionLocal() as db:
+            broadcast = await create_broadcast(db, "winners", f"contest:{contest_id}")
+            return broadcast, await finish_contest(db, contest_id, *user_ids)
+
+    async def check():
+        await init_db()
+        await cleanup()
+        async with AsyncSessionLocal() as db:
+            contest = Contest(title="announce", end_date=datetime.utcnow() + timedelta(days=1), is_active=True)
+            db.add(contest)
+            await db.flush()
+            contest_id = contest.id
+            await db.execute(insert(User), [
+                {"telegram_id": user_id, "first_name": "stress"} for user_id in user_ids
+            ])
+            await db.execute(insert(ContestParticipant), [
+                {"user_id": user_id, "contest_id": contest_id, "referrals_completed": 5} for user_id in user_ids
+            ])
+            await db.commit()
+
+        try:
+            first = await announce(contest_id)
+            second = await announce(contest_id)
+
+            failures = []
+            async with AsyncSessionLocal() as db:
+                contest = await db.get(Contest, contest_id)
+                broadcasts = (await db.execute(
+                    select(Broadcast).where(Broadcast.audience == f"contest:{contest_id}")
+                )).scalars().all()
+            if not first[1] or not contest.winners_announced or contest.is_active:
+                failures.append("first announcement did not finish the contest")
+            if second[1]:
+                failures.append("contest finished twice")
+            if [b.id for b in broadcasts] != [first[0].id] or broadcasts[0].total != len(user_ids):
+                failures.append(f"expected one saved broadcast, got {len(broadcasts)}")
+
+            for failure in failures:
+                print(f"❌ {failure}")
+            if not failures:
+                print("✅ contest finished together with its announcement, repeat was rolled back")
+            return failures
+        finally:
+            await cleanup(contest_id)
+
+    failures = run_async(check)
+    assert not failures, "; ".join(failures[:5])
+
+def test_duplicate_payments():
+    """Redelivered successful_payment updates must credit stars only once"""
+    print("Testing idempotent payment ingestion...")
+    if not database_available():
+        return
+
+    from sqlalchemy import select, delete, func, insert
+    from database import AsyncSessionLocal, init_db
+    from models import User, Transaction, Payment
+    from utils_payments import credit_payment
+
+    user_ids = [9_500_000_000 + i for i in range(5)]
+    missing_user_id = 9_500_000_999
+    payments_per_user = 4
+    deliveries = 5
+    stars_amount = 100
+
+    def charge_id(user_id, index):
+        return f"test_charge_{user_id}_{index}"
+
+    async def cleanup():
+        async with AsyncSessionLocal() as db:
+            for model in (Payment, Transaction):
+                await db.execute(delete(model).where(model.user_id.in_(user_ids)))
+            await db.execute(delete(User).where(User.telegram_id.in_(user_ids)))
+            await db.commit()
+
+    async def deliver(user_id, index):
+        async with AsyncSessionLocal() as db:
+            return user_id, await credit_payment(db, user_id, charge_id(user_id, index), stars_amount, stars_amount, "XTR")
+
+    async def check():
+        await init_db()
+        await cleanup()
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(User), [
+                {"telegram_id": user_id, "first_name": "stress"} for user_id in user_ids
+            ])
+            await db.commit()
+
+        try:
+            results = await asyncio.gather(*[
+                deliver(user_id, index)
+                for _ in range(deliveries) for user_id in user_ids for index in range(payments_per_user)
+            ])
+
+            failures = []
+            async with AsyncSessionLocal() as db:
+                for user_id in user_ids:
+                    credited = len([row for uid, row in results if uid == user_id and row is not None])
+                    user = (await db.execute(select(User).where(User.telegram_id == user_id))).scalar_one()
+                    purchases = await db.scalar(
+                        select(func.count(Transaction.id))
+                        .where(Transaction.user_id == user_id, Transaction.transaction_type == "purchase")
+                    )
+                    ledger = await db.scalar(select(func.count()).select_from(Payment).where(Payment.user_id == user_id))
+                    expected_stars = payments_per_user * stars_amount
+                    if (credited, purchases, ledger) != (payments_per_user,) * 3 or user.stars != expected_stars \
+                            or user.total_deposited != expected_stars:
+                        failures.append(f"user {user_id}: {credited} credited, {purchases} purchases, "
+                                        f"{ledger} ledger rows, {user.stars} stars")
+
+            async with AsyncSessionLocal() as db:
+                if await credit_payment(db, missing_user_id, "test_charge_missing", stars_amount) is not None \
+                        or await db.get(Payment, "test_charge_missing") is not None:
+                    failures.append("payment for a missing user was recorded")
+
+            for failure in failures:
+                print(f"❌ {failure}")
+            if not failures:
+                print(f"✅ {len(results)} deliveries, {len(user_ids) * payments_per_user} payments credited once")
+            return failures
+        finally:
+            await cleanup()
+
+    failures = run_async(check)
+    assert not failures, "; ".join(failures[:5])
+
+def main():
+    """Main test function"""
+    print("🚀 Testing BotStars database...\n")
+
+    tests = [
+        test_query_plans,
+        test_concurrent_spins,
+        test_concurrent_contest_numbers,
+        test_contest_leaderboard,
+        test_concurrent_referrals,
+        test_broadcast_shared_rate_limit,
+        test_contest_announcement,
+        test_duplicate_payments,
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        try:
+            test()
+            passed += 1
+        except AssertionError as e:
+            print(f"❌ {e}")
+        print()
+
+    print(f"📊 Test Results: {passed}/{total} tests passed")
+    return 0 if passed == total else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Sharded dispatch must behave like the sequential dispatcher:
+FSM state set by one update is visible to the next update of the same
+user, and handler errors reach dp.errors - both with in-process shards
+and with updates routed to separate shard processes
+"""
+
+import os
+import sys
+import asyncio
+import multiprocessing
+from datetime import datetime
+
+def make_update(bot, update_id, user_id, text):
+    """Oddiy matnli xabar updatesi"""
+    from aiogram.types import Update
+
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "test"},
+            "text": text
+        }
+    }, context={"bot": bot})
+
+def build_dispatcher(shards):
+    """Holat o'rnatuvchi, holatni o'quvchi va xato beruvchi handlerlar"""
+    from aiogram import Router, F
+    from aiogram.fsm.state import State, StatesGroup
+    from sharding import ShardedDispatcher
+
+    class Flow(StatesGroup):
+        waiting = State()
+
+    handled = []
+    errors = []
+    router = Router()
+
+    @router.message(F.text == "start")
+    async def start(message, state):
+        await state.set_state(Flow.waiting)
+        # Keyingi update navbatda kutib turgan paytda ham holat shu yerda o'rnatiladi
+        await asyncio.sleep(0.05)
+        handled.append(("start", message.from_user.id))
+
+    @router.message(Flow.waiting)
+    async def follow_up(message, state):
+        await state.clear()
+        handled.append(("follow_up", message.from_user.id))
+
+    @router.message(F.text == "boom")
+    async def boom(message):
+        raise RuntimeError("boom")
+
+    @router.errors()
+    async def on_error(event):
+        errors.append(type(event.exception).__name__)
+        return True
+
+    dp = ShardedDispatcher(shards)
+    dp.include_router(router)
+    return dp, handled, errors
+
+def test_sharded_dispatch_matches_sequential():
+    print("Testing sharded dispatch...")
+    from aiogram import Bot
+    from sharding import UpdateShards
+
+    async def run(shard_count):
+        bot = Bot(token="42:TEST")
+        shards = UpdateShards(shard_count, 10)
+        dp, handled, errors = build_dispatcher(shards)
+        shards.start()
+        try:
+            update_id = 0
+            for user_id in (1, 2, 3):
+                for text in ("start", "later", "boom"):
+                    update_id += 1
+                    await dp.feed_update(bot, make_update(bot, update_id, user_id, text))
+        finally:
+            await shards.stop()
+            await bot.session.close()
+        return sorted(handled), errors, shards.stats()
+
+    sequential = asyncio.run(run(0))
+    sharded = asyncio.run(run(4))
+
+    assert sharded[0] == sequential[0], (sharded[0], sequential[0])
+    assert sharded[1] == sequential[1] == ["RuntimeError"] * 3, (sharded[1], sequential[1])
+    assert sum(shard["processed"] for shard in sharded[2]["shards"]) == 9, sharded[2]
+    print(f"✅ {len(sharded[0])} handled, {len(sharded[1])} errors routed to dp.errors")
+
+def run_shard_process(queue, results):
+    """Shard jarayoni: navbatdagi updatelarni qayta ishlab natijani qaytarish"""
+    from aiogram import Bot
+    from sharding import UpdateShards, consume_shard_queue
+
+    async def run():
+        bot = Bot(token="42:TEST")
+        dp, handled, errors = build_dispatcher(UpdateShards(0, 10))
+        # Navbat bo'shaguncha qayta ishlab chiqish
+        stop = asyncio.Event()
+        stop.set()
+        try:
+            await consume_shard_queue(dp, bot, queue, stop, poll_interval=0.5)
+        finally:
+            await bot.session.close()
+        return handled, errors
+
+    handled, errors = asyncio.run(run())
+    results.put((os.getpid(), handled, errors))
+
+def test_process_shards_match_sequential():
+    print("Testing shard processes...")
+    from aiogram import Bot
+    from sharding import UpdateShards, ProcessShards
+
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(10) for _ in range(2)]
+    results = context.Queue()
+
+    async def route():
+        """Polling jarayoni tomoni: updatelarni shard jarayonlari navbatlariga yuborish"""
+        bot = Bot(token="42:TEST")
+        shards = ProcessShards()
+        shards.start(queues)
+        dp, handled, _ = build_dispatcher(shards)
+        try:
+            update_id = 0
+            for user_id in (1, 2, 3):
+                for text in ("start", "later", "boom"):
+                    update_id += 1
+                    await dp.feed_update(bot, make_update(bot, update_id, user_id, text))
+        finally:
+            await bot.session.close()
+        assert not handled, "routing process ran handlers"
+        return shards.stats()
+
+    async def sequential():
+        bot = Bot(token="42:TEST")
+        dp, handled, errors = build_dispatcher(UpdateShards(0, 10))
+        try:
+            update_id = 0
+            for user_id in (1, 2, 3):
+                for text in ("start", "later", "boom"):
+                    update_id += 1
+                    await dp.feed_update(bot, make_update(bot, update_id, user_id, text))
+        finally:
+            await bot.session.close()
+        return sorted(handled), errors
+
+    stats = asyncio.run(route())
+    processes = [context.Process(target=run_shard_process, args=(queue, results)) for queue in queues]
+    for process in processes:
+        process.start()
+    outcomes = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join(10)
+
+    expected_handled, expected_errors = asyncio.run(sequential())
+    handled = sorted(item for _, shard_handled, _ in outcomes for item in shard_handled)
+    errors = [error for _, _, shard_errors in outcomes for error in shard_errors]
+
+    assert sum(shard["routed"] for shard in stats["shards"]) == 9, stats
+    assert all(pid != os.getpid() for pid, _, _ in outcomes)
+    assert handled == expected_handled, (handled, expected_handled)
+    assert errors == expected_errors == ["RuntimeError"] * 3, (errors, expected_errors)
+    print(f"✅ {len(handled)} handled across {len(processes)} shard processes, routed {[s['routed'] for s in stats['shards']]}")
+
+def main():
+    """Main test function"""
+    try:
+        test_sharded_dispatch_matches_sequential()
+        test_process_shards_match_sequential()
+    except AssertionError as e:
+        print(f"❌ Sharded dispatch mismatch: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
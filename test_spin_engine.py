@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Batch spin engine must match utils.calculate_spin_result in distribution
+"""
+
+import sys
+import random
+import importlib.util
+from collections import Counter
+
+SPINS = 100_000
+
+# (bet, total_deposit, total_won) - har xil yutish darajalari va chegara holatlari
+SCENARIOS = [
+    (10, 1000, 0),      # oddiy 20%
+    (10, 1000, 390),    # 40% chegarasiga yaqin
+    (10, 1000, 500),    # chegaradan oshgan - 5%
+    (10, 0, 0),         # depozitsiz - har doim 1.1x
+    (1, 200, 20),       # 1 yulduzli spin
+]
+
+def scalar_distribution(bet, deposit, won, seed):
+    """Skalyar yo'l statistikasi"""
+    from utils import calculate_spin_result
+
+    random.seed(seed)
+    wins = 0
+    total_won = 0
+    multipliers = Counter()
+    for _ in range(SPINS):
+        win_amount, result_type, multiplier, symbols = calculate_spin_result(bet, deposit, won)
+        if result_type == "win":
+            wins += 1
+            total_won += win_amount
+            multipliers[multiplier] += 1
+            assert len(set(symbols)) == 1
+        else:
+            assert len(set(symbols)) == 3
+    return wins / SPINS, total_won / SPINS, {m: c / max(wins, 1) for m, c in multipliers.items()}
+
+def batch_distribution(bet, deposit, won, seed):
+    """Vektorlashtirilgan yo'l statistikasi"""
+    import numpy as np
+    from spin_engine import calculate_spin_results_batch
+
+    result = calculate_spin_results_batch(bet, deposit, won, size=SPINS, rng=np.random.default_rng(seed))
+    is_win = result["is_win"]
+    wins = int(is_win.sum())
+
+    symbols = result["symbols"]
+    assert (symbols[is_win] == symbols[is_win][:, :1]).all()
+    assert all(len(set(row)) == 3 for row in symbols[~is_win][:1000].tolist())
+
+    values, counts = np.unique(result["multipliers"][is_win], return_counts=True)
+    multipliers = {round(float(v), 2): c / max(wins, 1) for v, c in zip(values, counts)}
+    return wins / SPINS, result["win_amounts"].sum() / SPINS, multipliers
+
+def test_batch_matches_scalar_distribution():
+    """Win rate, mean payout and multiplier mix agree under fixed seeds"""
+    print("Testing batch spin engine distribution...")
+    if importlib.util.find_spec("numpy") is None:
+        print("⚠️ numpy is not installed - skipping (pip install .[simulation])")
+        return
+
+    for bet, deposit, won in SCENARIOS:
+        scalar_rate, scalar_mean, scalar_mult = scalar_distribution(bet, deposit, won, seed=42)
+        batch_rate, batch_mean, batch_mult = batch_distribution(bet, deposit, won, seed=42)
+
+        assert abs(scalar_rate - batch_rate) < 0.006, (bet, deposit, won, scalar_rate, batch_rate)
+        assert abs(scalar_mean - batch_mean) <= max(0.05 * scalar_mean, 0.01), (bet, deposit, won, scalar_mean, batch_mean)
+        assert set(scalar_mult) == set(batch_mult), (scalar_mult, batch_mult)
+        for multiplier, share in scalar_mult.items():
+            assert abs(share - batch_mult[multiplier]) < 0.03, (multiplier, share, batch_mult[multiplier])
+
+        print(f"✅ bet={bet} deposit={deposit} won={won}: "
+              f"win rate {scalar_rate:.4f} / {batch_rate:.4f}, "
+              f"mean payout {scalar_mean:.3f} / {batch_mean:.3f}")
+
+def main():
+    """Main test function"""
+    try:
+        test_batch_matches_scalar_distribution()
+    except AssertionError as e:
+        print(f"❌ Distribution mismatch: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -82,6 +82,9 @@ def generate_mixed_symbols() -> List[str]:
 
 def format_number(number: int) -> str:
     """Raqamni formatlash"""
+    if -1000 < number < 1000:
+        # Ajratgich kerak emas - oraliq satrlarsiz
+        return str(number)
     return f"{number:,}".replace(",", " ")
 
 def get_spin_emoji(result_type: str) -> str:
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+class TTLCache:
+    """Muddatli (TTL) va LRU bo'yicha chiqarib tashlanadigan xotiradagi kesh"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """Qiymatni olish (yo'q yoki eskirgan bo'lsa None)"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """Qiymatni saqlash, to'lib qolsa eng eski ishlatilganini chiqarish"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Bitta yozuvni o'chirish"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss hisoblagichlari"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+# telegram_id -> users jadvalining qatori (o'zgarmas Row, faqat o'qish uchun)
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+async def get_user_profile(db: AsyncSession, telegram_id: int):
+    """
+    Foydalanuvchi profilini keshdan yoki bazadan olish (menyular uchun)
+    Balansni o'zgartiradigan kod ORM obyektini bazadan o'qishi kerak.
+    """
+    profile = user_cache.get(telegram_id)
+    if profile is None:
+        result = await db.execute(
+            select(User.__table__).where(User.telegram_id == telegram_id)
+        )
+        profile = result.first()
+        if profile is not None:
+            user_cache.set(telegram_id, profile)
+    return profile
+
+def cache_user_profile(profile):
+    """Yozuvdan keyin yangi qatorni keshga yozish (write-through)"""
+    user_cache.set(profile.telegram_id, profile)
+
+def invalidate_user(telegram_id: int):
+    """Foydalanuvchi ma'lumotlari o'zgarganda keshni tozalash"""
+    user_cache.invalidate(telegram_id)
@@ -0,0 +1,319 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func, desc, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, Contest, ContestParticipant, ContestLeaderboard
+from utils_cache import TTLCache
+from config import (
+    CONTEST_NUMBER_START, CONTEST_NUMBER_END, CONTEST_DURATION_DAYS, CONTEST_MAX_NUMBERS,
+    ACTIVE_CONTEST_CACHE_TTL, LEADERBOARD_PAGE_SIZE
+)
+
+# Raqamlar pulini server tomonida bitta INSERT ... SELECT bilan yaratish.
+# Qatorlar aralashtirilgan tartibda yoziladi, shuning uchun id tartibi ham
+# tasodifiy bo'ladi. setseed shu ulanishdagi random() ketma-ketligini
+# belgilaydi - bir xil seed bir xil tartib beradi.
+SEED_NUMBERS_SQL = text("""
+    INSERT INTO contest_numbers (contest_id, number_value)
+    SELECT :contest_id, n
+    FROM generate_series(CAST(:number_start AS INTEGER), CAST(:number_end AS INTEGER)) AS n
+    ORDER BY random()
+""")
+
+CONTEST_SEED_WORK_MEM = "128MB"
+
+# Parallel yaratish so'rovlari ikkita faol konkurs ochmasligi uchun
+CONTEST_CREATE_LOCK_KEY = 724_310_002
+
+# Faol konkurs (contests jadvalining o'zgarmas Row qatori). Konkurs oyiga bir
+# marta o'zgaradi, shuning uchun hot pathlar har safar bazaga so'rov yubormaydi.
+contest_cache = TTLCache(maxsize=1, ttl=ACTIVE_CONTEST_CACHE_TTL)
+ACTIVE_CONTEST_KEY = "active"
+# Faol konkurs yo'qligi ham keshlanadi
+NO_ACTIVE_CONTEST = object()
+
+async def get_active_contest(db: AsyncSession):
+    """
+    Faol konkursni keshdan yoki bazadan olish (faqat o'qish uchun)
+    Konkursni o'zgartiradigan kod ORM obyektini db.get(Contest, id) bilan olishi kerak.
+    """
+    contest = contest_cache.get(ACTIVE_CONTEST_KEY)
+    if contest is None:
+        now = datetime.utcnow()
+        result = await db.execute(
+            select(Contest.__table__).where(
+                Contest.is_active == True,
+                Contest.end_date > now
+            ).limit(1)
+        )
+        contest = result.first()
+        if contest is None:
+            contest_cache.set(ACTIVE_CONTEST_KEY, NO_ACTIVE_CONTEST)
+        else:
+            # Konkurs tugagan zahoti kesh ham eskiradi
+            ttl = min(ACTIVE_CONTEST_CACHE_TTL, (contest.end_date - now).total_seconds())
+            contest_cache.set(ACTIVE_CONTEST_KEY, contest, ttl=ttl)
+    return None if contest is NO_ACTIVE_CONTEST else contest
+
+def invalidate_active_contest():
+    """Konkurs yaratilganda yoki yakunlanganda keshni tozalash"""
+    contest_cache.invalidate(ACTIVE_CONTEST_KEY)
+
+async def finish_contest(db: AsyncSession, contest_id: int, winner_1=None, winner_2=None, winner_3=None) -> bool:
+    """
+    G'oliblarni yozib konkursni yakunlash (faqat hali faol bo'lsa)
+    Chaqiruvchi shu tranzaksiyaga qo'shgan yozuvlar (masalan, e'lon broadcasti)
+    konkurs bilan birga saqlanadi yoki konkurs allaqachon yakunlangan bo'lsa bekor qilinadi
+    """
+    result = await db.execute(
+        update(Contest)
+        .where(Contest.id == contest_id, Contest.is_active == True)
+        .values(
+            winner_1=winner_1,
+            winner_2=winner_2,
+            winner_3=winner_3,
+            winners_announced=True,
+            is_active=False
+        )
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        return False
+    await db.commit()
+    invalidate_active_contest()
+    return True
+
+class ContestError(ValueError):
+    """Konkurs yaratishda noto'g'ri parametrlar"""
+
+def seed_to_float(seed: int) -> float:
+    """Butun seed -> setseed() qabul qiladigan [-1, 1] oralig'idagi qiymat"""
+    return (seed % 2**31) / 2**31
+
+async def seed_contest_numbers(db: AsyncSession, contest_id: int, number_start: int, number_end: int, seed: int) -> int:
+    """Konkurs raqamlarini aralashtirib yozish (commit chaqiruvchida)"""
+    # Million raqamli pulni saralash diskka tushmasligi uchun (faqat shu tranzaksiyada)
+    await db.execute(text(f"SET LOCAL work_mem = '{CONTEST_SEED_WORK_MEM}'"))
+    await db.execute(text("SELECT setseed(:seed)"), {"seed": seed_to_float(seed)})
+    result = await db.execute(SEED_NUMBERS_SQL, {
+        "contest_id": contest_id,
+        "number_start": number_start,
+        "number_end": number_end
+    })
+    return result.rowcount
+
+async def create_contest(
+    db: AsyncSession,
+    title: str,
+    description: str = None,
+    days: int = CONTEST_DURATION_DAYS,
+    number_start: int = CONTEST_NUMBER_START,
+    number_end: int = CONTEST_NUMBER_END,
+    seed: int = None
+) -> dict:
+    """
+    Yangi konkurs va uning raqamlar pulini bitta tranzaksiyada yaratish
+    Returns: {contest_id, title, end_date, number_start, number_end, numbers, seed}
+    """
+    if not title or not title.strip():
+        raise ContestError("Konkurs nomi bo'sh")
+    if days <= 0:
+        raise ContestError("Davomiylik musbat bo'lishi kerak")
+    if number_start < 1 or number_end < number_start:
+        raise ContestError("Raqamlar oralig'i noto'g'ri")
+    if number_end - number_start + 1 > CONTEST_MAX_NUMBERS:
+        raise ContestError(f"Raqamlar soni {CONTEST_MAX_NUMBERS} dan oshmasligi kerak")
+
+    # Bir vaqtda faqat bitta faol konkurs bo'ladi
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CONTEST_CREATE_LOCK_KEY})
+    active = await db.scalar(
+        select(Contest.id).where(
+            Contest.is_active == True,
+            Contest.end_date > datetime.utcnow()
+        ).limit(1)
+    )
+    if active:
+        raise ContestError(f"Faol konkurs allaqachon mavjud (#{active})")
+
+    if seed is None:
+        seed = random.randrange(2**31)
+
+    contest = Contest(
+        title=title.strip(),
+        description=description,
+        start_date=datetime.utcnow(),
+        end_date=datetime.utcnow() + timedelta(days=days),
+        is_active=True
+    )
+    db.add(contest)
+    await db.flush()
+
+    numbers = await seed_contest_numbers(db, contest.id, number_start, number_end, seed)
+    await db.commit()
+    invalidate_active_contest()
+
+    return {
+        "contest_id": contest.id,
+        "title": contest.title,
+        "end_date": contest.end_date,
+        "number_start": number_start,
+        "number_end": number_end,
+        "numbers": numbers,
+        "seed": seed
+    }
+
+# Reyting: contest_leaderboard da har bir referallar soni uchun bitta qator
+# (ishtirokchilar va raqam olganlar soni). Referallar soni kichik (0..5),
+# shuning uchun o'rin va hisoblagichlar bir necha qatorli indeks o'qishi.
+LEADERBOARD_JOIN_SQL = text("""
+    INSERT INTO contest_leaderboard (contest_id, referrals, participants, qualified)
+    VALUES (:contest_id, :referrals, 1, 0)
+    ON CONFLICT (contest_id, referrals)
+    DO UPDATE SET participants = contest_leaderboard.participants + 1
+""")
+
+# UPSERT: oddiy UPDATE boshqa tranzaksiya yaqinda yaratgan qatorni ko'rmasligi mumkin
+LEADERBOARD_LEAVE_SQL = text("""
+    INSERT INTO contest_leaderboard (contest_id, referrals, participants, qualified)
+    VALUES (:contest_id, :referrals, -1, 0)
+    ON CONFLICT (contest_id, referrals)
+    DO UPDATE SET participants = contest_leaderboard.participants - 1
+""")
+
+async def leaderboard_move(db: AsyncSession, contest_id: int, old_referrals, new_referrals: int):
+    """
+    Ishtirokchini reytingda bir guruhdan ikkinchisiga o'tkazish (commit chaqiruvchida)
+    old_referrals=None - yangi ishtirokchi
+    """
+    # Qatorlar doim kattaroq referallar sonidan boshlab bloklanadi (deadlock bo'lmasligi uchun)
+    await db.execute(LEADERBOARD_JOIN_SQL, {"contest_id": contest_id, "referrals": new_referrals})
+    if old_referrals is not None:
+        await db.execute(LEADERBOARD_LEAVE_SQL, {"contest_id": contest_id, "referrals": old_referrals})
+
+async def get_leaderboard_buckets(db: AsyncSession, contest_id: int):
+    """(referallar, ishtirokchilar, raqam olganlar) - referallar kamayish tartibida"""
+    result = await db.execute(
+        select(ContestLeaderboard.referrals, ContestLeaderboard.participants, ContestLeaderboard.qualified)
+        .where(ContestLeaderboard.contest_id == contest_id)
+        .order_by(desc(ContestLeaderboard.referrals))
+    )
+    return result.all()
+
+async def get_contest_counts(db: AsyncSession, contest_id: int) -> dict:
+    """Jami ishtirokchilar va raqam olganlar soni"""
+    buckets = await get_leaderboard_buckets(db, contest_id)
+    return {
+        "participants": sum(bucket.participants for bucket in buckets),
+        "qualified": sum(bucket.qualified for bucket in buckets)
+    }
+
+async def get_contest_rank(db: AsyncSession, contest_id: int, referrals: int) -> int:
+    """Ishtirokchi o'rni: undan ko'p referal to'plaganlar soni + 1"""
+    ahead = await db.scalar(
+        select(func.coalesce(func.sum(ContestLeaderboard.participants), 0)).where(
+            ContestLeaderboard.contest_id == contest_id,
+            ContestLeaderboard.referrals > referrals
+        )
+    )
+    return ahead + 1
+
+def leaderboard_cursor(participant) -> str:
+    """Reyting kursori: "referallar:id" (sahifaning chekka qatoridan)"""
+    return f"{participant.referrals_completed}:{participant.id}"
+
+def parse_leaderboard_cursor(cursor: str):
+    """"referallar:id" -> (referallar, id); noto'g'ri kursor - ValueError"""
+    referrals, participant_id = cursor.split(":")
+    return int(referrals), int(participant_id)
+
+async def get_leaderboard_page(db: AsyncSession, contest_id: int, after=None, before=None,
+                               per_page: int = LEADERBOARD_PAGE_SIZE):
+    """
+    Reytingning bitta sahifasi (keyset, ix_contest_participants_ranking indeksi bo'yicha)
+    after - oldingi sahifa oxirgi qatorining (referallar, id) kursori,
+    before - keyingi sahifa birinchi qatorining kursori; ikkalasi yo'q - birinchi sahifa
+    Returns: ([(o'rin, ishtirokchi, foydalanuvchi), ...], shu yo'nalishda yana qator bormi)
+    """
+    # Har bir referallar soni uchun undan oldingi ishtirokchilar soni
+    ahead = {}
+    total = 0
+    for bucket in await get_leaderboard_buckets(db, contest_id):
+        ahead[bucket.referrals] = total
+        total += bucket.participants
+
+    # Tartib: referallar kamayishi, teng bo'lsa id o'sishi; orqaga yurilganda teskari
+    backward = before is not None
+    cursor = before if backward else after
+
+    def ordering(referrals, ids):
+        return (referrals, desc(ids)) if backward else (desc(referrals), ids)
+
+    page_ids = select(ContestParticipant.id, ContestParticipant.referrals_completed).where(
+        ContestParticipant.contest_id == contest_id
+    )
+    if cursor is None:
+        page_ids = page_ids.order_by(*ordering(ContestParticipant.referrals_completed, ContestParticipant.id))
+    else:
+        # Kursor guruhining qolgan qismi va keyingi guruhlar - ikkita indeks seek,
+        # OFFSET kabi oldingi qatorlarni o'qib tashlash yo'q
+        referrals, participant_id = cursor
+        page_ids = union_all(
+            page_ids.where(
+                ContestParticipant.referrals_completed == referrals,
+                ContestParticipant.id < participant_id if backward else ContestParticipant.id > participant_id
+            ).order_by(desc(ContestParticipant.id) if backward else ContestParticipant.id)
+            .limit(per_page + 1),
+            page_ids.where(
+                ContestParticipant.referrals_completed > referrals if backward
+                else ContestParticipant.referrals_completed < referrals
+            ).order_by(*ordering(ContestParticipant.referrals_completed, ContestParticipant.id))
+            .limit(per_page + 1)
+        )
+    page_ids = page_ids.limit(per_page + 1).subquery()
+
+    result = await db.execute(
+        select(ContestParticipant, User)
+        .join(page_ids, page_ids.c.id == ContestParticipant.id)
+        .join(User, ContestParticipant.user_id == User.telegram_id)
+        .order_by(*ordering(page_ids.c.referrals_completed, page_ids.c.id))
+        .limit(per_page + 1)
+    )
+    rows = result.all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+    return [
+        (ahead.get(participant.referrals_completed, 0) + 1, participant, user)
+        for participant, user in rows
+    ], has_more
+
+async def get_qualified_page(db: AsyncSession, contest_id: int, after: int = None, before: int = None,
+                             per_page: int = LEADERBOARD_PAGE_SIZE):
+    """
+    Raqam olgan ishtirokchilar, raqam tartibida (keyset, ix_contest_participants_number)
+    after/before - qo'shni sahifa chekkasidagi konkurs raqami
+    Returns: ([(ishtirokchi, foydalanuvchi), ...], shu yo'nalishda yana qator bormi)
+    """
+    query = (
+        select(ContestParticipant, User)
+        .join(User, ContestParticipant.user_id == User.telegram_id)
+        .where(
+            ContestParticipant.contest_id == contest_id,
+            ContestParticipant.contest_number.isnot(None)
+        )
+    )
+    if before is not None:
+        query = query.where(ContestParticipant.contest_number < before).order_by(desc(ContestParticipant.contest_number))
+    else:
+        if after is not None:
+            query = query.where(ContestParticipant.contest_number > after)
+        query = query.order_by(ContestParticipant.contest_number)
+
+    rows = (await db.execute(query.limit(per_page + 1))).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+    return rows, has_more
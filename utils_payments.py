@@ -0,0 +1,59 @@
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Payment
+
+# To'lovni jurnalga yozish, tranzaksiyani saqlash va balansni oshirish - bitta
+# so'rovda. Jurnal qatori charge_id birlamchi kaliti bo'yicha ON CONFLICT DO
+# NOTHING bilan qo'shiladi: takroriy (qayta yuborilgan) to'lov hech narsa
+# qaytarmaydi va balans o'zgarmaydi. Bir vaqtda kelgan ikkita nusxadan
+# ikkinchisi birinchisining tranzaksiyasi tugashini kutadi va o'tkazib yuboriladi.
+CREDIT_PAYMENT_SQL = text("""
+    WITH ledger AS (
+        INSERT INTO payments (
+            telegram_payment_charge_id, user_id, stars_amount,
+            total_amount, currency, invoice_payload, created_at
+        )
+        SELECT :charge_id, telegram_id, :stars_amount, :total_amount, :currency, :invoice_payload, :now
+        FROM users
+        WHERE telegram_id = :user_id
+        ON CONFLICT (telegram_payment_charge_id) DO NOTHING
+        RETURNING user_id, stars_amount
+    ),
+    journal AS (
+        INSERT INTO transactions (user_id, transaction_type, amount, description, telegram_payment_id, created_at)
+        SELECT user_id, 'purchase', stars_amount, :description, :charge_id, :now
+        FROM ledger
+    )
+    UPDATE users
+    SET stars = users.stars + ledger.stars_amount,
+        total_deposited = users.total_deposited + ledger.stars_amount
+    FROM ledger
+    WHERE users.telegram_id = ledger.user_id
+    RETURNING users.stars, users.referrer_id
+""")
+
+async def credit_payment(db: AsyncSession, user_id: int, charge_id: str, stars_amount: int,
+                         total_amount: int = None, currency: str = None, invoice_payload: str = None):
+    """
+    To'lovni bir martalik hisobga olish (qayta chaqirish xavfsiz)
+    Returns: (stars, referrer_id) qatori yoki None - to'lov avval hisobga olingan
+    yoki foydalanuvchi topilmagan
+    """
+    row = (await db.execute(CREDIT_PAYMENT_SQL, {
+        "user_id": user_id,
+        "charge_id": charge_id,
+        "stars_amount": stars_amount,
+        "total_amount": total_amount,
+        "currency": currency,
+        "invoice_payload": invoice_payload,
+        "description": f"Yulduz sotib olish: {stars_amount} ⭐",
+        "now": datetime.utcnow()
+    })).first()
+    await db.commit()
+    return row
+
+async def is_payment_recorded(db: AsyncSession, charge_id: str) -> bool:
+    """To'lov jurnalda bormi (birlamchi kalit bo'yicha)"""
+    return await db.get(Payment, charge_id) is not None
@@ -0,0 +1,36 @@
+from datetime import datetime
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User
+
+# Foydalanuvchiga umuman yetib bo'lmasligini bildiruvchi Bad Request xabarlari
+UNREACHABLE_MESSAGES = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+def is_unreachable_error(error: Exception) -> bool:
+    """Xatolik foydalanuvchi botni bloklagani yoki chat yo'qligini bildiradimi"""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        return any(text in str(error).lower() for text in UNREACHABLE_MESSAGES)
+    return False
+
+async def mark_unreachable(db: AsyncSession, user_ids):
+    """Foydalanuvchilarni yetib bo'lmaydigan deb belgilash (commit chaqiruvchida)"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    await db.execute(
+        update(User)
+        .where(User.telegram_id.in_(user_ids), User.is_reachable == True)
+        .values(is_reachable=False, unreachable_at=datetime.utcnow())
+    )
+
+async def mark_reachable(db: AsyncSession, user_id: int):
+    """Foydalanuvchi botni qayta ishga tushirdi (commit chaqiruvchida)"""
+    await db.execute(
+        update(User)
+        .where(User.telegram_id == user_id, User.is_reachable == False)
+        .values(is_reachable=True, unreachable_at=None)
+    )
@@ -0,0 +1,50 @@
+from datetime import datetime
+from sqlalchemy import select, func, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import SpinResult, UserStats
+from write_behind import spin_writer
+
+async def get_user_spin_stats(db: AsyncSession, user_id: int) -> dict:
+    """
+    Foydalanuvchining o'yin statistikasi (hisoblagichlar jadvalidan)
+    Hisoblagichlar har bir spin bilan handlers/game.settle_spin ichida yangilanadi
+    (qator birinchi spin bilan yaratiladi, eski tarix 7-migratsiyada to'ldirilgan).
+    Returns: {total_spins, won_spins, win_rate, biggest_win}
+    """
+    stats = await db.get(UserStats, user_id)
+
+    total_spins = (stats.total_spins or 0) if stats else 0
+    won_spins = (stats.won_spins or 0) if stats else 0
+
+    return {
+        "total_spins": total_spins,
+        "won_spins": won_spins,
+        "win_rate": (won_spins / total_spins * 100) if total_spins > 0 else 0,
+        "biggest_win": (stats.biggest_win or 0) if stats else 0
+    }
+
+async def recount_user_stats(db: AsyncSession, user_id: int):
+    """Hisoblagichni spin tarixidan qayta hisoblash (SQL agregatlari bilan)"""
+    await spin_writer.flush()
+    recount = select(
+        literal(user_id),
+        func.count(SpinResult.id),
+        func.count(SpinResult.id).filter(SpinResult.spin_result == "win"),
+        func.coalesce(func.max(SpinResult.win_amount), 0),
+        literal(datetime.utcnow())
+    ).where(SpinResult.user_id == user_id)
+    statement = insert(UserStats).from_select(
+        ["user_id", "total_spins", "won_spins", "biggest_win", "updated_at"], recount
+    )
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            "total_spins": statement.excluded.total_spins,
+            "won_spins": statement.excluded.won_spins,
+            "biggest_win": statement.excluded.biggest_win,
+            "updated_at": statement.excluded.updated_at
+        }
+    ))
+    await db.commit()
@@ -1,17 +1,80 @@
+import asyncio
 from aiogram import Bot
-from config import REQUIRED_CHANNEL_ID, REQUIRED_CHANNEL
+from aiogram.types import Chat, InlineKeyboardMarkup, InlineKeyboardButton
+from utils_cache import TTLCache
+from config import (
+    REQUIRED_CHANNEL_ID, REQUIRED_CHANNEL, SUBSCRIPTION_CACHE_SIZE,
+    SUBSCRIPTION_CACHE_TTL, SUBSCRIPTION_NEGATIVE_TTL
+)
 
-async def check_subscription(bot: Bot, user_id: int) -> bool:
-    """
-    Foydalanuvchining kanalga obuna bo'lganligini tekshirish
-    """
+SUBSCRIBED_STATUSES = ("member", "administrator", "creator")
+
+# user_id -> obuna holati (True/False). chat_member updatelari bilan yangilanadi
+subscription_cache = TTLCache(maxsize=SUBSCRIPTION_CACHE_SIZE, ttl=SUBSCRIPTION_CACHE_TTL)
+
+# Bir foydalanuvchi uchun bir vaqtdagi tekshiruvlar bitta so'rovni kutadi
+_inflight = {}
+_api_calls = 0
+_coalesced = 0
+
+def cache_subscription(user_id: int, is_subscribed: bool):
+    """Obuna holatini keshlash (obuna bo'lmaganlar qisqaroq muddatga)"""
+    subscription_cache.set(
+        user_id, is_subscribed,
+        ttl=None if is_subscribed else SUBSCRIPTION_NEGATIVE_TTL
+    )
+
+def is_required_channel(chat: Chat) -> bool:
+    """Chat majburiy obuna kanalimi"""
+    channel = str(REQUIRED_CHANNEL_ID)
+    if channel.startswith("@"):
+        return (chat.username or "").lower() == channel[1:].lower()
+    return str(chat.id) == channel
+
+async def fetch_subscription(bot: Bot, user_id: int) -> bool:
+    """Telegram API orqali tekshirish (xatolik keshlanmaydi)"""
+    global _api_calls
+    _api_calls += 1
     try:
         member = await bot.get_chat_member(chat_id=REQUIRED_CHANNEL_ID, user_id=user_id)
-        return member.status in ["member", "administrator", "creator"]
     except Exception as e:
         print(f"Subscription check error: {e}")
         return False
 
+    is_subscribed = member.status in SUBSCRIBED_STATUSES
+    cache_subscription(user_id, is_subscribed)
+    return is_subscribed
+
+async def check_subscription(bot: Bot, user_id: int, force: bool = False) -> bool:
+    """
+    Foydalanuvchining kanalga obuna bo'lganligini tekshirish
+    force=True - keshni chetlab o'tish ("Obunani tekshirish" tugmasi)
+    """
+    global _coalesced
+    if not force:
+        cached = subscription_cache.get(user_id)
+        if cached is not None:
+            return cached
+
+    task = _inflight.get(user_id)
+    if task is not None:
+        _coalesced += 1
+    else:
+        task = asyncio.ensure_future(fetch_subscription(bot, user_id))
+        _inflight[user_id] = task
+        task.add_done_callback(lambda _: _inflight.pop(user_id, None))
+    # shield - bitta kutuvchi bekor qilinsa, boshqalar uchun so'rov davom etadi
+    return await asyncio.shield(task)
+
+def subscription_stats() -> dict:
+    """Obuna keshi va API so'rovlari hisoblagichlari"""
+    return {
+        **subscription_cache.stats(),
+        "api_calls": _api_calls,
+        "coalesced": _coalesced,
+        "inflight": len(_inflight)
+    }
+
 def get_subscription_message() -> str:
     """
     Obuna xabari
@@ -31,16 +94,16 @@ Botdan foydalanish uchun quyidagi kanalga obuna bo'ling:
 💡 <b>Eslatma:</b> Obuna bo'lmasdan botdan foydalana olmaysiz!
     """
 
+# Obuna klaviaturasi o'zgarmas - bir marta yaratiladi
+SUBSCRIPTION_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="📢 Kanalga o'tish", url=f"https://t.me/{REQUIRED_CHANNEL[1:]}")],
+        [InlineKeyboardButton(text="✅ Obunani tekshirish", callback_data="check_subscription")]
+    ]
+)
+
 def get_subscription_keyboard():
     """
     Obuna klaviaturasi
     """
-    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-    
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="📢 Kanalga o'tish", url=f"https://t.me/{REQUIRED_CHANNEL[1:]}")],
-            [InlineKeyboardButton(text="✅ Obunani tekshirish", callback_data="check_subscription")]
-        ]
-    )
-    return keyboard
\ No newline at end of file
+    return SUBSCRIPTION_KEYBOARD
\ No newline at end of file
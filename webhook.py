@@ -0,0 +1,137 @@
+"""
+Webhook rejimi (BOT_MODE=webhook)
+
+Telegram updatelari admin_panel.app dagi WEBHOOK_PATH ga keladi. Endpoint
+faqat secret tokenni tekshiradi va updateni cheklangan navbatga qo'yadi,
+so'ng darhol 200 qaytaradi. Updatelarni fon workerlari dp.feed_update
+orqali qayta ishlaydi. Navbat to'lsa 503 qaytariladi va Telegram
+updateni keyinroq qayta yuboradi.
+"""
+import hmac
+import asyncio
+import logging
+from aiogram import Bot
+from aiogram.types import Update
+from fastapi import FastAPI, Request, Response
+
+from config import WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS
+
+logger = logging.getLogger(__name__)
+
+class UpdateQueue:
+    """Webhook updatelari uchun cheklangan navbat va workerlar"""
+
+    def __init__(self, maxsize: int, workers: int):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.queue = None
+        self.received = 0
+        self.processed = 0
+        self.rejected = 0
+        self.errors = 0
+        self._tasks = []
+
+    def put(self, update: Update) -> bool:
+        """Updateni navbatga qo'yish (navbat to'lsa False)"""
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.received += 1
+        return True
+
+    async def _worker(self, dp, bot: Bot):
+        while True:
+            update = await self.queue.get()
+            try:
+                await dp.feed_update(bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Update {update.update_id} error: {e}")
+            finally:
+                self.queue.task_done()
+
+    def start(self, dp, bot: Bot, workers: int = None):
+        """Workerlarni ishga tushirish"""
+        self.workers = workers or self.workers
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker(dp, bot)) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Navbatdagi updatelarni tugatib, workerlarni to'xtatish"""
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Webhook navbatida {self.queue.qsize()} ta update qayta ishlanmay qoldi")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "queue_size": self.queue.qsize() if self.queue is not None else 0,
+            "queue_maxsize": self.maxsize,
+            "workers": self.workers,
+            "received": self.received,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "errors": self.errors
+        }
+
+update_queue = UpdateQueue(WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS)
+
+def setup_webhook(app: FastAPI):
+    """Webhook endpointini va startup/shutdown hooklarini admin panelga ulash"""
+    from bot import dp, create_bot
+    from database import init_db
+    from write_behind import spin_writer
+    from sharding import update_shards
+
+    @app.post(WEBHOOK_PATH, include_in_schema=False)
+    async def telegram_webhook(request: Request):
+        """Telegram updatelarini qabul qilish"""
+        secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(secret, WEBHOOK_SECRET):
+            return Response(status_code=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": create_bot()})
+        except Exception as e:
+            logger.warning(f"Noto'g'ri update: {e}")
+            return Response(status_code=400)
+
+        if not update_queue.put(update):
+            return Response(status_code=503)
+        return Response(status_code=200)
+
+    @app.get("/webhook_stats")
+    async def webhook_stats():
+        """Webhook navbati holati"""
+        return update_queue.stats()
+
+    @app.on_event("startup")
+    async def start_webhook():
+        bot = create_bot()
+        await init_db()
+        spin_writer.start()
+        update_shards.start()
+        # Shardlar yoqilgan bo'lsa bitta worker updatelarni kelish tartibida shardlarga uzatadi
+        update_queue.start(dp, bot, workers=1 if update_shards.enabled else None)
+        await bot.set_webhook(
+            WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook o'rnatildi: {WEBHOOK_URL.replace(WEBHOOK_PATH, '/webhook/***')}")
+
+    @app.on_event("shutdown")
+    async def stop_webhook():
+        # Webhook o'chirilmaydi - boshqa instansiyalar ishlashda davom etadi
+        await update_queue.stop()
+        await update_shards.stop()
+        await spin_writer.stop()
+        await create_bot().session.close()
@@ -0,0 +1,120 @@
+"""
+Spin tarixi uchun write-behind navbati
+
+Balans o'zgarishi har doim sinxron (handlers/game.settle_spin) bajariladi.
+Yoqilgan bo'lsa, SpinResult va yutuq Transaction qatorlari xotirada
+to'planadi va hajm yoki vaqt chegarasida bitta multi-row INSERT bilan yoziladi.
+"""
+import asyncio
+import logging
+from sqlalchemy import insert
+
+from database import AsyncSessionLocal
+from models import SpinResult, Transaction
+from config import (
+    SPIN_WRITE_BEHIND, WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_MAX_ROWS, WRITE_BEHIND_FLUSH_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindQueue:
+    """SpinResult/Transaction qatorlarini yig'ib, paket holida yozuvchi navbat"""
+
+    def __init__(self, enabled: bool, batch_size: int, max_rows: int, flush_interval: float):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.spins = []
+        self.transactions = []
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.dropped_rows = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._flush_task = None
+
+    def __len__(self):
+        return len(self.spins) + len(self.transactions)
+
+    async def add(self, spin: dict, transaction: dict = None):
+        """Qatorlarni navbatga qo'shish (xatolik ko'tarmaydi - balans allaqachon saqlangan)"""
+        self.spins.append(spin)
+        if transaction:
+            self.transactions.append(transaction)
+
+        if len(self) >= self.max_rows:
+            # Xotira chegarasi - navbat bo'shamaguncha spinni kutish
+            await self.flush()
+        elif len(self) >= self.batch_size and not self._lock.locked():
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Navbatdagi barcha qatorlarni bazaga yozish"""
+        async with self._lock:
+            if not len(self):
+                return
+
+            spins, self.spins = self.spins, []
+            transactions, self.transactions = self.transactions, []
+
+            try:
+                async with AsyncSessionLocal() as db:
+                    if spins:
+                        await db.execute(insert(SpinResult), spins)
+                    if transactions:
+                        await db.execute(insert(Transaction), transactions)
+                    await db.commit()
+                self.flushed_rows += len(spins) + len(transactions)
+                self.flush_count += 1
+            except Exception as e:
+                logger.error(f"Write-behind flush error ({len(spins)} spins): {e}")
+                # Qatorlarni qaytarish, chegaradan oshganini tashlab yuborish
+                self.spins = spins + self.spins
+                self.transactions = transactions + self.transactions
+                overflow = len(self) - self.max_rows
+                if overflow > 0:
+                    dropped_spins = min(overflow, len(self.spins))
+                    del self.spins[:dropped_spins]
+                    del self.transactions[:overflow - dropped_spins]
+                    self.dropped_rows += overflow
+                    logger.error(f"Write-behind buffer full, dropped {overflow} rows")
+
+    async def _run(self):
+        """Vaqt chegarasi bo'yicha davriy yozish"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Fon yozuvchisini ishga tushirish"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """To'xtatish va qolgan qatorlarni yozish (shutdown uchun)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending_rows": len(self),
+            "flushed_rows": self.flushed_rows,
+            "flush_count": self.flush_count,
+            "dropped_rows": self.dropped_rows
+        }
+
+spin_writer = WriteBehindQueue(
+    enabled=SPIN_WRITE_BEHIND,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    max_rows=WRITE_BEHIND_MAX_ROWS,
+    flush_interval=WRITE_BEHIND_FLUSH_INTERVAL
+)